@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Utility comuni per gli archivi locali SQLite (indici, cache)
+=============================================================
+
+Tutti gli archivi stanno in una cartella dati (default ./data, configurabile con
+APP_DATA_DIR) e usano WAL + busy timeout, così più worker gunicorn possono
+leggere e scrivere lo stesso file senza bloccarsi a vicenda.
+"""
+
+import os
+import sqlite3
+
+
+def percorso_dati(nome_file: str, variabile_env: str = None) -> str:
+    """
+    Restituisce il percorso di un file nella cartella dati.
+
+    Args:
+        nome_file (str): Nome del file (es. "rna_cache.sqlite")
+        variabile_env (str): Variabile d'ambiente che, se impostata, sovrascrive il percorso
+    """
+    if variabile_env and os.environ.get(variabile_env):
+        return os.environ[variabile_env]
+    cartella = os.environ.get("APP_DATA_DIR", os.path.join(os.getcwd(), "data"))
+    return os.path.join(cartella, nome_file)
+
+
+def connetti(percorso: str) -> sqlite3.Connection:
+    """Apre (creando la cartella se serve) un database SQLite configurato per accesso concorrente"""
+    cartella = os.path.dirname(percorso)
+    if cartella:
+        os.makedirs(cartella, exist_ok=True)
+    conn = sqlite3.connect(percorso, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Pool di browser Chromium persistenti (Playwright)
+=================================================
+
+Evita di lanciare e chiudere Chromium ad ogni ricerca: un piccolo insieme di
+worker tiene aperti browser e contesti a lunga vita e vi esegue le funzioni
+richieste su una pagina nuova.
+
+Le API sync di Playwright sono legate al thread che le ha create, quindi ogni
+worker è un thread dedicato che possiede il proprio browser; i chiamanti
+(thread Flask, batch, job) inviano il lavoro in coda e attendono il risultato.
+
+Gestione del ciclo di vita:
+- health check prima di ogni uso (browser connesso, pagina apribile)
+- riciclo dopo BROWSER_POOL_MAX_USI usi o BROWSER_POOL_MAX_ETA_SECONDI secondi
+- sostituzione automatica delle istanze crashate
+
+Configurazione via variabili d'ambiente:
+- BROWSER_POOL_DIMENSIONE (default 2): numero massimo di browser/worker
+- BROWSER_POOL_MAX_USI (default 50)
+- BROWSER_POOL_MAX_ETA_SECONDI (default 1800)
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from playwright.sync_api import sync_playwright
+
+
+# Argomenti Chromium per ambienti cloud (Render, Docker)
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu'
+]
+
+
+class _IstanzaBrowser:
+    """Browser + contesto a lunga vita posseduti da un singolo worker"""
+
+    def __init__(self, browser, context):
+        self.browser = browser
+        self.context = context
+        self.usi = 0
+        self.creato_il = time.time()
+
+
+class BrowserPool:
+    """Pool di browser Chromium riutilizzabili con health check e riciclo"""
+
+    def __init__(self, headless: bool = True, slow_mo_ms: int = 0, dimensione: int = None,
+                 max_usi: int = None, max_eta_secondi: int = None, context_options: dict = None,
+                 profilo_risorse: str = None):
+        """
+        Args:
+            headless (bool): Se True, browser in background
+            slow_mo_ms (int): Rallentamento Playwright (debug)
+            dimensione (int): Numero massimo di browser attivi
+            max_usi (int): Usi dopo i quali il browser viene riciclato
+            max_eta_secondi (int): Età massima di un browser prima del riciclo
+            context_options (dict): Opzioni passate a browser.new_context()
+            profilo_risorse (str): Profilo di blocco risorse (playwright_risorse) per i contesti
+        """
+        self.headless = headless
+        self.slow_mo_ms = slow_mo_ms
+        self.dimensione = dimensione or int(os.environ.get("BROWSER_POOL_DIMENSIONE", "2"))
+        self.max_usi = max_usi or int(os.environ.get("BROWSER_POOL_MAX_USI", "50"))
+        self.max_eta_secondi = max_eta_secondi or int(os.environ.get("BROWSER_POOL_MAX_ETA_SECONDI", "1800"))
+        self.context_options = context_options or {}
+        self.profilo_risorse = profilo_risorse
+
+        self._coda = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._liberi = 0
+        self._chiuso = False
+        self.statistiche = {
+            "lanci": 0,
+            "riciclati": 0,
+            "sostituiti_crash": 0,
+            "esecuzioni": 0,
+        }
+
+    def esegui(self, funzione, *args, **kwargs):
+        """
+        Esegue funzione(page, *args, **kwargs) su una pagina nuova di un browser del pool.
+
+        La pagina viene chiusa al termine; browser e contesto restano aperti per le
+        chiamate successive. Le eccezioni sollevate da funzione vengono propagate.
+
+        Returns:
+            Il valore restituito da funzione
+        """
+        if self._chiuso:
+            raise RuntimeError("BrowserPool chiuso")
+
+        futuro = Future()
+        with self._lock:
+            # Avvia un nuovo worker solo se tutti quelli esistenti sono occupati
+            if self._liberi == 0 and len(self._workers) < self.dimensione:
+                self._avvia_worker()
+        self._coda.put((funzione, args, kwargs, futuro))
+        return futuro.result()
+
+    def chiudi(self):
+        """Ferma i worker e chiude tutti i browser del pool"""
+        with self._lock:
+            if self._chiuso:
+                return
+            self._chiuso = True
+            workers = list(self._workers)
+        for _ in workers:
+            self._coda.put(None)
+        for t in workers:
+            t.join(timeout=30)
+
+    def _avvia_worker(self):
+        indice = len(self._workers) + 1
+        t = threading.Thread(target=self._ciclo_worker, name=f"browser-pool-{indice}", daemon=True)
+        self._workers.append(t)
+        t.start()
+
+    def _ciclo_worker(self):
+        playwright = None
+        istanza = None
+        try:
+            playwright = sync_playwright().start()
+            while True:
+                with self._lock:
+                    self._liberi += 1
+                compito = self._coda.get()
+                with self._lock:
+                    self._liberi -= 1
+                if compito is None:
+                    break
+
+                funzione, args, kwargs, futuro = compito
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+
+                # Health check + apertura pagina (un solo rilancio in caso di browser morto)
+                try:
+                    istanza, page = self._apri_pagina(playwright, istanza)
+                except Exception as e:
+                    istanza = self._scarta(istanza)
+                    futuro.set_exception(e)
+                    continue
+
+                try:
+                    futuro.set_result(funzione(page, *args, **kwargs))
+                except BaseException as e:
+                    futuro.set_exception(e)
+                finally:
+                    istanza.usi += 1
+                    self.statistiche["esecuzioni"] += 1
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+                    if not istanza.browser.is_connected():
+                        print("⚠️ Browser del pool crashato durante l'uso, verrà sostituito")
+                        self.statistiche["sostituiti_crash"] += 1
+                        istanza = self._scarta(istanza)
+        except Exception as e:
+            print(f"❌ ERRORE worker BrowserPool: {e}")
+            # Nessun browser disponibile in questo worker: libera il posto nel pool
+            # e fai fallire i compiti in coda invece di lasciarli appesi
+            with self._lock:
+                self._workers = [t for t in self._workers if t is not threading.current_thread()]
+                orfani = self._liberi == 0 and not self._workers
+            if orfani:
+                while True:
+                    try:
+                        compito = self._coda.get_nowait()
+                    except queue.Empty:
+                        break
+                    if compito is not None:
+                        compito[3].set_exception(e)
+        finally:
+            self._scarta(istanza)
+            if playwright:
+                try:
+                    playwright.stop()
+                except Exception:
+                    pass
+
+    def _apri_pagina(self, playwright, istanza):
+        """Restituisce (istanza sana, pagina nuova), lanciando o riciclando il browser se serve"""
+        if istanza is not None:
+            if not istanza.browser.is_connected():
+                print("⚠️ Browser del pool non più connesso, sostituzione...")
+                self.statistiche["sostituiti_crash"] += 1
+                istanza = self._scarta(istanza)
+            elif istanza.usi >= self.max_usi or (time.time() - istanza.creato_il) >= self.max_eta_secondi:
+                print(f"♻️  Riciclo browser del pool dopo {istanza.usi} usi")
+                self.statistiche["riciclati"] += 1
+                istanza = self._scarta(istanza)
+
+        if istanza is None:
+            istanza = self._lancia(playwright)
+
+        try:
+            return istanza, istanza.context.new_page()
+        except Exception as e:
+            print(f"⚠️ Health check fallito ({e}), rilancio browser...")
+            self.statistiche["sostituiti_crash"] += 1
+            self._scarta(istanza)
+            istanza = self._lancia(playwright)
+            return istanza, istanza.context.new_page()
+
+    def _lancia(self, playwright) -> _IstanzaBrowser:
+        # Logging per debug Playwright su Render
+        print(f"🔍 DEBUG Playwright (pool):")
+        print(f"  - PLAYWRIGHT_BROWSERS_PATH: {os.environ.get('PLAYWRIGHT_BROWSERS_PATH', 'NON IMPOSTATO')}")
+        print(f"  - Headless: {self.headless}")
+        try:
+            browser = playwright.chromium.launch(
+                headless=self.headless,
+                slow_mo=self.slow_mo_ms,
+                args=CHROMIUM_ARGS
+            )
+        except Exception as e:
+            print(f"❌ ERRORE lancio browser: {str(e)}")
+            print(f"   Tipo errore: {type(e).__name__}")
+            raise
+        context = browser.new_context(**self.context_options)
+        if self.profilo_risorse:
+            from playwright_risorse import applica_profilo
+            applica_profilo(context, self.profilo_risorse)
+        self.statistiche["lanci"] += 1
+        print(f"✅ Browser Chromium lanciato con successo (pool, lancio #{self.statistiche['lanci']})")
+        return _IstanzaBrowser(browser, context)
+
+    def _scarta(self, istanza):
+        if istanza is not None:
+            try:
+                istanza.browser.close()
+            except Exception:
+                pass
+        return None
+
+
+# Pool condivisi per processo, uno per configurazione (headless, slow_mo, profilo risorse)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(headless: bool = True, slow_mo_ms: int = 0, profilo_risorse: str = None) -> BrowserPool:
+    """Restituisce il pool condiviso per la configurazione richiesta (creato al primo uso)"""
+    chiave = (headless, slow_mo_ms, profilo_risorse)
+    with _pools_lock:
+        pool = _pools.get(chiave)
+        if pool is None or pool._chiuso:
+            pool = BrowserPool(headless=headless, slow_mo_ms=slow_mo_ms, profilo_risorse=profilo_risorse)
+            _pools[chiave] = pool
+        return pool
+
+
+def chiudi_tutti():
+    """Chiude tutti i pool condivisi (registrata con atexit)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.chiudi()
+
+
+atexit.register(chiudi_tutti)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Cache persistenti Cribis: dati finanziari (Company Card) e gruppi societari
+===========================================================================
+
+Conserva su SQLite, con chiave (codice fiscale, anno di bilancio), i dati
+estratti dalla Company Card Completa (_estrai_dati_finanziari_da_dom /
+_estrai_dati_finanziari_da_pagina): personale, fatturato, attivo,
+anno_riferimento, valori_grezzi. I bilanci cambiano al massimo una volta
+l'anno, quindi i calcoli dimensione ripetuti o su gruppi sovrapposti non
+riaprono la Company Card delle società già viste.
+
+Scadenza legata all'esercizio:
+- il bilancio dell'anno N viene depositato nell'estate di N+1 e compare su
+  Cribis entro CRIBIS_CACHE_MESE_BILANCIO (default 10, ottobre) di N+1
+- una voce dell'anno N resta valida finché non è atteso il bilancio N+1
+  (dal mese configurato dell'anno N+2)
+- dopo quella data, o se l'anno non è noto ("N/D") o i dati sono assenti,
+  la voce vale CRIBIS_CACHE_RICONTROLLO_GIORNI (default 30) dal salvataggio
+
+Gruppi societari: il risultato di CribisNuovaRicerca.cerca_associate (associate
+con CF, P.IVA, percentuale e categoria) viene conservato per CF richiesto. Ogni
+report "Gruppo Societario" consuma crediti Cribis e fino a un minuto di
+generazione; una ricerca ripetuta entro CRIBIS_GRUPPI_TTL_GIORNI (default 30)
+risponde subito e senza crediti.
+
+Configurazione via variabili d'ambiente:
+- CRIBIS_CACHE_DB: percorso del file (default data/cribis_cache.sqlite)
+- CRIBIS_CACHE_ABILITATA=0: disattiva entrambe le cache
+- CRIBIS_GRUPPI_TTL_GIORNI: validità di una struttura di gruppo (default 30)
+- force_refresh lato endpoint: ignora la cache e riscrive le voci
+"""
+
+from contextlib import closing
+from datetime import date, datetime
+import json
+import os
+import threading
+import time
+
+from archivio_sqlite import percorso_dati, connetti
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dati_finanziari (
+    cf TEXT NOT NULL,
+    anno TEXT NOT NULL,
+    dati TEXT NOT NULL,
+    salvato_il REAL NOT NULL,
+    PRIMARY KEY (cf, anno)
+);
+CREATE TABLE IF NOT EXISTS gruppi (
+    cf TEXT PRIMARY KEY,
+    risultato TEXT NOT NULL,
+    salvato_il REAL NOT NULL
+);
+"""
+
+# Esiti con dati di bilancio (gli errori non vengono mai salvati)
+STATI_CON_DATI = ("completi", "parziali")
+
+
+def anno_bilancio_atteso(oggi: date, mese_bilancio: int) -> int:
+    """Esercizio più recente il cui bilancio dovrebbe essere già su Cribis"""
+    return oggi.year - 1 if oggi.month >= mese_bilancio else oggi.year - 2
+
+
+def _anno(dati: dict) -> str:
+    anno = str(dati.get("anno_riferimento") or "").strip()
+    return anno if anno.isdigit() else ""
+
+
+class CacheDatiFinanziari:
+    """Cache dei dati finanziari per (CF, anno di bilancio) con scadenza per esercizio"""
+
+    def __init__(self, percorso: str = None, mese_bilancio: int = None, ricontrollo_giorni: float = None):
+        """
+        Args:
+            percorso (str): File SQLite (default data/cribis_cache.sqlite o CRIBIS_CACHE_DB)
+            mese_bilancio (int): Mese dal quale il bilancio dell'anno precedente è su Cribis
+            ricontrollo_giorni (float): Validità delle voci senza anno o con bilancio successivo atteso
+        """
+        self.percorso = percorso or percorso_dati("cribis_cache.sqlite", "CRIBIS_CACHE_DB")
+        self.mese_bilancio = int(mese_bilancio or os.environ.get("CRIBIS_CACHE_MESE_BILANCIO", "10"))
+        giorni = ricontrollo_giorni if ricontrollo_giorni is not None else os.environ.get("CRIBIS_CACHE_RICONTROLLO_GIORNI", "30")
+        self.ricontrollo_secondi = float(giorni) * 86400
+        self._schema_pronto = False
+
+    def _connessione(self):
+        conn = connetti(self.percorso)
+        if not self._schema_pronto:
+            conn.executescript(SCHEMA)
+            self._schema_pronto = True
+        return conn
+
+    def _valida(self, anno: str, dati: dict, salvato_il: float, oggi: date) -> bool:
+        recente = time.time() - salvato_il <= self.ricontrollo_secondi
+        if not anno or dati.get("stato_dati") not in STATI_CON_DATI:
+            return recente
+        # Bilancio successivo non ancora atteso: la voce è quella corrente
+        if int(anno) >= anno_bilancio_atteso(oggi, self.mese_bilancio):
+            return True
+        # Bilancio successivo atteso: vale solo un ricontrollo fatto dopo quella data
+        atteso_dal = datetime(int(anno) + 2, self.mese_bilancio, 1).timestamp()
+        return recente and salvato_il >= atteso_dal
+
+    def leggi(self, cf: str, oggi: date = None) -> dict | None:
+        """Dati dell'anno di bilancio più recente in cache per cf, se ancora validi"""
+        oggi = oggi or date.today()
+        with closing(self._connessione()) as conn:
+            riga = conn.execute(
+                "SELECT anno, dati, salvato_il FROM dati_finanziari WHERE cf = ? ORDER BY anno DESC, salvato_il DESC LIMIT 1",
+                (cf.strip().upper(),)
+            ).fetchone()
+        if riga is None:
+            return None
+        dati = json.loads(riga["dati"])
+        if not self._valida(riga["anno"], dati, riga["salvato_il"], oggi):
+            return None
+        dati["da_cache"] = True
+        dati["cache_salvato_il"] = datetime.fromtimestamp(riga["salvato_il"]).strftime("%d/%m/%Y %H:%M")
+        return dati
+
+    def salva(self, cf: str, dati: dict) -> bool:
+        """Salva i dati estratti; risultati con errore ignorati, anno ignoto salvato come ""."""
+        if not dati or dati.get("errore") or dati.get("stato_dati") == "errore":
+            return False
+        dati = {k: v for k, v in dati.items() if k not in ("da_cache", "cache_salvato_il")}
+        cf = cf.strip().upper()
+        with closing(self._connessione()) as conn, conn:
+            # Un bilancio nuovo sostituisce le voci senza anno dello stesso CF
+            conn.execute("DELETE FROM dati_finanziari WHERE cf = ? AND anno = ''", (cf,))
+            conn.execute(
+                "INSERT OR REPLACE INTO dati_finanziari (cf, anno, dati, salvato_il) VALUES (?, ?, ?, ?)",
+                (cf, _anno(dati), json.dumps(dati, ensure_ascii=False), time.time())
+            )
+        return True
+
+    def invalida(self, cf: str = None) -> int:
+        """
+        Rimuove le voci di un codice fiscale (tutti gli anni) o, senza cf, l'intera cache.
+
+        Returns:
+            int: Numero di voci rimosse
+        """
+        with closing(self._connessione()) as conn, conn:
+            if cf:
+                cursore = conn.execute("DELETE FROM dati_finanziari WHERE cf = ?", (cf.strip().upper(),))
+            else:
+                cursore = conn.execute("DELETE FROM dati_finanziari")
+            return cursore.rowcount
+
+
+class CacheGruppi:
+    """Cache con TTL dei risultati di cerca_associate, per CF/P.IVA richiesto"""
+
+    def __init__(self, percorso: str = None, ttl_giorni: float = None):
+        """
+        Args:
+            percorso (str): File SQLite (default data/cribis_cache.sqlite o CRIBIS_CACHE_DB)
+            ttl_giorni (float): Validità di una struttura di gruppo (default CRIBIS_GRUPPI_TTL_GIORNI o 30)
+        """
+        self.percorso = percorso or percorso_dati("cribis_cache.sqlite", "CRIBIS_CACHE_DB")
+        giorni = ttl_giorni if ttl_giorni is not None else os.environ.get("CRIBIS_GRUPPI_TTL_GIORNI", "30")
+        self.ttl_secondi = float(giorni) * 86400
+        self._schema_pronto = False
+
+    def _connessione(self):
+        conn = connetti(self.percorso)
+        if not self._schema_pronto:
+            conn.executescript(SCHEMA)
+            self._schema_pronto = True
+        return conn
+
+    def leggi(self, cf: str) -> dict | None:
+        """Risultato di cerca_associate in cache per cf se non scaduto, altrimenti None"""
+        with closing(self._connessione()) as conn:
+            riga = conn.execute(
+                "SELECT risultato, salvato_il FROM gruppi WHERE cf = ?", (cf.strip().upper(),)
+            ).fetchone()
+        if riga is None or time.time() - riga["salvato_il"] > self.ttl_secondi:
+            return None
+        risultato = json.loads(riga["risultato"])
+        risultato["da_cache"] = True
+        risultato["cache_salvato_il"] = datetime.fromtimestamp(riga["salvato_il"]).strftime("%d/%m/%Y %H:%M")
+        return risultato
+
+    def salva(self, cf: str, risultato: dict) -> bool:
+        """Salva un risultato senza errori (anche "nessuna collegata", che non cambia spesso)"""
+        if not risultato or risultato.get("errore"):
+            return False
+        risultato = {k: v for k, v in risultato.items() if k not in ("da_cache", "cache_salvato_il")}
+        with closing(self._connessione()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO gruppi (cf, risultato, salvato_il) VALUES (?, ?, ?)",
+                (cf.strip().upper(), json.dumps(risultato, ensure_ascii=False), time.time())
+            )
+        return True
+
+    def invalida(self, cf: str = None) -> int:
+        """Rimuove il gruppo di un CF o, senza cf, tutti. Returns: numero di voci rimosse"""
+        with closing(self._connessione()) as conn, conn:
+            if cf:
+                return conn.execute("DELETE FROM gruppi WHERE cf = ?", (cf.strip().upper(),)).rowcount
+            return conn.execute("DELETE FROM gruppi").rowcount
+
+
+_cache = None
+_cache_gruppi = None
+_cache_lock = threading.Lock()
+
+
+def cache_abilitata() -> bool:
+    return os.environ.get("CRIBIS_CACHE_ABILITATA", "1").lower() not in ("0", "false", "no")
+
+
+def get_cache_finanziari() -> CacheDatiFinanziari | None:
+    """Istanza condivisa della cache, None se disattivata con CRIBIS_CACHE_ABILITATA=0"""
+    global _cache
+    if not cache_abilitata():
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheDatiFinanziari()
+        return _cache
+
+
+def get_cache_gruppi() -> CacheGruppi | None:
+    """Istanza condivisa della cache dei gruppi, None se disattivata con CRIBIS_CACHE_ABILITATA=0"""
+    global _cache_gruppi
+    if not cache_abilitata():
+        return None
+    with _cache_lock:
+        if _cache_gruppi is None:
+            _cache_gruppi = CacheGruppi()
+        return _cache_gruppi
+
+
+def test_cache_finanziari():
+    """Scadenza per esercizio, voci senza anno ed errori su un file temporaneo"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as cartella:
+        cache = CacheDatiFinanziari(os.path.join(cartella, "cache.sqlite"), mese_bilancio=10, ricontrollo_giorni=30)
+        dati = {"cf": "01234567890", "personale": 12, "fatturato": 3e6, "attivo": 2e6,
+                "anno_riferimento": "2024", "stato_dati": "completi"}
+        assert cache.leggi("01234567890") is None
+        assert cache.salva("01234567890", dati)
+        with closing(cache._connessione()) as conn, conn:
+            conn.execute("UPDATE dati_finanziari SET salvato_il = ?", (datetime(2026, 9, 1).timestamp(),))
+        # Bilancio 2024 corrente fino a settembre 2026, poi atteso il 2025
+        assert cache.leggi("01234567890", date(2026, 9, 30))["da_cache"]
+        assert cache.leggi("01234567890", date(2026, 10, 1)) is None
+
+        # Anno ignoto: vale solo il periodo di ricontrollo
+        assert cache.salva("09876543210", dict(dati, anno_riferimento="N/D"))
+        assert cache.leggi("09876543210")["fatturato"] == 3e6
+        cache.ricontrollo_secondi = -1
+        assert cache.leggi("09876543210") is None
+
+        assert not cache.salva("11111111111", {"errore": "timeout", "stato_dati": "errore"})
+        assert cache.invalida("01234567890") == 1
+    print("✅ test_cache_finanziari OK")
+
+
+def test_cache_gruppi():
+    import tempfile
+    with tempfile.TemporaryDirectory() as cartella:
+        cache = CacheGruppi(os.path.join(cartella, "cache.sqlite"), ttl_giorni=1)
+        risultato = {"p_iva_richiesta": "01234567890", "errore": None, "associate_italiane_controllate": [
+            {"cf": "09876543210", "ragione_sociale": "CONTROLLATA SRL", "percentuale_numerica": 100.0, "categoria": "collegata"}]}
+        assert cache.leggi("01234567890") is None
+        assert cache.salva("01234567890", risultato)
+        letto = cache.leggi("01234567890")
+        assert letto["da_cache"] and letto["associate_italiane_controllate"][0]["cf"] == "09876543210"
+        assert not cache.salva("11111111111", {"errore": "Login fallito"})
+        cache.ttl_secondi = -1
+        assert cache.leggi("01234567890") is None
+        assert cache.invalida() == 1
+    print("✅ test_cache_gruppi OK")
+
+
+if __name__ == "__main__":
+    test_cache_finanziari()
+    test_cache_gruppi()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Indice locale dell'archivio Cribis MyDocs
+=========================================
+
+I report già acquistati (Gruppo Societario, Company Card Completa) restano
+consultabili in MyDocs (#Storage/Index). Un crawler in background percorre
+l'archivio e ne registra i documenti in una tabella SQLite: codice fiscale,
+tipo di report, data di generazione e link al documento. I flussi gruppo e
+Company Card consultano l'indice prima di tutto e, se esiste un report
+abbastanza recente, lo aprono direttamente saltando ricerca, modale prodotti e
+generazione (nessun credito consumato).
+
+L'indice cresce anche senza crawler: ogni report generato da
+CribisNuovaRicerca viene registrato con il CF richiesto non appena è aperto.
+
+Configurazione via variabili d'ambiente:
+- CRIBIS_MYDOCS_DB: percorso del file (default data/cribis_mydocs.sqlite)
+- CRIBIS_MYDOCS_ABILITATO=0: indice ignorato (né consultato né aggiornato)
+- CRIBIS_MYDOCS_MAX_ETA_GIORNI: età massima di un report riutilizzabile (default 30)
+- CRIBIS_MYDOCS_CRAWLER=1: avvia il crawler in background nel server web (default spento)
+- CRIBIS_MYDOCS_INTERVALLO_ORE: intervallo del crawler in background (default 24, 0 = disattivato)
+- CRIBIS_MYDOCS_MAX_PAGINE: pagine MyDocs lette per passata (default 20)
+
+Indicizzazione manuale:
+    python cribis_mydocs_index.py            (incrementale)
+    python cribis_mydocs_index.py --completa (tutte le pagine)
+"""
+
+from contextlib import closing
+from datetime import date, datetime, timedelta
+import os
+import sys
+import threading
+import time
+
+from archivio_sqlite import percorso_dati, connetti
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documenti (
+    link TEXT PRIMARY KEY,
+    cf TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    generato_il TEXT NOT NULL,
+    ragione_sociale TEXT,
+    indicizzato_il REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documenti_cf_tipo ON documenti (cf, tipo, generato_il);
+CREATE TABLE IF NOT EXISTS meta (
+    chiave TEXT PRIMARY KEY,
+    valore TEXT NOT NULL
+);
+"""
+
+TIPO_GRUPPO = "Gruppo Societario"
+TIPO_COMPANY_CARD = "Company Card Completa"
+# Dal più specifico: "Company Card Completa" prima di altri report "Company Card"
+TIPI_REPORT = (TIPO_COMPANY_CARD, TIPO_GRUPPO)
+
+# Righe dell'elenco MyDocs: per ogni link a un documento risale al contenitore
+# della riga ("RICHIESTO IL gg/mm/aaaa") e ne legge tipo, data, codice e nome
+JS_DOCUMENTI_MYDOCS = """
+(tipi) => {
+  const documenti = [];
+  const visti = new Set();
+  const reCodice = /\\b(\\d{11}|[A-Z]{6}\\d{2}[A-Z]\\d{2}[A-Z]\\d{3}[A-Z])\\b/;
+  const reData = /RICHIESTO IL\\s*(\\d{2}\\/\\d{2}\\/\\d{4})/i;
+  for (const link of document.querySelectorAll('a[href]')) {
+    const href = link.href || '';
+    if (!href || href.endsWith('#') || href.startsWith('javascript')) continue;
+    let riga = link;
+    for (let i = 0; i < 6 && riga && !reData.test(riga.innerText || ''); i++) riga = riga.parentElement;
+    if (!riga || !reData.test(riga.innerText || '')) continue;
+    const testo = riga.innerText;
+    const tipo = tipi.find(t => testo.includes(t));
+    if (!tipo) continue;
+    // Nella riga vale il link al documento, non quelli di servizio (condividi, salva...)
+    const principale = riga.querySelector('a[href*="Storage/Document"]') || link;
+    if (principale !== link || visti.has(href)) continue;
+    visti.add(href);
+    const codice = testo.match(reCodice);
+    documenti.push({
+      link: href,
+      tipo: tipo,
+      data: testo.match(reData)[1],
+      cf: codice ? codice[1] : '',
+      ragione_sociale: (link.innerText || '').trim().slice(0, 200)
+    });
+  }
+  return documenti;
+}
+"""
+
+SELETTORI_PAGINA_SUCCESSIVA = [
+    '.pagination li.next:not(.disabled) a',
+    'a[aria-label="Next"]',
+    'a:has-text("Successiva")',
+    'button:has-text("Carica altri")',
+]
+
+
+def indice_abilitato() -> bool:
+    return os.environ.get("CRIBIS_MYDOCS_ABILITATO", "1").lower() not in ("0", "false", "no")
+
+
+def _data_iso(testo: str) -> str:
+    try:
+        return datetime.strptime(testo.strip(), "%d/%m/%Y").date().isoformat()
+    except (ValueError, AttributeError):
+        return date.today().isoformat()
+
+
+class IndiceMyDocs:
+    """Tabella locale dei documenti MyDocs per CF e tipo di report"""
+
+    def __init__(self, percorso: str = None):
+        self.percorso = percorso or percorso_dati("cribis_mydocs.sqlite", "CRIBIS_MYDOCS_DB")
+        self._schema_pronto = False
+
+    def _connessione(self):
+        conn = connetti(self.percorso)
+        if not self._schema_pronto:
+            conn.executescript(SCHEMA)
+            self._schema_pronto = True
+        return conn
+
+    def aggiorna(self, documenti: list[dict]) -> int:
+        """
+        Inserisce o aggiorna documenti {link, cf, tipo, data (gg/mm/aaaa), ragione_sociale}.
+        Le righe senza codice fiscale non sono ricercabili e vengono ignorate.
+
+        Returns:
+            int: Numero di documenti nuovi
+        """
+        adesso = time.time()
+        nuovi = 0
+        with closing(self._connessione()) as conn, conn:
+            for doc in documenti:
+                cf = (doc.get("cf") or "").strip().upper()
+                if not cf or not doc.get("link"):
+                    continue
+                esiste = conn.execute("SELECT 1 FROM documenti WHERE link = ?", (doc["link"],)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO documenti (link, cf, tipo, generato_il, ragione_sociale, indicizzato_il) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc["link"], cf, doc["tipo"], _data_iso(doc.get("data")), doc.get("ragione_sociale"), adesso)
+                )
+                nuovi += esiste is None
+        return nuovi
+
+    def registra(self, cf: str, tipo: str, link: str, ragione_sociale: str = None):
+        """Registra un report appena generato (data di oggi)"""
+        self.aggiorna([{"cf": cf, "tipo": tipo, "link": link, "data": date.today().strftime("%d/%m/%Y"),
+                        "ragione_sociale": ragione_sociale}])
+
+    def cerca(self, cf: str, tipo: str, max_eta_giorni: float = None) -> dict | None:
+        """Documento più recente di quel tipo per cf, se generato entro max_eta_giorni"""
+        if max_eta_giorni is None:
+            max_eta_giorni = float(os.environ.get("CRIBIS_MYDOCS_MAX_ETA_GIORNI", "30"))
+        limite = (date.today() - timedelta(days=max_eta_giorni)).isoformat()
+        with closing(self._connessione()) as conn:
+            riga = conn.execute(
+                "SELECT link, cf, tipo, generato_il, ragione_sociale FROM documenti "
+                "WHERE cf = ? AND tipo = ? AND generato_il >= ? ORDER BY generato_il DESC, indicizzato_il DESC LIMIT 1",
+                (cf.strip().upper(), tipo, limite)
+            ).fetchone()
+        return dict(riga) if riga else None
+
+    def rimuovi(self, link: str):
+        """Elimina un documento non più apribile (scaduto o rimosso da MyDocs)"""
+        with closing(self._connessione()) as conn, conn:
+            conn.execute("DELETE FROM documenti WHERE link = ?", (link,))
+
+    def conteggio(self) -> int:
+        with closing(self._connessione()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM documenti").fetchone()[0]
+
+    def ultima_indicizzazione(self) -> float | None:
+        """Timestamp dell'ultima passata del crawler"""
+        with closing(self._connessione()) as conn:
+            riga = conn.execute("SELECT valore FROM meta WHERE chiave = 'ultima_indicizzazione'").fetchone()
+        return float(riga["valore"]) if riga else None
+
+    def segna_indicizzazione(self):
+        with closing(self._connessione()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO meta (chiave, valore) VALUES ('ultima_indicizzazione', ?)",
+                         (str(time.time()),))
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def get_indice() -> IndiceMyDocs | None:
+    """Istanza condivisa dell'indice, None se disattivato con CRIBIS_MYDOCS_ABILITATO=0"""
+    global _indice
+    if not indice_abilitato():
+        return None
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceMyDocs()
+        return _indice
+
+
+def documento_recente(tipo: str, *codici: str) -> dict | None:
+    """Report recente di quel tipo per il primo dei codici (CF, P.IVA) presente nell'indice"""
+    indice = get_indice()
+    if indice is None:
+        return None
+    for codice in dict.fromkeys(c for c in codici if c):
+        try:
+            documento = indice.cerca(codice, tipo)
+        except Exception as e:
+            print(f"⚠️ Lettura indice MyDocs fallita: {e}")
+            return None
+        if documento:
+            return documento
+    return None
+
+
+def registra_documento(cf: str, tipo: str, link: str, ragione_sociale: str = None):
+    """Registra nell'indice un report appena generato; errori solo loggati"""
+    indice = get_indice()
+    if indice is None or not cf or "/Storage/Document/" not in (link or ""):
+        return
+    try:
+        indice.registra(cf, tipo, link, ragione_sociale)
+    except Exception as e:
+        print(f"⚠️ Registrazione documento MyDocs fallita: {e}")
+
+
+def indicizza_se_libero(lock=None, **kwargs) -> dict:
+    """
+    Passata del crawler solo se il lock dei calcoli Cribis è libero (acquisizione
+    non bloccante): mai due sessioni Playwright insieme nello stesso processo.
+    """
+    if lock is not None and not lock.acquire(blocking=False):
+        print("⏳ Indicizzazione MyDocs saltata: calcolo Cribis in corso")
+        return {"errore": "Calcolo Cribis in corso"}
+    try:
+        return indicizza_mydocs(**kwargs)
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def indicizza_mydocs(cribis=None, completa: bool = False, max_pagine: int = None, headless: bool = True) -> dict:
+    """
+    Percorre l'elenco MyDocs e aggiorna l'indice.
+
+    Args:
+        cribis (CribisNuovaRicerca): Sessione già aperta (default: ne apre una, con lo stato salvato)
+        completa (bool): Legge tutte le pagine; altrimenti si ferma alla prima pagina già indicizzata
+        max_pagine (int): Limite di pagine (default CRIBIS_MYDOCS_MAX_PAGINE o 20)
+
+    Returns:
+        dict: {"pagine", "documenti", "nuovi"} oppure {"errore"}
+    """
+    indice = get_indice()
+    if indice is None:
+        return {"errore": "Indice MyDocs disattivato"}
+    if cribis is None:
+        from cribis_nuova_ricerca import CribisNuovaRicerca
+        with CribisNuovaRicerca(headless=headless) as sessione:
+            if not sessione.login():
+                return {"errore": "Login Cribis fallito"}
+            return indicizza_mydocs(sessione, completa, max_pagine)
+
+    max_pagine = max_pagine or int(os.environ.get("CRIBIS_MYDOCS_MAX_PAGINE", "20"))
+    statistiche = {"pagine": 0, "documenti": 0, "nuovi": 0}
+    inizio = time.time()
+    print("📁 Indicizzazione MyDocs...")
+    try:
+        cribis.page.goto(f"{cribis.base_url}/#Storage/Index", wait_until="domcontentloaded")
+        cribis.attese.selettore("mydocs_indice", "text=MyDocs", massimo_ms=15000)
+        cribis.attese.dom_stabile("mydocs_indice_render", quiete_ms=500, massimo_ms=5000)
+
+        while statistiche["pagine"] < max_pagine:
+            documenti = cribis.page.evaluate(JS_DOCUMENTI_MYDOCS, list(TIPI_REPORT))
+            nuovi = indice.aggiorna(documenti)
+            statistiche["pagine"] += 1
+            statistiche["documenti"] += len(documenti)
+            statistiche["nuovi"] += nuovi
+            # Archivio dal più recente: una pagina senza novità chiude la passata incrementale
+            if not documenti or (not completa and nuovi == 0):
+                break
+
+            successiva = None
+            for selettore in SELETTORI_PAGINA_SUCCESSIVA:
+                locator = cribis.page.locator(selettore).first
+                try:
+                    if locator.count() and locator.is_visible():
+                        successiva = locator
+                        break
+                except Exception:
+                    continue
+            if successiva is None:
+                break
+            successiva.click()
+            cribis.attese.dom_stabile("mydocs_indice_pagina", quiete_ms=500, massimo_ms=5000)
+    except Exception as e:
+        print(f"⚠️ Indicizzazione MyDocs interrotta: {e}")
+        statistiche["errore"] = str(e)
+
+    if "errore" not in statistiche:
+        indice.segna_indicizzazione()
+    print(f"✅ MyDocs: {statistiche['documenti']} documenti letti, {statistiche['nuovi']} nuovi "
+          f"in {statistiche['pagine']} pagine ({time.time() - inizio:.1f}s)")
+    return statistiche
+
+
+class IndicizzatoreMyDocs(threading.Thread):
+    """Thread che ripete l'indicizzazione MyDocs ogni CRIBIS_MYDOCS_INTERVALLO_ORE"""
+
+    def __init__(self, intervallo_ore: float = None, lock=None, headless: bool = True):
+        """
+        Args:
+            lock (threading.Lock): Lock dei calcoli Cribis; se occupato la passata viene rimandata
+        """
+        super().__init__(name="cribis-mydocs", daemon=True)
+        self.intervallo = float(intervallo_ore or os.environ.get("CRIBIS_MYDOCS_INTERVALLO_ORE", "24")) * 3600
+        self.lock = lock
+        self.headless = headless
+        self._fermato = threading.Event()
+
+    def _attesa(self) -> float:
+        # L'ultima passata è su disco: un riavvio non rifà subito l'indicizzazione
+        ultima = get_indice().ultima_indicizzazione() if get_indice() else None
+        return max(60.0, (ultima or 0) + self.intervallo - time.time())
+
+    def run(self):
+        while not self._fermato.wait(self._attesa()):
+            try:
+                esito = indicizza_se_libero(self.lock, headless=self.headless)
+                if esito.get("errore"):
+                    # Cribis occupato o passata fallita: si riprova più tardi, non a fine intervallo
+                    self._fermato.wait(600)
+            except Exception as e:
+                print(f"⚠️ Indicizzazione MyDocs fallita: {e}")
+
+    def ferma(self):
+        self._fermato.set()
+
+
+_indicizzatore = None
+_indicizzatore_lock = threading.Lock()
+
+
+def crawler_abilitato() -> bool:
+    """Crawler in background solo su richiesta esplicita (CRIBIS_MYDOCS_CRAWLER=1)"""
+    return (indice_abilitato()
+            and os.environ.get("CRIBIS_MYDOCS_CRAWLER", "0").lower() in ("1", "true", "si", "yes")
+            and float(os.environ.get("CRIBIS_MYDOCS_INTERVALLO_ORE", "24")) > 0)
+
+
+def avvia_indicizzazione_periodica(lock=None, headless: bool = True) -> IndicizzatoreMyDocs | None:
+    """Avvia (una volta per processo) il crawler MyDocs; None se non abilitato"""
+    global _indicizzatore
+    if not crawler_abilitato():
+        return None
+    with _indicizzatore_lock:
+        if _indicizzatore is None or not _indicizzatore.is_alive():
+            _indicizzatore = IndicizzatoreMyDocs(lock=lock, headless=headless)
+            _indicizzatore.start()
+        return _indicizzatore
+
+
+def test_indice():
+    """Aggiornamento, ricerca per età e tipo, rimozione su un file temporaneo"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as cartella:
+        indice = IndiceMyDocs(os.path.join(cartella, "mydocs.sqlite"))
+        oggi = date.today()
+        vecchio = (oggi - timedelta(days=90)).strftime("%d/%m/%Y")
+        documenti = [
+            {"link": "https://www2.cribisx.com/#Storage/Document/1", "cf": "01234567890", "tipo": TIPO_GRUPPO,
+             "data": vecchio, "ragione_sociale": "ALFA SPA"},
+            {"link": "https://www2.cribisx.com/#Storage/Document/2", "cf": "01234567890", "tipo": TIPO_COMPANY_CARD,
+             "data": oggi.strftime("%d/%m/%Y"), "ragione_sociale": "ALFA SPA"},
+            {"link": "https://www2.cribisx.com/#Storage/Document/3", "cf": "", "tipo": TIPO_GRUPPO, "data": vecchio},
+        ]
+        assert indice.aggiorna(documenti) == 2
+        assert indice.aggiorna(documenti) == 0
+        assert indice.cerca("01234567890", TIPO_COMPANY_CARD, 30)["link"].endswith("/2")
+        # Gruppo troppo vecchio per 30 giorni, valido con 120
+        assert indice.cerca("01234567890", TIPO_GRUPPO, 30) is None
+        assert indice.cerca("01234567890", TIPO_GRUPPO, 120)["ragione_sociale"] == "ALFA SPA"
+
+        indice.registra("01234567890", TIPO_GRUPPO, "https://www2.cribisx.com/#Storage/Document/4")
+        assert indice.cerca("01234567890", TIPO_GRUPPO, 30)["link"].endswith("/4")
+        indice.rimuovi("https://www2.cribisx.com/#Storage/Document/4")
+        assert indice.cerca("01234567890", TIPO_GRUPPO, 30) is None
+        assert indice.conteggio() == 2
+    print("✅ test_indice OK")
+
+
+if __name__ == "__main__":
+    if "--test" in sys.argv:
+        test_indice()
+        sys.exit(0)
+    esito = indicizza_mydocs(completa="--completa" in sys.argv, headless="--visibile" not in sys.argv)
+    if esito.get("errore"):
+        print(f"❌ {esito['errore']}")
+        sys.exit(1)
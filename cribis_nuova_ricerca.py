@@ -15,9 +15,10 @@ Procedura:
 9. Estrai associate italiane >50%
 
 Differenza con cribis_playwright_base.py:
-- NON va in MyDocs/Storage (archivio)
-- Genera NUOVO report (consuma crediti)
-- Dati sempre aggiornati
+- NON cerca nell'archivio MyDocs/Storage: riapre solo i report recenti
+  presenti nell'indice locale (cribis_mydocs_index), altrimenti
+  genera un NUOVO report (consuma crediti)
+- Dati aggiornati (età massima CRIBIS_MYDOCS_MAX_ETA_GIORNI)
 - Prende SEMPRE il primo risultato della ricerca
 """
 
@@ -26,6 +27,24 @@ import re
 import time
 import os
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from playwright_attese import AttesePagina
+from playwright_risorse import applica_profilo
+from cribis_sessione import (
+    avvia_keepalive,
+    cancella_stato,
+    carica_stato,
+    fine_uso,
+    inizio_uso,
+    salva_stato,
+    sessione_da_rinnovare,
+)
+from cribis_mydocs_index import (
+    TIPO_COMPANY_CARD,
+    TIPO_GRUPPO,
+    documento_recente,
+    get_indice,
+    registra_documento,
+)
 
 # Import sistema alert email
 try:
@@ -36,24 +55,52 @@ except ImportError:
     print("⚠️ Modulo email_alert non disponibile - alert disabilitati")
 
 
+# Report pronto: almeno 4 indicatori di completamento e nessun indicatore di caricamento
+JS_REPORT_GENERATO = """
+([completamento, caricamento]) => {
+  const html = document.documentElement.outerHTML;
+  const minuscolo = html.toLowerCase();
+  if (caricamento.some(ind => minuscolo.includes(ind.toLowerCase()))) return false;
+  return completamento.filter(ind => html.includes(ind)).length >= 4;
+}
+"""
+
+
 class CribisNuovaRicerca:
     """Connector Cribis X per ricerche real-time (non archivio)"""
     
-    def __init__(self, headless=False):
+    def __init__(self, headless=False, solo_sessione_salvata=False):
         """
         Inizializza il connector Playwright
         
         Args:
             headless (bool): Se True, browser in background
+            solo_sessione_salvata (bool): Usa solo lo stato salvato (worker paralleli):
+                mai login completo né cancellazione dello stato condiviso
         """
         self.base_url = "https://www2.cribisx.com"
         # Credenziali Cribis: priorità a variabili d'ambiente, poi fallback
         self.username = os.environ.get('CRIBIS_USERNAME', 'CC838673')
         self.password = os.environ.get('CRIBIS_PASSWORD', '30_12_2025__Pigreco_')
         self.headless = headless
+        self.solo_sessione_salvata = solo_sessione_salvata
         self.playwright = None
         self.browser = None
+        self.context = None
         self.page = None
+        # True se il contesto è stato creato dallo storage_state salvato (cribis_sessione)
+        self.sessione_ripristinata = False
+        self.autenticato = False
+        # Istante dell'ultimo login completo (età della sessione se lo stato non è persistito)
+        self.login_il = None
+        # Attese a condizione con tempi misurati (sostituiscono le pause fisse)
+        self._attese = AttesePagina()
+    
+    @property
+    def attese(self) -> AttesePagina:
+        """Attese sulla pagina corrente (self.page cambia quando Cribis apre nuove tab)"""
+        self._attese.page = self.page
+        return self._attese
     
     def _screenshot(self, path: str, descrizione: str = ""):
         """
@@ -101,16 +148,71 @@ class CribisNuovaRicerca:
             print(f"   Tipo errore: {type(e).__name__}")
             raise
             
-        self.page = self.browser.new_page()
+        # Contesto con blocco di immagini, font, media e tracker (playwright_risorse),
+        # ripristinando cookie e localStorage dell'ultimo login se ancora validi
+        inizio_uso()
+        stato = None
+        if not self.solo_sessione_salvata and sessione_da_rinnovare(self.username, self.password):
+            # Sessione salvata prossima alla scadenza: login completo subito, non a metà job
+            print("🔄 Sessione Cribis salvata in scadenza, re-login proattivo")
+            cancella_stato()
+        else:
+            stato = carica_stato(self.username, self.password)
+        self.sessione_ripristinata = stato is not None
+        self.context = self.browser.new_context(storage_state=stato) if stato else self.browser.new_context()
+        applica_profilo(self.context, "cribis")
+        self.page = self.context.new_page()
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
+        # Cookie eventualmente rinnovati da Cribis durante la sessione (lo stato lo scrive solo il browser principale)
+        if self.autenticato and self.context and not self.solo_sessione_salvata:
+            salva_stato(self.context, self.username, self.password)
+        if self.playwright:
+            fine_uso()
         if self.browser:
             self.browser.close()
         if self.playwright:
             self.playwright.stop()
     
+    def _sessione_in_scadenza(self) -> bool:
+        """True se la sessione è vicina a CRIBIS_SESSIONE_DURATA_MIN (stato salvato o login in memoria)"""
+        if sessione_da_rinnovare(self.username, self.password):
+            return True
+        if self.login_il is None:
+            return False
+        durata = float(os.environ.get("CRIBIS_SESSIONE_DURATA_MIN", "240")) * 60
+        margine = float(os.environ.get("CRIBIS_SESSIONE_MARGINE_MIN", "20")) * 60
+        return time.time() - self.login_il >= durata - margine
+    
+    def rinnova_sessione_se_in_scadenza(self) -> bool:
+        """
+        Re-login proattivo tra un job e l'altro, prima che Cribis faccia scadere la sessione.
+        Da chiamare solo a inizio job, mai durante l'estrazione di una società.
+        
+        Returns:
+            bool: False solo se il re-login era necessario ed è fallito
+        """
+        if not self.autenticato or not self._sessione_in_scadenza():
+            return True
+        print("🔄 Sessione Cribis prossima alla scadenza, re-login proattivo tra i job...")
+        self.sessione_ripristinata = False
+        self.autenticato = False
+        # Con la sessione ancora attiva la Home non mostra il form di login:
+        # cookie e storage vanno azzerati prima del login completo
+        cancella_stato()
+        try:
+            self.context.clear_cookies()
+            self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
+            self.page.evaluate("() => { localStorage.clear(); sessionStorage.clear(); }")
+        except Exception as e:
+            print(f"⚠️  Pulizia sessione prima del re-login non riuscita: {e}")
+        riuscito = self.login()
+        # Anche se fallisce non si riprova a ogni società: il retry su SESSION_EXPIRED resta la difesa
+        self.login_il = time.time()
+        return riuscito
+    
     def _check_and_handle_session_expired(self):
         """
         Verifica se la sessione è scaduta e, in caso, esegue re-login.
@@ -139,7 +241,9 @@ class CribisNuovaRicerca:
             print(f"⚠️  Non sono sulla Home (URL: {current_url}), navigo...")
             try:
                 self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
-                time.sleep(2)
+                self.attese.uno_tra("home_campo_ricerca_o_login", [
+                    'input[title="Inserisci i termini da cercare"]', 'input[name="Username"]'
+                ], massimo_ms=5000)
                 # Ricontrolla URL dopo navigazione
                 if "sessionExpired" in self.page.url or "LogOn" in self.page.url:
                     print("⚠️  Redirect a sessione scaduta, eseguo re-login...")
@@ -163,6 +267,51 @@ class CribisNuovaRicerca:
         
         return True
     
+    def _sessione_valida(self, timeout_ms: int = 15000) -> bool:
+        """
+        Controllo rapido della sessione: apre la Home e attende il primo tra
+        campo di ricerca (autenticato) e form di login (sessione scaduta).
+        """
+        try:
+            self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
+            self.page.wait_for_selector(
+                'input[title="Inserisci i termini da cercare"], input[name="Username"], input[type="password"]',
+                timeout=timeout_ms
+            )
+            if "sessionExpired" in self.page.url or "LogOn" in self.page.url:
+                return False
+            return self.page.query_selector('input[title="Inserisci i termini da cercare"]') is not None
+        except Exception:
+            return False
+    
+    def _apri_documento_mydocs(self, documento: dict) -> bool:
+        """
+        Apre direttamente un report già acquistato (indice MyDocs), senza
+        ricerca, modale prodotti e generazione. Se Cribis non lo rende più
+        disponibile il link viene tolto dall'indice.
+        
+        Returns:
+            bool: True se il documento è aperto in self.page
+        """
+        link = documento["link"]
+        print(f"📁 Report '{documento['tipo']}' del {documento['generato_il']} già in MyDocs, lo riapro")
+        try:
+            self.page.goto(link, wait_until="domcontentloaded")
+            self.attese.rete_quieta("mydocs_documento", massimo_ms=15000)
+            self.attese.dom_stabile("mydocs_documento_render", quiete_ms=500, massimo_ms=5000)
+            url = self.page.url
+            if "/Storage/Document/" in url and "DocumentUnavailable" not in url and "LogOn" not in url:
+                return True
+            print(f"⚠️ Documento MyDocs non disponibile ({url}), genero un nuovo report")
+        except Exception as e:
+            print(f"⚠️ Apertura documento MyDocs fallita: {e}")
+            return False
+        try:
+            get_indice().rimuovi(link)
+        except Exception:
+            pass
+        return False
+    
     def login(self):
         """
         Esegue login su Cribis X
@@ -171,14 +320,31 @@ class CribisNuovaRicerca:
             bool: True se login riuscito
         """
         try:
+            # Sessione ripristinata da storage_state: un solo controllo invece del form di login
+            if self.sessione_ripristinata:
+                self.sessione_ripristinata = False
+                if self._sessione_valida():
+                    print("♻️  Sessione Cribis ripristinata da stato salvato, login saltato")
+                    self.autenticato = True
+                    avvia_keepalive(self.username, self.password)
+                    return True
+                if self.solo_sessione_salvata:
+                    print("⚠️  Stato sessione Cribis non valido, nessun login in questo browser")
+                    return False
+                print("⚠️  Stato sessione Cribis non più valido, login completo...")
+                cancella_stato()
+            elif self.solo_sessione_salvata:
+                print("⚠️  Nessuno stato sessione Cribis da riusare, nessun login in questo browser")
+                return False
+            
             print("🔐 Avvio login su Cribis X...")
             
             # Vai alla homepage
             self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
             print(f"📍 Navigazione a: {self.base_url}")
             
-            # Aspetta che la pagina sia caricata
-            time.sleep(3)
+            # Aspetta il form di login (i selettori sotto riprovano comunque ciascuno per 3s)
+            self.attese.selettore("login_form", 'input[type="password"]', massimo_ms=8000)
             
             # Salva screenshot iniziale (solo se headless=False)
             self._screenshot("debug_cribis_nuova_01_login_page.png", "Login page")
@@ -259,9 +425,10 @@ class CribisNuovaRicerca:
             print("🚀 Clic su login...")
             login_button.click()
             
-            # Aspetta redirect e caricamento
-            self.page.wait_for_load_state("networkidle")
-            time.sleep(5)  # Aumentato timeout per Render
+            # Aspetta redirect e caricamento (Render può essere lento: limite ampio)
+            url_login = self.page.url
+            self.attese.url_diverso("login_redirect", url_login, massimo_ms=10000)
+            self.attese.rete_quieta("login_rete", massimo_ms=10000)
             
             current_url = self.page.url
             print(f"📍 URL dopo login: {current_url}")
@@ -306,7 +473,7 @@ class CribisNuovaRicerca:
                 print("⚠️  Login non verificato, eseguo un retry rapido...")
                 try:
                     self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
-                    time.sleep(2)
+                    self.attese.selettore("login_retry_form", 'input[type="password"]', massimo_ms=5000)
                 except Exception:
                     pass
                 # Prova a trovare di nuovo i campi
@@ -317,8 +484,8 @@ class CribisNuovaRicerca:
                         u.fill(self.username)
                         p.fill(self.password)
                         self.page.click('button[type="submit"], input[type="submit"], button:has-text("Login"), button:has-text("Accedi")')
-                        self.page.wait_for_load_state("networkidle")
-                        time.sleep(5)
+                        self.attese.url_diverso("login_retry_redirect", url_login, massimo_ms=10000)
+                        self.attese.rete_quieta("login_retry_rete", massimo_ms=10000)
                         current_url = self.page.url
                         if "LogOn" not in current_url:
                             login_riuscito = True
@@ -332,6 +499,10 @@ class CribisNuovaRicerca:
                 return False
             
             print("✅ Login completato con successo!")
+            self.autenticato = True
+            self.login_il = time.time()
+            salva_stato(self.context, self.username, self.password, nuovo_login=True)
+            avvia_keepalive(self.username, self.password)
             return True
                 
         except Exception as e:
@@ -355,7 +526,7 @@ class CribisNuovaRicerca:
             try:
                 self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
                 self.page.wait_for_load_state("networkidle")
-                time.sleep(1)
+                self.attese.selettore("ricerca_home", 'input[title="Inserisci i termini da cercare"]', massimo_ms=3000)
             except Exception:
                 pass
             
@@ -443,8 +614,8 @@ class CribisNuovaRicerca:
             campo_ricerca.fill("")
             campo_ricerca.type(partita_iva, delay=50)
             
-            # Aspetta un attimo per autocomplete
-            time.sleep(1)
+            # Aspetta che l'autocomplete smetta di aggiornarsi
+            self.attese.dom_stabile("ricerca_autocomplete", quiete_ms=300, massimo_ms=2000)
             
             # Salva screenshot prima di premere invio
             self._screenshot("debug_cribis_nuova_03_piva_inserita.png", "P.IVA inserita")
@@ -455,7 +626,7 @@ class CribisNuovaRicerca:
             
             # Aspetta caricamento risultati
             self.page.wait_for_load_state("networkidle")
-            time.sleep(3)
+            self.attese.selettore("ricerca_risultati", 'div[class*="result"] a, a[href*="Company"]', massimo_ms=5000)
             
             # Salva screenshot risultati
             self._screenshot("debug_cribis_nuova_04_risultati_cerca.png", "Risultati ricerca")
@@ -478,7 +649,7 @@ class CribisNuovaRicerca:
             print("\n🎯 Clic sul NOME dell'azienda del primo risultato...")
             
             # Aspetta che i risultati siano visibili
-            time.sleep(2)
+            self.attese.dom_stabile("risultati_stabili", quiete_ms=400, massimo_ms=3000)
             
             # Selettori per il nome dell'azienda (primo risultato)
             # Basato sullo screenshot: è un link con classe specifica
@@ -529,7 +700,7 @@ class CribisNuovaRicerca:
             
             # Scroll al nome se necessario
             nome_link.scroll_into_view_if_needed()
-            time.sleep(1)
+            url_risultati = self.page.url
             
             # Salva screenshot prima del click
             self.page.screenshot(path="debug_cribis_nuova_05_primo_risultato.png")
@@ -546,7 +717,6 @@ class CribisNuovaRicerca:
                 try:
                     # Scroll e click forzato
                     nome_link.scroll_into_view_if_needed()
-                    time.sleep(0.5)
                     nome_link.click(force=True, timeout=15000)
                 except Exception as force_err:
                     print(f"⚠️ Click force fallito: {force_err}. Provo via JS...")
@@ -565,9 +735,10 @@ class CribisNuovaRicerca:
                         print(f"➡️  Navigo direttamente su: {href}")
                         self.page.goto(href, wait_until='domcontentloaded')
             
-            # Attendi caricamento pagina dettaglio
+            # Attendi caricamento pagina dettaglio (navigazione SPA: cambia l'hash dell'URL)
+            self.attese.url_diverso("dettaglio_url", url_risultati, massimo_ms=5000)
             self.page.wait_for_load_state("domcontentloaded")
-            time.sleep(3)
+            self.attese.dom_stabile("dettaglio_render", quiete_ms=500, massimo_ms=5000)
             
             # Salva screenshot dopo click
             self.page.screenshot(path="debug_cribis_nuova_06_dopo_nome.png")
@@ -591,12 +762,12 @@ class CribisNuovaRicerca:
             print("\n📦 Cercando 'Tutti i prodotti CRIBIS X' nella pagina dettaglio...")
             
             # Aspetta che la pagina sia caricata
-            time.sleep(2)
+            self.attese.dom_stabile("dettaglio_pronto", quiete_ms=400, massimo_ms=3000)
             
             # SCROLL IN FONDO ALLA PAGINA (il link è in basso a destra)
             print("📜 Scrolling verso il basso...")
             self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            time.sleep(1)
+            self.attese.dom_stabile("dettaglio_scroll", quiete_ms=250, massimo_ms=1500)
             
             # Selettori per il link "Tutti i prodotti CRIBIS X"
             selettori_tutti_prodotti = [
@@ -635,7 +806,6 @@ class CribisNuovaRicerca:
             
             # Scroll al link per assicurarsi che sia visibile
             link_prodotti.scroll_into_view_if_needed()
-            time.sleep(1)
             
             # Salva screenshot prima del click
             self.page.screenshot(path="debug_cribis_nuova_07_prima_tutti_prodotti.png")
@@ -646,7 +816,7 @@ class CribisNuovaRicerca:
             link_prodotti.click()
             
             # Aspetta che la MODALE sia visibile
-            time.sleep(3)
+            self.attese.selettore("modale_prodotti", '.modal-dialog, .modal-content', massimo_ms=5000)
             
             # Salva screenshot dopo click (modale aperta)
             self.page.screenshot(path="debug_cribis_nuova_08_modale_prodotti.png")
@@ -669,8 +839,9 @@ class CribisNuovaRicerca:
         try:
             print("\n🏢 Cercando 'Gruppo Societario' nella modale...")
             
-            # Aspetta che la modale sia completamente caricata
-            time.sleep(2)
+            # Aspetta che la modale sia completamente caricata (elenco prodotti renderizzato)
+            self.attese.selettore("modale_gruppo_societario", 'text=Gruppo Societario', massimo_ms=5000)
+            self.attese.dom_stabile("modale_render", quiete_ms=300, massimo_ms=2000)
             
             # SCROLL DENTRO LA MODALE per vedere "Gruppo Societario" (è in fondo)
             print("📜 Scrolling dentro la modale verso il BASSO...")
@@ -681,17 +852,17 @@ class CribisNuovaRicerca:
                     # Scroll progressivo per raggiungere "Gruppo Societario"
                     # Prima a metà
                     modale.evaluate("element => element.scrollTop = element.scrollHeight / 2")
-                    time.sleep(0.5)
+                    self.attese.dom_stabile("modale_scroll", quiete_ms=200, massimo_ms=1000)
                     print("  📍 Scroll a 50%...")
                     
                     # Poi a 75%
                     modale.evaluate("element => element.scrollTop = element.scrollHeight * 0.75")
-                    time.sleep(0.5)
+                    self.attese.dom_stabile("modale_scroll", quiete_ms=200, massimo_ms=1000)
                     print("  📍 Scroll a 75%...")
                     
                     # Infine fino in fondo
                     modale.evaluate("element => element.scrollTop = element.scrollHeight")
-                    time.sleep(1)
+                    self.attese.dom_stabile("modale_scroll", quiete_ms=200, massimo_ms=1000)
                     print("✅ Scroll completato (in fondo alla modale)")
             except Exception as e:
                 print(f"⚠️ Scroll modale fallito: {str(e)}, continuo comunque...")
@@ -760,7 +931,6 @@ class CribisNuovaRicerca:
                     
                     # Scroll al bottone per assicurarsi che sia visibile
                     bottone_richiedi.scroll_into_view_if_needed()
-                    time.sleep(1)
                     
                     # Click su "Richiedi" e cattura nuova tab con expect_page
                     print("🖱️ Clic su bottone 'Richiedi' e attesa nuova tab (fino a 3 minuti)...")
@@ -790,7 +960,6 @@ class CribisNuovaRicerca:
                         
                         # Aspetta che la nuova tab sia caricata
                         self.page.wait_for_load_state("domcontentloaded")
-                        time.sleep(2)
                         
                         print(f"📍 URL nuova tab: {self.page.url}")
                         
@@ -819,19 +988,18 @@ class CribisNuovaRicerca:
                                 # Metodo 2: ESC
                                 self.page.keyboard.press("Escape")
                                 print("✅ Modale chiusa con ESC")
-                            time.sleep(2)
                         except Exception as e:
                             print(f"⚠️ Errore chiusura modale: {str(e)}")
                         
                         # Verifica che la modale sia chiusa
-                        time.sleep(1)
+                        self.attese.selettore("modale_chiusa", '.modal-dialog', massimo_ms=3000, stato="hidden")
                         modale_visibile = self.page.locator('.modal:visible').count()
                         print(f"📋 Modali visibili: {modale_visibile}")
                         
                         # Naviga a MyDocs/Storage dove dovrebbe apparire il report
                         print("📍 Navigazione a MyDocs...")
                         self.page.goto(f"{self.base_url}/#Storage/Index", wait_until="domcontentloaded")
-                        time.sleep(3)
+                        self.attese.url("mydocs_url", "**Storage**", massimo_ms=3000)
                         
                         # Verifica che siamo in MyDocs
                         url_attuale = self.page.url
@@ -840,11 +1008,12 @@ class CribisNuovaRicerca:
                         if "Storage" not in url_attuale:
                             print("⚠️ Non siamo in Storage, riprovo...")
                             self.page.evaluate("window.location.hash = '#Storage/Index'")
-                            time.sleep(3)
+                            self.attese.url("mydocs_url", "**Storage**", massimo_ms=3000)
                         
                         # Aspetta che la lista documenti sia caricata
                         print("⏳ Aspetto caricamento lista documenti...")
-                        time.sleep(3)
+                        self.attese.selettore("mydocs_lista", 'text=RICHIESTO IL', massimo_ms=5000)
+                        self.attese.dom_stabile("mydocs_render", quiete_ms=500, massimo_ms=3000)
                         
                         # Cerca il report appena generato (primo in lista)
                         print("🔍 Cerco report Gruppo Societario appena generato...")
@@ -892,7 +1061,7 @@ class CribisNuovaRicerca:
                                                     
                                                     # Aspetta caricamento
                                                     self.page.wait_for_load_state("domcontentloaded")
-                                                    time.sleep(5)
+                                                    self.attese.dom_stabile("mydocs_documento", quiete_ms=500, massimo_ms=5000)
                                                     
                                                     print("✅ Documento aperto")
                                                     documento_trovato = True
@@ -953,7 +1122,7 @@ class CribisNuovaRicerca:
                                     print("🖱️ Clic con JavaScript...")
                                     self.page.evaluate("(element) => element.click()", btn)
                                     
-                                    time.sleep(3)
+                                    self.attese.rete_quieta("richiedi_fallback", massimo_ms=3000)
                                     self.page.screenshot(path="debug_cribis_nuova_10_dopo_richiedi.png")
                                     
                                     print("✅ Richiesta Gruppo Societario avviata")
@@ -986,7 +1155,6 @@ class CribisNuovaRicerca:
             print(f"⏳ Attesa generazione report (max {timeout} secondi)...")
             
             start_time = time.time()
-            last_progress = 0
             
             # Indicatori che il report è completo (più specifici)
             indicatori_completamento = [
@@ -1007,52 +1175,27 @@ class CribisNuovaRicerca:
                 'Attendere'
             ]
             
-            while time.time() - start_time < timeout:
-                elapsed = int(time.time() - start_time)
+            # Un solo wait_for_function (polling ogni 500ms nel browser) invece di
+            # page.content() + sleep(2) ripetuti da Python
+            pronto = self.attese.funzione(
+                "report_gruppo_generato", JS_REPORT_GENERATO,
+                arg=[indicatori_completamento, indicatori_loading],
+                massimo_ms=int(timeout * 1000), polling=500
+            )
+            if pronto:
+                print(f"✅ Report pronto in {time.time() - start_time:.1f}s")
                 
-                # Progress indicator ogni 10 secondi
-                if elapsed >= last_progress + 10:
-                    print(f"   ⏳ {elapsed}/{timeout} secondi trascorsi...")
-                    last_progress = elapsed
+                # Rendering completo: DOM fermo invece di 3 secondi fissi
+                self.attese.dom_stabile("report_gruppo_render", quiete_ms=500, massimo_ms=3000)
                 
+                # Salva screenshot finale
                 try:
-                    # Controlla se ci sono ancora indicatori di loading
-                    page_content = self.page.content()
-                    has_loading = any(ind.lower() in page_content.lower() for ind in indicatori_loading)
-                    
-                    if has_loading:
-                        print(f"   🔄 Rilevato caricamento in corso...")
-                        time.sleep(2)
-                        continue
-                
-                    # Conta quanti indicatori di completamento sono presenti
-                    indicatori_trovati = sum(1 for ind in indicatori_completamento if ind in page_content)
-                    
-                    # Report pronto se abbiamo almeno 4 indicatori su 6
-                    if indicatori_trovati >= 4:
-                        print(f"✅ Report pronto! Trovati {indicatori_trovati}/{len(indicatori_completamento)} indicatori")
-                        
-                        # Aspetta extra per rendering completo
-                        time.sleep(3)
-                        
-                        # Salva screenshot finale
-                        try:
-                            self.page.screenshot(path="debug_cribis_nuova_11_report_generato.png")
-                            print("📸 Screenshot: debug_cribis_nuova_11_report_generato.png")
-                        except:
-                            pass
-                        
-                        return True
-                    
-                    # Se abbiamo almeno 2 indicatori, siamo sulla strada giusta
-                    if indicatori_trovati >= 2:
-                        print(f"   📊 Parzialmente caricato ({indicatori_trovati}/{len(indicatori_completamento)} indicatori)")
-                    
-                except Exception as e:
-                    print(f"   ⚠️  Errore verifica completamento: {e}")
+                    self.page.screenshot(path="debug_cribis_nuova_11_report_generato.png")
+                    print("📸 Screenshot: debug_cribis_nuova_11_report_generato.png")
+                except:
+                    pass
                 
-                # Attendi 2 secondi prima del prossimo controllo
-                time.sleep(2)
+                return True
             
             # Timeout raggiunto senza completamento
             elapsed_total = int(time.time() - start_time)
@@ -1244,6 +1387,18 @@ class CribisNuovaRicerca:
             else:
                 print("✅ Già loggato, skip login")
             
+            # Report Gruppo Societario recente già acquistato: niente nuova generazione
+            documento = documento_recente(TIPO_GRUPPO, partita_iva)
+            if documento and self._apri_documento_mydocs(documento):
+                self.aspetta_generazione_report(timeout=30)
+                associate = self.estrai_associate_italiane()
+                if associate:
+                    risultato["associate_italiane_controllate"] = associate
+                    risultato["fonte"] = "mydocs"
+                    print(f"✅ Ricerca completata da MyDocs: {len(associate)} associate trovate")
+                    return risultato
+                print("⚠️ Nessuna associata nel report MyDocs, genero un nuovo report")
+            
             # 2. Cerca nel campo principale
             if not self.cerca_nel_campo_principale(partita_iva):
                 risultato["errore"] = "Ricerca nel campo principale fallita"
@@ -1301,6 +1456,8 @@ class CribisNuovaRicerca:
                 risultato["errore"] = "Richiesta Gruppo Societario fallita"
                 return risultato
             
+            registra_documento(partita_iva, TIPO_GRUPPO, self.page.url)
+            
             # 6. Estrai associate (il report è già caricato nella nuova tab)
             associate = self.estrai_associate_italiane()
             risultato["associate_italiane_controllate"] = associate
@@ -1343,50 +1500,56 @@ class CribisNuovaRicerca:
         Returns:
             dict: Dati finanziari estratti (personale, fatturato, attivo)
         """
-        # Retry logic per gestire session expired
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
-                return self._scarica_company_card_completa_internal(codice_fiscale, partita_iva)
-            except Exception as e:
-                error_msg = str(e)
-                if "SESSION_EXPIRED:" in error_msg:
-                    if attempt < max_retries - 1:
-                        print(f"\n{'='*70}")
-                        print(f"🔄 TENTATIVO {attempt + 2}/{max_retries}: Sessione scaduta, eseguo re-login...")
-                        print(f"{'='*70}\n")
-                        # Re-login
-                        try:
-                            self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
-                            time.sleep(2)
-                            if "LogOn" in self.page.url or "sessionExpired" in self.page.url:
-                                if not self.login():
-                                    print("❌ Re-login fallito!")
-                                    raise Exception("Re-login fallito dopo session expired")
-                                print("✅ Re-login completato con successo!")
-                            else:
-                                print("✅ Sessione già valida dopo navigazione a Home")
-                        except Exception as login_err:
-                            print(f"❌ Errore durante re-login: {login_err}")
-                            if attempt < max_retries - 1:
-                                print("⏳ Attendo 5 secondi prima di riprovare...")
-                                time.sleep(5)
-                                continue
-                            else:
-                                raise
-                        # Attendi un po' prima di riprovare
-                        print("⏳ Attendo 3 secondi prima di riprovare l'operazione...")
-                        time.sleep(3)
-                        continue
+        # Tempi delle attese di questa società (riepilogo stampato a fine estrazione)
+        self.attese.azzera()
+        try:
+            # Retry logic per gestire session expired
+            max_retries = 2
+            for attempt in range(max_retries):
+                try:
+                    return self._scarica_company_card_completa_internal(codice_fiscale, partita_iva)
+                except Exception as e:
+                    error_msg = str(e)
+                    if "SESSION_EXPIRED:" in error_msg:
+                        if attempt < max_retries - 1:
+                            print(f"\n{'='*70}")
+                            print(f"🔄 TENTATIVO {attempt + 2}/{max_retries}: Sessione scaduta, eseguo re-login...")
+                            print(f"{'='*70}\n")
+                            # Re-login
+                            try:
+                                self.page.goto(f"{self.base_url}/#Home/Index", wait_until="domcontentloaded")
+                                self.attese.uno_tra("retry_home_o_login", [
+                                    'input[title="Inserisci i termini da cercare"]', 'input[name="Username"]'
+                                ], massimo_ms=5000)
+                                if "LogOn" in self.page.url or "sessionExpired" in self.page.url:
+                                    if not self.login():
+                                        print("❌ Re-login fallito!")
+                                        raise Exception("Re-login fallito dopo session expired")
+                                    print("✅ Re-login completato con successo!")
+                                else:
+                                    print("✅ Sessione già valida dopo navigazione a Home")
+                            except Exception as login_err:
+                                print(f"❌ Errore durante re-login: {login_err}")
+                                if attempt < max_retries - 1:
+                                    print("⏳ Attendo la fine delle richieste in corso prima di riprovare...")
+                                    self.attese.rete_quieta("retry_attesa_errore", massimo_ms=5000)
+                                    continue
+                                else:
+                                    raise
+                            # Riprova quando la Home è pronta
+                            self.attese.selettore("retry_home_pronta", 'input[title="Inserisci i termini da cercare"]', massimo_ms=3000)
+                            continue
+                        else:
+                            print(f"❌ Tutti i tentativi ({max_retries}) falliti a causa di session expired")
+                            raise
                     else:
-                        print(f"❌ Tutti i tentativi ({max_retries}) falliti a causa di session expired")
+                        # Per altri errori, propaga subito
                         raise
-                else:
-                    # Per altri errori, propaga subito
-                    raise
         
-        # Se arriviamo qui senza risultato, errore generico
-        raise Exception("Operazione fallita dopo tutti i tentativi")
+            # Se arriviamo qui senza risultato, errore generico
+            raise Exception("Operazione fallita dopo tutti i tentativi")
+        finally:
+            print(self.attese.riepilogo())
     
     def _scarica_company_card_completa_internal(self, codice_fiscale: str, partita_iva: str = None) -> dict:
         """
@@ -1425,19 +1588,25 @@ class CribisNuovaRicerca:
             
             if "Home" not in self.page.url:
                 self.page.goto(f"{self.base_url}/#Home/Index", wait_until="networkidle")
-                self.page.wait_for_timeout(2000)
+                self.attese.selettore("card_home", 'input[title="Inserisci i termini da cercare"]', massimo_ms=2000)
             
             print("   ✅ Sulla pagina principale\n")
             
+            # Company Card Completa recente già acquistata: si apre da MyDocs senza generarla
+            documento = documento_recente(TIPO_COMPANY_CARD, codice_fiscale, partita_iva)
+            if documento and self._apri_documento_mydocs(documento):
+                return self._estrai_dati_card_aperta(codice_fiscale)
+            
             # STEP 1: Ricerca codice (P.IVA o CF)
             print(f"🔍 STEP 1: Ricerca {tipo_codice}...")
             campo_ricerca = self.page.locator('input[title="Inserisci i termini da cercare"]')
             campo_ricerca.fill(codice_ricerca)
             self.page.keyboard.press("Enter")
             
-            # Attendi caricamento risultati (aumentato da 2s a 5s)
-            print("   ⏳ Attendo caricamento risultati (5s)...")
-            self.page.wait_for_timeout(5000)
+            # Attendi caricamento risultati: primo risultato o pagina ferma (nessun risultato)
+            print("   ⏳ Attendo caricamento risultati...")
+            if not self.attese.selettore("card_risultati", 'div[class*="result"] a', massimo_ms=5000):
+                self.attese.dom_stabile("card_risultati_vuoti", quiete_ms=500, massimo_ms=2000)
             
             # STEP 2: Click sul nome azienda (primo risultato)
             print("🎯 STEP 2: Click su nome azienda...")
@@ -1492,8 +1661,10 @@ class CribisNuovaRicerca:
             
             nome_text = nome_azienda.inner_text()
             print(f"✅ Trovata: {nome_text}")
+            url_risultati = self.page.url
             nome_azienda.click()
-            self.page.wait_for_timeout(3000)
+            self.attese.url_diverso("card_dettaglio_url", url_risultati, massimo_ms=3000)
+            self.attese.dom_stabile("card_dettaglio_render", quiete_ms=400, massimo_ms=3000)
             
             # STEP 3: Apri Company Card Completa (Richiedi)
             print("📄 STEP 3: Apro Company Card Completa (Richiedi)...")
@@ -1504,9 +1675,9 @@ class CribisNuovaRicerca:
             else:
                 print("   ✅ Modale 'Tutti i prodotti' aperta")
                 
-                # Attendi caricamento modale
-                print("   ⏳ Attendo caricamento modale (3 sec)...")
-                time.sleep(3)
+                # Attendi caricamento modale (card prodotti renderizzate)
+                print("   ⏳ Attendo caricamento modale...")
+                self.attese.selettore("card_modale_richiedi", '.modal button:has-text("Richiedi"), .modal a:has-text("Richiedi")', massimo_ms=3000)
                 self.page.wait_for_load_state("domcontentloaded")
                 
                 # Screenshot di debug
@@ -1666,7 +1837,7 @@ class CribisNuovaRicerca:
                             if link_altri_basic_count > 0:
                                 print("   📂 Trovato link 'Altri Basic Data', lo clicco per espandere...")
                                 link_altri_basic.click()
-                                time.sleep(2)  # Attendi espansione
+                                self.attese.dom_stabile("card_espansione_basic_data", quiete_ms=300, massimo_ms=2000)
                                 print("   ✅ Sezione espansa")
                         except Exception as e:
                             print(f"   ⚠️  Link 'Altri Basic Data' non trovato o già espanso: {e}")
@@ -1675,7 +1846,7 @@ class CribisNuovaRicerca:
                         try:
                             print("   📜 Scrolling modale verso il basso...")
                             modale.evaluate("element => element.scrollTop = element.scrollHeight")
-                            time.sleep(1)
+                            self.attese.dom_stabile("card_modale_scroll", quiete_ms=200, massimo_ms=1000)
                         except Exception as e:
                             print(f"   ⚠️  Errore scroll modale: {e}")
                         
@@ -1894,7 +2065,7 @@ class CribisNuovaRicerca:
                                     # Se non si apre nuova tab, verifica se l'URL nella stessa tab è cambiato
                                     print(f"   ⚠️  Nessuna nuova tab rilevata entro 30s, verifico se URL cambiato nella stessa tab...")
                                     self.page.wait_for_load_state("domcontentloaded")
-                                    time.sleep(2)  # Attendi eventuale redirect
+                                    self.attese.url_diverso("card_redirect_stessa_tab", url_prima_click, massimo_ms=2000)  # Attendi eventuale redirect
                                     url_dopo_click = self.page.url
                                 
                                 print(f"   📍 URL dopo click: {url_dopo_click}")
@@ -1978,7 +2149,7 @@ class CribisNuovaRicerca:
                                                     # Se non si apre nuova tab, verifica se l'URL nella stessa tab è cambiato
                                                     print(f"   ⚠️  Nessuna nuova tab rilevata entro 30s, verifico se URL cambiato nella stessa tab...")
                                                     self.page.wait_for_load_state("domcontentloaded")
-                                                    time.sleep(2)  # Attendi eventuale redirect
+                                                    self.attese.url_diverso("card_redirect_stessa_tab", url_prima_click, massimo_ms=2000)  # Attendi eventuale redirect
                                                     url_dopo_click = self.page.url
                                                 
                                                 print(f"   📍 URL dopo click: {url_dopo_click}")
@@ -2077,7 +2248,7 @@ class CribisNuovaRicerca:
                                                             # Se non si apre nuova tab, verifica se l'URL nella stessa tab è cambiato
                                                             print(f"   ⚠️  Nessuna nuova tab rilevata entro 30s, verifico se URL cambiato nella stessa tab...")
                                                             self.page.wait_for_load_state("domcontentloaded")
-                                                            time.sleep(2)  # Attendi eventuale redirect
+                                                            self.attese.url_diverso("card_redirect_stessa_tab", url_prima_click, massimo_ms=2000)  # Attendi eventuale redirect
                                                             url_dopo_click = self.page.url
                                                         
                                                         print(f"   📍 URL dopo click: {url_dopo_click}")
@@ -2182,7 +2353,7 @@ class CribisNuovaRicerca:
                                                     # Se non si apre nuova tab, verifica se l'URL nella stessa tab è cambiato
                                                     print(f"   ⚠️  Nessuna nuova tab rilevata entro 30s, verifico se URL cambiato nella stessa tab...")
                                                     self.page.wait_for_load_state("domcontentloaded")
-                                                    time.sleep(2)  # Attendi eventuale redirect
+                                                    self.attese.url_diverso("card_redirect_stessa_tab", url_prima_click, massimo_ms=2000)  # Attendi eventuale redirect
                                                     url_dopo_click = self.page.url
                                                 
                                                 print(f"   📍 URL dopo click: {url_dopo_click}")
@@ -2242,7 +2413,7 @@ class CribisNuovaRicerca:
             print("🔧 STEP 3.5: Verifica pagina configurazione campi...")
             try:
                 self.page.wait_for_load_state("domcontentloaded")
-                time.sleep(2)  # Attendi eventuale caricamento JS
+                self.attese.dom_stabile("card_configurazione_render", quiete_ms=400, massimo_ms=2000)
                 
                 # Cerca elementi che indicano una pagina di configurazione/selezione campi
                 # Pattern comuni: checkbox, form, select, campi da selezionare
@@ -2364,8 +2535,8 @@ class CribisNuovaRicerca:
                                     print(f"   ✅ Bottone conferma cliccato (selettore: {btn_sel})")
                                     bottone_conferma_trovato = True
                                     # Attendi caricamento nuova pagina
+                                    self.attese.url_diverso("card_conferma_url", url_dopo_step3, massimo_ms=2000)
                                     self.page.wait_for_load_state("domcontentloaded")
-                                    time.sleep(2)
                                     url_dopo_step3 = self.page.url
                                     print(f"   📍 URL dopo conferma: {url_dopo_step3}")
                                     break
@@ -2403,69 +2574,9 @@ class CribisNuovaRicerca:
                     raise Exception(f"STEP 3 fallito: non siamo sulla Company Card Completa. URL: {url_dopo_step3}. Errore verifica titolo: {title_err}")
             else:
                 print(f"   ✅ VERIFICATO: Siamo sulla Company Card Completa (URL contiene '/Storage/Document/')")
+                registra_documento(codice_fiscale, TIPO_COMPANY_CARD, url_dopo_step3)
 
-            # STEP 4: Apri tab "Bilanci" se presente (i dati finanziari sono spesso lì)
-            print("📊 STEP 4: Apertura tab 'Bilanci' (se presente)...")
-            try:
-                # Cerca tab "Bilanci" usando get_by_text (Playwright) e CSS selectors
-                tab_trovato = False
-                # Metodo 1: Playwright locator get_by_text
-                try:
-                    tab_loc = self.page.get_by_text("Bilanci", exact=False).first
-                    if tab_loc and tab_loc.is_visible(timeout=3000):
-                        tab_loc.click()
-                        print("   ✅ Tab 'Bilanci' aperto (via get_by_text)")
-                        tab_trovato = True
-                        time.sleep(2)  # Attendi caricamento JS
-                except:
-                    pass
-                
-                # Metodo 2: CSS selectors fallback
-                if not tab_trovato:
-                    tab_selettori = [
-                        '[data-tab="bilanci"]',
-                        '[data-tab="Bilanci"]',
-                        '.tab[data-tab*="bilanci" i]',
-                        '*[class*="bilanci" i][role="tab"]',
-                        'button[class*="bilanci" i]',
-                        'a[class*="bilanci" i]',
-                    ]
-                    for sel in tab_selettori:
-                        try:
-                            tab_btn = self.page.wait_for_selector(sel, timeout=2000)
-                            if tab_btn and tab_btn.is_visible():
-                                tab_btn.click()
-                                print(f"   ✅ Tab 'Bilanci' aperto (selettore CSS: {sel[:50]})")
-                                tab_trovato = True
-                                time.sleep(2)  # Attendi caricamento JS
-                                break
-                        except:
-                            continue
-                
-                if not tab_trovato:
-                    print("   ⚠️  Tab 'Bilanci' non trovato (forse dati già visibili o struttura diversa)")
-            except Exception as tab_err:
-                print(f"   ⚠️  Errore apertura tab Bilanci (non critico): {tab_err}")
-            
-            # STEP 5: Estrai dati dalla pagina attuale (Company Card con tab Bilanci aperto)
-            print("📊 STEP 5: Estrazione dati dalla pagina web...")
-            
-            # 5a) TENTATIVO 1: Estrazione DOM diretta con XPath (più robusto della sola regex)
-            try:
-                dati_estratti = self._estrai_dati_finanziari_da_dom(self.page, codice_fiscale)
-            except Exception as dom_err:
-                print(f"   ⚠️  Estrazione DOM non riuscita: {dom_err}")
-                dati_estratti = {"cf": codice_fiscale, "personale": None, "fatturato": None, "attivo": None, "stato_dati": "assenti", "fonte": "pagina_web"}
-            
-            # 5b) TENTATIVO 2: Se DOM non ha trovato nulla, fallback a regex su HTML
-            if (dati_estratti.get("personale") is None and dati_estratti.get("fatturato") is None and dati_estratti.get("attivo") is None):
-                print("   ⚠️  DOM non ha restituito valori → fallback regex su HTML")
-                html_content = self.page.content()
-                dati_estratti = self._estrai_dati_finanziari_da_pagina(html_content, codice_fiscale)
-            
-            print(f"✅ Dati estratti: {dati_estratti}")
-            
-            return dati_estratti
+            return self._estrai_dati_card_aperta(codice_fiscale)
             
         except Exception as e:
             # ERRORE CRITICO: Se è un errore di navigazione/bottone/pagina, PROPAGA invece di restituire dict
@@ -2508,6 +2619,74 @@ class CribisNuovaRicerca:
                 "stato_dati": "errore"
             }
     
+    def _estrai_dati_card_aperta(self, codice_fiscale: str) -> dict:
+        """
+        Estrae i dati finanziari dalla Company Card Completa aperta in self.page
+        (appena generata o riaperta da MyDocs).
+        """
+        # STEP 4: Apri tab "Bilanci" se presente (i dati finanziari sono spesso lì)
+        print("📊 STEP 4: Apertura tab 'Bilanci' (se presente)...")
+        try:
+            # Cerca tab "Bilanci" usando get_by_text (Playwright) e CSS selectors
+            tab_trovato = False
+            # Metodo 1: Playwright locator get_by_text
+            try:
+                tab_loc = self.page.get_by_text("Bilanci", exact=False).first
+                if tab_loc and tab_loc.is_visible(timeout=3000):
+                    tab_loc.click()
+                    print("   ✅ Tab 'Bilanci' aperto (via get_by_text)")
+                    tab_trovato = True
+                    self.attese.dom_stabile("card_tab_bilanci", quiete_ms=400, massimo_ms=2000)  # Attendi caricamento JS
+            except:
+                pass
+            
+            # Metodo 2: CSS selectors fallback
+            if not tab_trovato:
+                tab_selettori = [
+                    '[data-tab="bilanci"]',
+                    '[data-tab="Bilanci"]',
+                    '.tab[data-tab*="bilanci" i]',
+                    '*[class*="bilanci" i][role="tab"]',
+                    'button[class*="bilanci" i]',
+                    'a[class*="bilanci" i]',
+                ]
+                for sel in tab_selettori:
+                    try:
+                        tab_btn = self.page.wait_for_selector(sel, timeout=2000)
+                        if tab_btn and tab_btn.is_visible():
+                            tab_btn.click()
+                            print(f"   ✅ Tab 'Bilanci' aperto (selettore CSS: {sel[:50]})")
+                            tab_trovato = True
+                            self.attese.dom_stabile("card_tab_bilanci", quiete_ms=400, massimo_ms=2000)  # Attendi caricamento JS
+                            break
+                    except:
+                        continue
+            
+            if not tab_trovato:
+                print("   ⚠️  Tab 'Bilanci' non trovato (forse dati già visibili o struttura diversa)")
+        except Exception as tab_err:
+            print(f"   ⚠️  Errore apertura tab Bilanci (non critico): {tab_err}")
+        
+        # STEP 5: Estrai dati dalla pagina attuale (Company Card con tab Bilanci aperto)
+        print("📊 STEP 5: Estrazione dati dalla pagina web...")
+        
+        # 5a) TENTATIVO 1: Estrazione DOM diretta con XPath (più robusto della sola regex)
+        try:
+            dati_estratti = self._estrai_dati_finanziari_da_dom(self.page, codice_fiscale)
+        except Exception as dom_err:
+            print(f"   ⚠️  Estrazione DOM non riuscita: {dom_err}")
+            dati_estratti = {"cf": codice_fiscale, "personale": None, "fatturato": None, "attivo": None, "stato_dati": "assenti", "fonte": "pagina_web"}
+        
+        # 5b) TENTATIVO 2: Se DOM non ha trovato nulla, fallback a regex su HTML
+        if (dati_estratti.get("personale") is None and dati_estratti.get("fatturato") is None and dati_estratti.get("attivo") is None):
+            print("   ⚠️  DOM non ha restituito valori → fallback regex su HTML")
+            html_content = self.page.content()
+            dati_estratti = self._estrai_dati_finanziari_da_pagina(html_content, codice_fiscale)
+        
+        print(f"✅ Dati estratti: {dati_estratti}")
+        
+        return dati_estratti
+
     def _estrai_dati_finanziari_da_pagina(self, html_content: str, cf: str) -> dict:
         """
         Estrae dati finanziari direttamente dal contenuto HTML della pagina.
@@ -3002,8 +3181,8 @@ class CribisNuovaRicerca:
                         pass
                 if link:
                     break
-                print(f"   ⏳ Link 'Scarica' non ancora pronto, attendo {wait_s}s e riprovo...")
-                time.sleep(wait_s)
+                print(f"   ⏳ Link 'Scarica' non ancora pronto, attendo fino a {wait_s}s che compaia...")
+                self.attese.uno_tra("pdf_link_scarica", possibili_scarica, massimo_ms=wait_s * 1000)
 
             if not link:
                 print("   ⚠️  Selettori principali falliti, ultimo tentativo con get_by_text...")
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Sessione Cribis X persistente (storage_state cifrato)
+=====================================================
+
+Dopo un login riuscito cookie e localStorage del contesto Playwright
+(context.storage_state()) vengono salvati cifrati con Fernet su file locale.
+Un browser nuovo crea il contesto da quello stato e, se la sessione Cribis è
+ancora valida, salta del tutto il form di login.
+
+Chiave di cifratura:
+- CRIBIS_STATE_KEY: chiave Fernet (urlsafe base64, 32 byte) oppure passphrase
+  qualsiasi, da cui la chiave viene derivata con PBKDF2
+- in assenza, derivata con PBKDF2 dalle credenziali Cribis
+
+Il file contiene cookie di sessione: senza il pacchetto cryptography lo stato
+non viene salvato (mai in chiaro) e si torna al login completo.
+
+Keep-alive: nei periodi senza browser Cribis aperti un thread in background
+richiama Cribis con i cookie salvati (requests, senza Playwright) perché la
+sessione lato server non scada per inattività; i cookie rinnovati vengono
+riscritti nello stato. L'età della sessione è misurata dall'ultimo login
+completo: a inizio job, se è vicina a CRIBIS_SESSIONE_DURATA_MIN, si rifà il
+login subito invece di scoprire la scadenza a metà estrazione.
+
+Configurazione via variabili d'ambiente:
+- CRIBIS_STATE_FILE: percorso del file (default data/cribis_sessione.bin)
+- CRIBIS_STATE_TTL_ORE: età massima dello stato salvato (default 8)
+- CRIBIS_STATE_ABILITATO=0: disattiva salvataggio e ripristino
+- CRIBIS_SESSIONE_DURATA_MIN: durata massima di una sessione Cribis (default 240)
+- CRIBIS_SESSIONE_MARGINE_MIN: anticipo del re-login proattivo (default 20)
+- CRIBIS_KEEPALIVE_SECONDI: intervallo del keep-alive (default 300, 0 = disattivato)
+- CRIBIS_KEEPALIVE_URL: pagina richiamata dal keep-alive (default https://www2.cribisx.com/)
+"""
+
+import base64
+from functools import lru_cache
+import hashlib
+import json
+import os
+import threading
+import time
+
+from archivio_sqlite import percorso_dati
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    CRYPTOGRAPHY_DISPONIBILE = True
+except ImportError:
+    CRYPTOGRAPHY_DISPONIBILE = False
+
+
+# Iterazioni PBKDF2 per la derivazione della chiave
+ITERAZIONI_PBKDF2 = 200_000
+
+
+def stato_abilitato() -> bool:
+    if not CRYPTOGRAPHY_DISPONIBILE:
+        return False
+    return os.environ.get("CRIBIS_STATE_ABILITATO", "1").lower() not in ("0", "false", "no")
+
+
+def percorso_stato() -> str:
+    return percorso_dati("cribis_sessione.bin", "CRIBIS_STATE_FILE")
+
+
+def _chiave(username: str, password: str) -> bytes:
+    """Chiave Fernet da CRIBIS_STATE_KEY o derivata con PBKDF2 dalle credenziali"""
+    segreto = os.environ.get("CRIBIS_STATE_KEY", "")
+    if segreto:
+        try:
+            if len(base64.urlsafe_b64decode(segreto.encode())) == 32:
+                return segreto.encode()
+        except (ValueError, TypeError):
+            pass
+    else:
+        segreto = password
+    return _deriva_chiave(segreto, f"cribis-stato|{username}")
+
+
+@lru_cache(maxsize=8)
+def _deriva_chiave(segreto: str, sale: str) -> bytes:
+    # PBKDF2 costa ~0,2s: calcolato una volta per (segreto, sale), non a ogni controllo sessione
+    derivata = hashlib.pbkdf2_hmac("sha256", segreto.encode(), sale.encode(), ITERAZIONI_PBKDF2)
+    return base64.urlsafe_b64encode(derivata)
+
+
+def _leggi(username: str, password: str) -> dict | None:
+    """Contenuto decifrato del file: {"storage_state", "login_il"}"""
+    if not stato_abilitato():
+        return None
+    percorso = percorso_stato()
+    try:
+        with open(percorso, "rb") as f:
+            token = f.read()
+    except OSError:
+        return None
+    ttl = int(float(os.environ.get("CRIBIS_STATE_TTL_ORE", "8")) * 3600)
+    try:
+        return json.loads(Fernet(_chiave(username, password)).decrypt(token, ttl=ttl))
+    except (InvalidToken, ValueError):
+        print("⚠️ Stato sessione Cribis scaduto o non decifrabile, login completo")
+        cancella_stato()
+        return None
+
+
+def _scrivi(dati: dict, username: str, password: str) -> bool:
+    try:
+        token = Fernet(_chiave(username, password)).encrypt(json.dumps(dati).encode())
+        percorso = percorso_stato()
+        cartella = os.path.dirname(percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        # Temporaneo per thread: più browser (worker paralleli) possono salvare insieme
+        temporaneo = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Solo il proprietario può leggere il file con i cookie di sessione
+        with open(os.open(temporaneo, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(token)
+        os.replace(temporaneo, percorso)
+        return True
+    except Exception as e:
+        print(f"⚠️ Stato sessione Cribis non salvato: {e}")
+        return False
+
+
+def salva_stato(context, username: str, password: str, nuovo_login: bool = False) -> bool:
+    """
+    Salva cifrato lo storage_state del contesto.
+
+    Args:
+        nuovo_login (bool): True subito dopo un login completo (azzera l'età della sessione)
+
+    Returns:
+        bool: True se salvato
+    """
+    if not stato_abilitato():
+        return False
+    precedente = None if nuovo_login else _leggi(username, password)
+    login_il = precedente["login_il"] if precedente else time.time()
+    try:
+        storage_state = context.storage_state()
+    except Exception as e:
+        print(f"⚠️ Stato sessione Cribis non salvato: {e}")
+        return False
+    return _scrivi({"storage_state": storage_state, "login_il": login_il}, username, password)
+
+
+def carica_stato(username: str, password: str) -> dict | None:
+    """
+    storage_state salvato, da passare a browser.new_context(storage_state=...).
+    None se assente, scaduto (CRIBIS_STATE_TTL_ORE), illeggibile o cifrato con un'altra chiave.
+    """
+    dati = _leggi(username, password)
+    return dati["storage_state"] if dati else None
+
+
+def eta_sessione(username: str, password: str) -> float | None:
+    """Secondi dall'ultimo login completo della sessione salvata, None se non c'è"""
+    dati = _leggi(username, password)
+    return time.time() - dati["login_il"] if dati else None
+
+
+def sessione_da_rinnovare(username: str, password: str) -> bool:
+    """True se la sessione salvata è vicina alla durata massima e conviene rifare il login ora"""
+    eta = eta_sessione(username, password)
+    if eta is None:
+        return False
+    durata = float(os.environ.get("CRIBIS_SESSIONE_DURATA_MIN", "240")) * 60
+    margine = float(os.environ.get("CRIBIS_SESSIONE_MARGINE_MIN", "20")) * 60
+    return eta >= durata - margine
+
+
+def cancella_stato():
+    """Elimina lo stato salvato (es. sessione rifiutata da Cribis)"""
+    try:
+        os.remove(percorso_stato())
+    except OSError:
+        pass
+
+
+_browser_attivi = 0
+_ultima_attivita = time.time()
+_attivita_lock = threading.Lock()
+
+
+def inizio_uso():
+    """Un browser Cribis è aperto: il keep-alive non serve (lo tiene viva il browser)"""
+    global _browser_attivi, _ultima_attivita
+    with _attivita_lock:
+        _browser_attivi += 1
+        _ultima_attivita = time.time()
+
+
+def fine_uso():
+    global _browser_attivi, _ultima_attivita
+    with _attivita_lock:
+        _browser_attivi = max(0, _browser_attivi - 1)
+        _ultima_attivita = time.time()
+
+
+class KeepAliveCribis(threading.Thread):
+    """Thread che richiama Cribis con i cookie salvati durante i periodi di inattività"""
+
+    def __init__(self, username: str, password: str, intervallo: float = None, url: str = None):
+        super().__init__(name="cribis-keepalive", daemon=True)
+        self.username = username
+        self.password = password
+        self.intervallo = float(intervallo or os.environ.get("CRIBIS_KEEPALIVE_SECONDI", "300"))
+        self.url = url or os.environ.get("CRIBIS_KEEPALIVE_URL", "https://www2.cribisx.com/")
+        self._fermato = threading.Event()
+        self.ping_eseguiti = 0
+
+    def run(self):
+        while not self._fermato.wait(self.intervallo):
+            with _attivita_lock:
+                inattivo = _browser_attivi == 0 and time.time() - _ultima_attivita >= self.intervallo
+            if inattivo:
+                self.ping()
+
+    def ferma(self):
+        self._fermato.set()
+
+    def ping(self) -> bool:
+        """
+        Una richiesta autenticata con i cookie dello stato salvato.
+        Se Cribis rimanda al login lo stato viene eliminato: il job successivo
+        farà subito il login completo.
+
+        Returns:
+            bool: True se la sessione risulta ancora valida
+        """
+        import requests
+
+        dati = _leggi(self.username, self.password)
+        if not dati:
+            return False
+        sessione = requests.Session()
+        for c in dati["storage_state"].get("cookies", []):
+            sessione.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
+        try:
+            risposta = sessione.get(self.url, timeout=20, allow_redirects=True)
+        except requests.RequestException as e:
+            print(f"⚠️ Keep-alive Cribis non riuscito: {e}")
+            return False
+        self.ping_eseguiti += 1
+
+        if risposta.status_code in (401, 403) or "LogOn" in risposta.url or "sessionExpired" in risposta.url:
+            print("⚠️ Keep-alive Cribis: sessione scaduta, re-login al prossimo job")
+            cancella_stato()
+            return False
+
+        # Cookie rinnovati dal server (scadenza scorrevole) riportati nello stato salvato
+        rinnovati = {(c.name, c.domain): c for c in sessione.cookies}
+        for c in dati["storage_state"].get("cookies", []):
+            nuovo = rinnovati.get((c["name"], c.get("domain", "")))
+            if nuovo is not None:
+                c["value"] = nuovo.value
+                if nuovo.expires:
+                    c["expires"] = nuovo.expires
+        _scrivi(dati, self.username, self.password)
+        return True
+
+
+_keepalive = None
+_keepalive_lock = threading.Lock()
+
+
+def avvia_keepalive(username: str, password: str) -> KeepAliveCribis | None:
+    """Avvia (una volta per processo) il keep-alive; None se disattivato o senza stato persistente"""
+    global _keepalive
+    if not stato_abilitato() or float(os.environ.get("CRIBIS_KEEPALIVE_SECONDI", "300")) <= 0:
+        return None
+    with _keepalive_lock:
+        if _keepalive is None or not _keepalive.is_alive():
+            _keepalive = KeepAliveCribis(username, password)
+            _keepalive.start()
+        return _keepalive
+
+
+def test_stato():
+    """Salvataggio e ripristino cifrati con un contesto finto"""
+    if not CRYPTOGRAPHY_DISPONIBILE:
+        print("⏭️  cryptography non installato, test_stato saltato")
+        return
+    import tempfile
+
+    class ContestoFinto:
+        def storage_state(self):
+            return {"cookies": [{"name": "ASP.NET_SessionId", "value": "abc"}], "origins": []}
+
+    with tempfile.TemporaryDirectory() as cartella:
+        os.environ["CRIBIS_STATE_FILE"] = os.path.join(cartella, "stato.bin")
+        assert salva_stato(ContestoFinto(), "utente", "segreto")
+        with open(os.environ["CRIBIS_STATE_FILE"], "rb") as f:
+            assert b"abc" not in f.read()
+        assert carica_stato("utente", "segreto")["cookies"][0]["value"] == "abc"
+        # Età dal login completo, non dall'ultimo salvataggio
+        assert eta_sessione("utente", "segreto") < 5
+        assert not sessione_da_rinnovare("utente", "segreto")
+        os.environ["CRIBIS_SESSIONE_DURATA_MIN"] = "0"
+        assert sessione_da_rinnovare("utente", "segreto")
+        del os.environ["CRIBIS_SESSIONE_DURATA_MIN"]
+        # Chiave derivata una sola volta per credenziali
+        assert _deriva_chiave.cache_info().hits > 0
+        # Chiave diversa: stato scartato
+        assert carica_stato("utente", "altra") is None
+        assert not os.path.exists(os.environ["CRIBIS_STATE_FILE"])
+        del os.environ["CRIBIS_STATE_FILE"]
+    print("✅ test_stato OK")
+
+
+if __name__ == "__main__":
+    test_stato()
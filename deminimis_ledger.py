@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Ledger De Minimis a finestra mobile
+===================================
+
+Gli aiuti di un beneficiario vengono ordinati per data di concessione in array
+numpy con somme cumulative: il totale nella finestra dei 3 anni (3*365 giorni,
+come in calcola_deminimis) per una data qualsiasi si ottiene con due ricerche
+binarie, senza risommare gli aiuti.
+
+Domande tipiche del consulente:
+- margine disponibile a una data futura di concessione (margine_al)
+- quando si libera il margine man mano che gli aiuti escono dal triennio
+  (calendario_liberazione)
+- prima data utile per ricevere un nuovo aiuto di un certo importo
+  (prima_data_disponibile)
+
+LedgerAiutiGruppo tiene in forma colonnare gli aiuti di tutte le società di un
+gruppo per totali, subtotali e ordinamento per data negli endpoint aggregati;
+gli aiuti passano dall'indice di deduplica (rna_deduplica) mentre vengono aggiunti.
+"""
+
+from datetime import date, datetime, timedelta
+import numpy as np
+
+from rna_deminimis_playwright import SOGLIA_DE_MINIMIS
+from rna_deduplica import IndiceDeduplicaAiuti
+
+
+# Finestra di calcolo: stessa convenzione di calcola_deminimis (oggi - 3*365 giorni);
+# il giorno limite è escluso (tre_anni_fa ha l'ora corrente, la data di concessione la mezzanotte)
+FINESTRA_GIORNI = 3 * 365
+
+
+def _a_data(valore) -> date:
+    """Accetta date, datetime o stringhe dd/mm/yyyy / yyyy-mm-dd"""
+    if isinstance(valore, datetime):
+        return valore.date()
+    if isinstance(valore, date):
+        return valore
+    testo = str(valore).strip()
+    for formato in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(testo[:10], formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data non valida: {valore}")
+
+
+class LedgerDeMinimis:
+    """Aiuti di un beneficiario ordinati per data, con somme cumulative per query O(log n)"""
+
+    def __init__(self, aiuti: list[dict], soglia: float = SOGLIA_DE_MINIMIS):
+        """
+        Args:
+            aiuti (list): Aiuti nel formato di calcola_deminimis (data_concessione, importo)
+            soglia (float): Massimale de minimis nel triennio
+        """
+        self.soglia = soglia
+        giorni, importi = [], []
+        for aiuto in aiuti:
+            try:
+                giorno = _a_data(aiuto.get("data_concessione") or aiuto.get("data")).toordinal()
+                importo = float(aiuto.get("importo") or 0)
+            except (ValueError, TypeError):
+                continue
+            giorni.append(giorno)
+            importi.append(importo)
+
+        self._imposta_array(np.asarray(giorni, dtype=np.int64), np.asarray(importi, dtype=np.float64))
+
+    def _imposta_array(self, giorni: np.ndarray, importi: np.ndarray):
+        ordine = np.argsort(giorni, kind="stable")
+        self._giorni = giorni.astype(np.int64)[ordine]
+        self._importi = importi.astype(np.float64)[ordine]
+        # _cumulati[i] = somma dei primi i aiuti (con lo zero iniziale)
+        self._cumulati = np.concatenate(([0.0], np.cumsum(self._importi)))
+
+    @classmethod
+    def da_risultato(cls, risultato: dict, soglia: float = None) -> "LedgerDeMinimis":
+        """Costruisce il ledger dal dict restituito da calcola_deminimis"""
+        return cls(risultato.get("aiuti_trovati", []), soglia or risultato.get("soglia_limite") or SOGLIA_DE_MINIMIS)
+
+    def __len__(self) -> int:
+        return len(self._giorni)
+
+    def totale_al(self, data) -> float:
+        """Totale degli aiuti nella finestra di 3 anni che termina a data (inclusa)"""
+        fine = _a_data(data).toordinal()
+        i = np.searchsorted(self._giorni, fine - FINESTRA_GIORNI, side="right")
+        j = np.searchsorted(self._giorni, fine, side="right")
+        return round(float(self._cumulati[j] - self._cumulati[i]), 2)
+
+    def margine_al(self, data) -> float:
+        """Margine de minimis disponibile a data (0 se la soglia è superata)"""
+        return round(max(0.0, self.soglia - self.totale_al(data)), 2)
+
+    def calendario_liberazione(self, dal=None) -> list[dict]:
+        """
+        Date in cui il margine aumenta perché aiuti escono dalla finestra, a partire da dal
+        (default oggi), assumendo nessun nuovo aiuto.
+
+        Returns:
+            list: [{data, importo_liberato, totale_residuo, margine_disponibile}] in ordine cronologico
+        """
+        inizio = _a_data(dal or date.today()).toordinal()
+        i = np.searchsorted(self._giorni, inizio - FINESTRA_GIORNI, side="right")
+        j = np.searchsorted(self._giorni, inizio, side="right")
+        if i == j:
+            return []
+
+        # Un aiuto concesso il giorno g conta fino a g + FINESTRA_GIORNI escluso
+        uscite, inverso = np.unique(self._giorni[i:j] + FINESTRA_GIORNI, return_inverse=True)
+        liberati = np.bincount(inverso, weights=self._importi[i:j])
+        residui = float(self._cumulati[j] - self._cumulati[i]) - np.cumsum(liberati)
+
+        return [
+            {
+                "data": date.fromordinal(int(g)).strftime("%d/%m/%Y"),
+                "importo_liberato": round(float(l), 2),
+                "totale_residuo": round(max(0.0, float(r)), 2),
+                "margine_disponibile": round(max(0.0, self.soglia - float(r)), 2),
+            }
+            for g, l, r in zip(uscite, liberati, residui)
+        ]
+
+    def prima_data_disponibile(self, importo: float, dal=None) -> date | None:
+        """
+        Prima data (da dal, default oggi) in cui il margine consente un aiuto di importo dato.
+        None se importo supera la soglia stessa.
+        """
+        if importo > self.soglia:
+            return None
+        inizio = _a_data(dal or date.today())
+        if self.margine_al(inizio) >= importo:
+            return inizio
+        for voce in self.calendario_liberazione(inizio):
+            if voce["margine_disponibile"] >= importo:
+                return _a_data(voce["data"])
+        return None
+
+
+class LedgerAiutiGruppo:
+    """
+    Aiuti di un gruppo di società in forma colonnare: array numpy di date (ordinali),
+    importi e indice società, più una tabella di titoli misura internati.
+    Ordinamento per data, totale di gruppo e subtotali per società senza oggetti per riga;
+    la conversione in dict avviene solo per la risposta JSON (a_json).
+    """
+
+    def __init__(self):
+        self.societa: list[str] = []
+        self.titoli: list[str] = []
+        self._indice_titoli: dict[str, int] = {}
+        self._blocchi: list[tuple] = []
+        self._colonne = None
+        self._deduplica = IndiceDeduplicaAiuti()
+
+    def aggiungi_societa(self, cf: str, aiuti: list[dict]) -> int:
+        """
+        Aggiunge gli aiuti di una società (formato calcola_deminimis).
+        Gli aiuti già presenti per la stessa società (stesso COR, o stessa data,
+        importo e misura) vengono scartati e contati in duplicati_rimossi.
+
+        Returns:
+            int: Numero di aiuti aggiunti (esclusi duplicati e aiuti con data o importo non validi)
+        """
+        indice_societa = len(self.societa)
+        self.societa.append(cf)
+        giorni, importi, titoli = [], [], []
+        # Una chiamata è una fonte: aiuti identici senza COR restano concessioni distinte
+        fonte = object()
+        for aiuto in aiuti:
+            try:
+                giorno = _a_data(aiuto.get("data_concessione") or aiuto.get("data")).toordinal()
+                importo = float(aiuto.get("importo") or 0)
+            except (ValueError, TypeError):
+                continue
+            if not self._deduplica.aggiungi(aiuto, cf, fonte):
+                continue
+            titolo = aiuto.get("titolo_misura") or "N/A"
+            indice_titolo = self._indice_titoli.get(titolo)
+            if indice_titolo is None:
+                indice_titolo = self._indice_titoli[titolo] = len(self.titoli)
+                self.titoli.append(titolo)
+            giorni.append(giorno)
+            importi.append(importo)
+            titoli.append(indice_titolo)
+        self._blocchi.append((
+            np.asarray(giorni, dtype=np.int32),
+            np.asarray(importi, dtype=np.float64),
+            np.full(len(giorni), indice_societa, dtype=np.int32),
+            np.asarray(titoli, dtype=np.int32),
+        ))
+        self._colonne = None
+        return len(giorni)
+
+    def _array(self) -> tuple:
+        """Colonne concatenate e ordinate per data decrescente (calcolate una volta)"""
+        if self._colonne is None:
+            if self._blocchi:
+                giorni, importi, societa, titoli = (np.concatenate(c) for c in zip(*self._blocchi))
+            else:
+                giorni = societa = titoli = np.empty(0, dtype=np.int32)
+                importi = np.empty(0, dtype=np.float64)
+            ordine = np.argsort(-giorni.astype(np.int64), kind="stable")
+            self._colonne = (giorni[ordine], importi[ordine], societa[ordine], titoli[ordine])
+        return self._colonne
+
+    def __len__(self) -> int:
+        return len(self._array()[0])
+
+    @property
+    def duplicati_rimossi(self) -> int:
+        return self._deduplica.duplicati_rimossi
+
+    def totale(self) -> float:
+        return round(float(self._array()[1].sum()), 2)
+
+    def subtotali_per_societa(self) -> dict[str, dict]:
+        """{cf: {"totale": float, "numero_aiuti": int}} per tutte le società aggiunte"""
+        _, importi, societa, _ = self._array()
+        totali = np.bincount(societa, weights=importi, minlength=len(self.societa))
+        numeri = np.bincount(societa, minlength=len(self.societa))
+        return {
+            cf: {"totale": round(float(totali[i]), 2), "numero_aiuti": int(numeri[i])}
+            for i, cf in enumerate(self.societa)
+        }
+
+    def ledger_finestra(self, soglia: float = SOGLIA_DE_MINIMIS) -> LedgerDeMinimis:
+        """Ledger a finestra mobile sull'intero gruppo (margine e calendario di gruppo)"""
+        giorni, importi, _, _ = self._array()
+        ledger = LedgerDeMinimis([], soglia)
+        ledger._imposta_array(giorni, importi)
+        return ledger
+
+    def a_json(self) -> list[dict]:
+        """Aiuti dal più recente, nel formato tutti_aiuti atteso dal frontend (con societa_cf)"""
+        giorni, importi, societa, titoli = self._array()
+        risultato = []
+        for giorno, importo, indice_societa, indice_titolo in zip(giorni.tolist(), importi.tolist(),
+                                                                  societa.tolist(), titoli.tolist()):
+            data_txt = date.fromordinal(giorno).strftime("%d/%m/%Y")
+            risultato.append({
+                "data_concessione": data_txt,
+                "importo": importo,
+                "titolo_misura": self.titoli[indice_titolo],
+                "data": data_txt,
+                "societa_cf": self.societa[indice_societa],
+            })
+        return risultato
+
+
+def test_ledger():
+    """Verifica finestra, margini e calendario su dati sintetici"""
+    oggi = date(2026, 6, 30)
+    aiuti = [
+        {"data_concessione": "15/01/2024", "importo": 100000.0},
+        {"data_concessione": "01/03/2025", "importo": 150000.0},
+        {"data_concessione": "02/07/2023", "importo": 40000.0},
+    ]
+    ledger = LedgerDeMinimis(aiuti)
+
+    assert ledger.totale_al(oggi) == 290000.0
+    assert ledger.margine_al(oggi) == 10000.0
+
+    # Confronto con la somma diretta per una data qualsiasi
+    for giorni in range(0, 1200, 37):
+        giorno = oggi + timedelta(days=giorni)
+        atteso = sum(a["importo"] for a in aiuti
+                     if 0 <= (giorno - _a_data(a["data_concessione"])).days < FINESTRA_GIORNI)
+        assert abs(ledger.totale_al(giorno) - atteso) < 0.01, giorno
+
+    # Giorno limite escluso come in calcola_deminimis (data < oggi - 3*365 giorni con l'ora corrente)
+    limite = oggi - timedelta(days=FINESTRA_GIORNI)
+    bordo = LedgerDeMinimis([{"data_concessione": limite.strftime("%d/%m/%Y"), "importo": 1000.0},
+                             {"data_concessione": limite + timedelta(days=1), "importo": 500.0}])
+    assert bordo.totale_al(oggi) == 500.0
+    assert bordo.calendario_liberazione(oggi)[0]["data"] == (oggi + timedelta(days=1)).strftime("%d/%m/%Y")
+
+    calendario = ledger.calendario_liberazione(oggi)
+    assert [v["importo_liberato"] for v in calendario] == [40000.0, 100000.0, 150000.0]
+    assert calendario[-1]["margine_disponibile"] == 300000.0
+    assert ledger.prima_data_disponibile(5000, oggi) == oggi
+    assert ledger.prima_data_disponibile(120000, oggi) == _a_data(calendario[1]["data"])
+
+    gruppo = LedgerAiutiGruppo()
+    gruppo.aggiungi_societa("AAA", aiuti[:2])
+    gruppo.aggiungi_societa("BBB", [{"data_concessione": "02/12/2023", "importo": 5000.0, "titolo_misura": "X"},
+                                    {"data_concessione": "non valida", "importo": 1.0}])
+    gruppo.aggiungi_societa("CCC", [])
+    # Stessa società passata due volte: gli aiuti non vengono contati di nuovo
+    assert gruppo.aggiungi_societa("AAA", aiuti[:1]) == 0 and gruppo.duplicati_rimossi == 1
+    assert gruppo.totale() == 255000.0
+    assert gruppo.subtotali_per_societa()["BBB"] == {"totale": 5000.0, "numero_aiuti": 1}
+    assert gruppo.subtotali_per_societa()["CCC"]["numero_aiuti"] == 0
+    # Ordine per data reale (non per stringa dd/mm/yyyy)
+    assert [a["data"] for a in gruppo.a_json()] == ["01/03/2025", "15/01/2024", "02/12/2023"]
+    assert gruppo.ledger_finestra().margine_al(oggi) == 45000.0
+    print("✅ test_ledger OK")
+
+
+if __name__ == "__main__":
+    test_ledger()
@@ -68,13 +68,74 @@ class CalcolatoreDimensionePMI:
         self.headless = headless
         self.cribis = None
         self.browser_attivo = False
+        # True durante un calcolo con force_refresh: cache di gruppo e dati finanziari ignorate (ma aggiornate)
+        self.force_refresh = False
         
-    def calcola_dimensione(self, partita_iva: str) -> Dict:
+    def _assicura_browser(self):
+        """
+        Avvia browser e login Cribis al primo uso effettivo: se gruppo e dati
+        finanziari arrivano tutti dalla cache il browser non viene mai aperto.
+        """
+        # Inizializza browser solo se non è già attivo (RIUTILIZZO SESSIONE)
+        if not self.browser_attivo:
+            print("🆕 Inizializzo browser e login (prima richiesta)")
+            self.cribis = CribisNuovaRicerca(headless=self.headless)
+            self.cribis.__enter__()  # Inizializza browser
+            self.cribis.login()
+            self.browser_attivo = True
+        else:
+            print("♻️  Browser già attivo, verifico sessione...")
+            try:
+                # Verifica che la sessione sia ancora valida
+                if not self.cribis._check_and_handle_session_expired():
+                    print("⚠️  Sessione scaduta durante riutilizzo, errore ripristino")
+                    # Se fallisce, prova a rifare login completo
+                    try:
+                        print("🔄 Tento re-login completo...")
+                        if not self.cribis.login():
+                            raise Exception("Re-login fallito durante riutilizzo sessione")
+                        print("✅ Re-login completato")
+                    except Exception as e:
+                        # IMPORTANTE: Mantieni l'errore originale per detection "thread"
+                        error_msg_inner = str(e).lower()
+                        if "thread" in error_msg_inner or "exited" in error_msg_inner or "closed" in error_msg_inner:
+                            # Browser morto - propaga con messaggio che possiamo rilevare
+                            raise Exception(f"BROWSER_THREAD_DEAD: {e}")
+                        else:
+                            raise Exception(f"Impossibile ripristinare sessione: {e}")
+                else:
+                    print("✅ Sessione valida, procedo")
+            except Exception as browser_err:
+                error_msg = str(browser_err).lower()
+                # Errore critico: browser thread morto o crashato
+                if "thread" in error_msg or "exited" in error_msg or "closed" in error_msg or "browser_thread_dead" in error_msg:
+                    print(f"⚠️  BROWSER CRASHATO/MORTO: {browser_err}")
+                    print("🔄 Chiudo browser morto e reinizializzo completamente...")
+                    
+                    # Chiudi browser morto (ignora errori)
+                    try:
+                        if self.cribis:
+                            self.cribis.__exit__(None, None, None)
+                    except:
+                        pass
+                    
+                    # Reinizializza tutto da zero
+                    self.cribis = CribisNuovaRicerca(headless=self.headless)
+                    self.cribis.__enter__()
+                    self.cribis.login()
+                    self.browser_attivo = True
+                    print("✅ Browser reinizializzato e login completato")
+                else:
+                    # Altri errori, propaga
+                    raise
+    
+    def calcola_dimensione(self, partita_iva: str, force_refresh: bool = False) -> Dict:
         """
         Calcola la dimensione d'impresa per una P.IVA.
         
         Args:
             partita_iva (str): Partita IVA dell'impresa principale
+            force_refresh (bool): Ignora le cache di gruppo e dati finanziari e rilegge da Cribis
             
         Returns:
             dict: Risultato completo con classificazione e dettagli
@@ -86,64 +147,17 @@ class CalcolatoreDimensionePMI:
             "errore": None,
             "tempo_inizio": time.time()
         }
+        self.force_refresh = force_refresh
         
         try:
             print(f"\n{'='*70}")
             print(f"📊 CALCOLO DIMENSIONE PMI - P.IVA: {partita_iva}")
             print(f"{'='*70}\n")
             
-            # Inizializza browser solo se non è già attivo (RIUTILIZZO SESSIONE)
-            if not self.browser_attivo:
-                print("🆕 Inizializzo browser e login (prima richiesta)")
-                self.cribis = CribisNuovaRicerca(headless=self.headless)
-                self.cribis.__enter__()  # Inizializza browser
-                self.cribis.login()
-                self.browser_attivo = True
-            else:
-                print("♻️  Browser già attivo, verifico sessione...")
-                try:
-                    # Verifica che la sessione sia ancora valida
-                    if not self.cribis._check_and_handle_session_expired():
-                        print("⚠️  Sessione scaduta durante riutilizzo, errore ripristino")
-                        # Se fallisce, prova a rifare login completo
-                        try:
-                            print("🔄 Tento re-login completo...")
-                            if not self.cribis.login():
-                                raise Exception("Re-login fallito durante riutilizzo sessione")
-                            print("✅ Re-login completato")
-                        except Exception as e:
-                            # IMPORTANTE: Mantieni l'errore originale per detection "thread"
-                            error_msg_inner = str(e).lower()
-                            if "thread" in error_msg_inner or "exited" in error_msg_inner or "closed" in error_msg_inner:
-                                # Browser morto - propaga con messaggio che possiamo rilevare
-                                raise Exception(f"BROWSER_THREAD_DEAD: {e}")
-                            else:
-                                raise Exception(f"Impossibile ripristinare sessione: {e}")
-                    else:
-                        print("✅ Sessione valida, procedo")
-                except Exception as browser_err:
-                    error_msg = str(browser_err).lower()
-                    # Errore critico: browser thread morto o crashato
-                    if "thread" in error_msg or "exited" in error_msg or "closed" in error_msg or "browser_thread_dead" in error_msg:
-                        print(f"⚠️  BROWSER CRASHATO/MORTO: {browser_err}")
-                        print("🔄 Chiudo browser morto e reinizializzo completamente...")
-                        
-                        # Chiudi browser morto (ignora errori)
-                        try:
-                            if self.cribis:
-                                self.cribis.__exit__(None, None, None)
-                        except:
-                            pass
-                        
-                        # Reinizializza tutto da zero
-                        self.cribis = CribisNuovaRicerca(headless=self.headless)
-                        self.cribis.__enter__()
-                        self.cribis.login()
-                        self.browser_attivo = True
-                        print("✅ Browser reinizializzato e login completato")
-                    else:
-                        # Altri errori, propaga
-                        raise
+            # Browser riutilizzato dal job precedente: se la sessione Cribis sta per
+            # scadere il re-login si fa ora, tra un job e l'altro, non a metà estrazione
+            if self.browser_attivo and self.cribis:
+                self.cribis.rinnova_sessione_se_in_scadenza()
             
             # STEP 1: Estrai gruppo societario completo (collegate + partner)
             print("\n1️⃣ ESTRAZIONE GRUPPO SOCIETARIO")
@@ -186,31 +200,18 @@ class CalcolatoreDimensionePMI:
             )
             risultato["impresa_principale"].update(dati_principale)
             
-            societa_processate = 0
-            
-            # Dati società collegate
-            for i, soc in enumerate(risultato["societa_collegate"], 1):
-                if TEST_MODE and societa_processate >= MAX_SOCIETA_TEST:
-                    print(f"\n⏭️  Skip restanti collegate (modalità test)")
-                    break
-                
-                print(f"\n📊 [{i}/{len(risultato['societa_collegate'])}] Collegata: {soc['nome']}")
-                # Passa P.IVA se disponibile (migliora ricerca su Cribis)
-                dati = self._scarica_dati_finanziari(soc['cf'], soc['nome'], soc.get('piva'))
-                soc.update(dati)
-                societa_processate += 1
-            
-            # Dati società partner
-            for i, soc in enumerate(risultato["societa_partner"], 1):
-                if TEST_MODE and societa_processate >= MAX_SOCIETA_TEST:
-                    print(f"\n⏭️  Skip restanti partner (modalità test)")
-                    break
-                
-                print(f"\n📊 [{i}/{len(risultato['societa_partner'])}] Partner: {soc['nome']}")
-                # Passa P.IVA se disponibile (migliora ricerca su Cribis)
-                dati = self._scarica_dati_finanziari(soc['cf'], soc['nome'], soc.get('piva'))
-                soc.update(dati)
-                societa_processate += 1
+            # Dati società collegate e partner (in parallelo se possibile, vedi CRIBIS_CONCORRENZA)
+            da_scaricare = [
+                (f"[{i}/{len(risultato['societa_collegate'])}] Collegata", soc)
+                for i, soc in enumerate(risultato["societa_collegate"], 1)
+            ] + [
+                (f"[{i}/{len(risultato['societa_partner'])}] Partner", soc)
+                for i, soc in enumerate(risultato["societa_partner"], 1)
+            ]
+            if TEST_MODE and len(da_scaricare) > MAX_SOCIETA_TEST:
+                print(f"\n⏭️  Skip {len(da_scaricare) - MAX_SOCIETA_TEST} società (modalità test)")
+                da_scaricare = da_scaricare[:MAX_SOCIETA_TEST]
+            self._scarica_dati_finanziari_gruppo(da_scaricare)
             
             # STEP 3: Calcola aggregati UE
             print(f"\n3️⃣ CALCOLO AGGREGATI UE")
@@ -397,8 +398,28 @@ class CalcolatoreDimensionePMI:
                 "errore": str | None
             }
         """
+        # Gruppo in cache: nessun report "Gruppo Societario" (crediti Cribis) e nessun login
+        from cribis_cache import get_cache_gruppi
+        cache = get_cache_gruppi()
+        risultato_cribis = None
+        if cache and not self.force_refresh:
+            try:
+                risultato_cribis = cache.leggi(partita_iva)
+            except Exception as e:
+                print(f"⚠️  Lettura cache gruppi fallita: {e}")
+        if risultato_cribis:
+            print(f"💾 Gruppo societario da cache (salvato il {risultato_cribis['cache_salvato_il']})")
+        else:
+            self._assicura_browser()
+        
         try:
-            risultato_cribis = self.cribis.cerca_associate(partita_iva)
+            if risultato_cribis is None:
+                risultato_cribis = self.cribis.cerca_associate(partita_iva)
+                if cache:
+                    try:
+                        cache.salva(partita_iva, risultato_cribis)
+                    except Exception as e:
+                        print(f"⚠️  Salvataggio cache gruppi fallito: {e}")
             
             if risultato_cribis.get("errore"):
                 return {
@@ -470,7 +491,125 @@ class CalcolatoreDimensionePMI:
                 "errore": f"Errore estrazione gruppo: {str(e)}"
             }
     
-    def _scarica_dati_finanziari(self, codice_fiscale: str, ragione_sociale: str, partita_iva: str = None) -> Dict:
+    def _scarica_dati_finanziari_gruppo(self, da_scaricare: List[tuple]):
+        """
+        Scarica i dati finanziari delle società del gruppo aggiornando i dict in place.
+        
+        Sequenziale sul browser principale per default. Con CRIBIS_CONCORRENZA > 1
+        (opt-in: ogni worker è un Chromium in più) le società vengono ripartite
+        tra worker paralleli. Le API sync di Playwright sono legate al thread che
+        le ha create, quindi ogni worker è un thread con il proprio browser e un
+        contesto creato dallo storage_state cifrato della sessione principale
+        (cribis_sessione). Il login si fa una sola volta, prima dei worker: i
+        worker riusano solo lo stato salvato, senza mai rifare il login né
+        cancellarlo. Un worker che non riesce a usarlo si ritira e le società
+        rimaste in coda si scaricano in sequenza sul browser principale.
+        Senza stato persistente (cryptography assente o CRIBIS_STATE_ABILITATO=0)
+        si resta sequenziali.
+        
+        Come nel flusso sequenziale, il primo errore blocca il calcolo: i worker
+        smettono di prendere nuove società e l'eccezione viene propagata.
+        
+        Args:
+            da_scaricare (list): Coppie (etichetta per il log, dict società con cf/nome/piva)
+        """
+        from cribis_sessione import carica_stato, salva_stato, stato_abilitato
+        
+        # Società con dati finanziari in cache: nessuna navigazione Cribis
+        da_navigare = []
+        for etichetta, soc in da_scaricare:
+            dati = self._dati_da_cache(soc['cf'])
+            if dati:
+                print(f"\n💾 {etichetta}: {soc['nome']} da cache (bilancio {dati.get('anno_riferimento', 'N/D')})")
+                soc.update(dati)
+            else:
+                da_navigare.append((etichetta, soc))
+        da_scaricare = da_navigare
+        if not da_scaricare:
+            return
+        
+        concorrenza = max(1, int(os.environ.get("CRIBIS_CONCORRENZA", "1")))
+        concorrenza = min(concorrenza, len(da_scaricare))
+        if concorrenza <= 1 or not stato_abilitato():
+            for etichetta, soc in da_scaricare:
+                print(f"\n📊 {etichetta}: {soc['nome']}")
+                # Passa P.IVA se disponibile (migliora ricerca su Cribis)
+                soc.update(self._scarica_dati_finanziari(soc['cf'], soc['nome'], soc.get('piva')))
+            return
+        
+        import queue
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        
+        # Unico login: cookie aggiornati della sessione principale, da cui partono i
+        # contesti dei worker; senza browser principale né stato salvato, login ora
+        if not self.browser_attivo:
+            cribis = CribisNuovaRicerca(headless=self.headless)
+            if carica_stato(cribis.username, cribis.password) is None:
+                self._assicura_browser()
+        if self.browser_attivo:
+            salva_stato(self.cribis.context, self.cribis.username, self.cribis.password)
+        
+        coda = queue.Queue()
+        for voce in da_scaricare:
+            coda.put(voce)
+        errori = []
+        interrompi = threading.Event()
+        
+        def worker():
+            cribis = CribisNuovaRicerca(headless=self.headless, solo_sessione_salvata=True)
+            try:
+                cribis.__enter__()
+                if not cribis.login():
+                    print(f"⚠️  {threading.current_thread().name}: sessione salvata non utilizzabile, worker ritirato")
+                    return
+                while not interrompi.is_set():
+                    try:
+                        etichetta, soc = coda.get_nowait()
+                    except queue.Empty:
+                        return
+                    print(f"\n📊 {etichetta}: {soc['nome']} ({threading.current_thread().name})")
+                    soc.update(self._scarica_dati_finanziari(soc['cf'], soc['nome'], soc.get('piva'), cribis=cribis))
+            except Exception as e:
+                errori.append(e)
+                interrompi.set()
+            finally:
+                try:
+                    cribis.__exit__(None, None, None)
+                except Exception as close_err:
+                    print(f"⚠️  Errore chiusura browser worker: {close_err}")
+        
+        print(f"🚀 Company Card in parallelo: {len(da_scaricare)} società, {concorrenza} worker")
+        inizio = time.time()
+        with ThreadPoolExecutor(max_workers=concorrenza, thread_name_prefix="cribis-card") as executor:
+            for _ in range(concorrenza):
+                executor.submit(worker)
+        if errori:
+            raise errori[0]
+        # Società rimaste in coda (worker ritirati): in sequenza sul browser principale
+        while not coda.empty():
+            etichetta, soc = coda.get_nowait()
+            print(f"\n📊 {etichetta}: {soc['nome']}")
+            soc.update(self._scarica_dati_finanziari(soc['cf'], soc['nome'], soc.get('piva')))
+        print(f"✅ Company Card parallele completate in {time.time() - inizio:.1f}s")
+    
+    def _dati_da_cache(self, codice_fiscale: str) -> Optional[Dict]:
+        """Dati finanziari dalla cache per (CF, anno di bilancio), None se assenti, scaduti o con force_refresh"""
+        from cribis_cache import get_cache_finanziari
+        cache = get_cache_finanziari()
+        if cache is None or self.force_refresh:
+            return None
+        try:
+            dati = cache.leggi(codice_fiscale)
+        except Exception as e:
+            print(f"⚠️  Lettura cache dati finanziari fallita: {e}")
+            return None
+        if dati:
+            dati["pdf_note"] = "dati_da_cache"
+        return dati
+    
+    def _scarica_dati_finanziari(self, codice_fiscale: str, ragione_sociale: str, partita_iva: str = None,
+                                 cribis: CribisNuovaRicerca = None) -> Dict:
         """
         Scarica Company Card Completa ed estrae dati finanziari.
         
@@ -481,6 +620,7 @@ class CalcolatoreDimensionePMI:
             codice_fiscale (str): CF dell'azienda
             ragione_sociale (str): Nome azienda
             partita_iva (str, optional): P.IVA dell'azienda (preferita per ricerca Cribis)
+            cribis (CribisNuovaRicerca, optional): Browser da usare (default self.cribis; i worker paralleli passano il proprio)
             
         Returns:
             dict: Dati finanziari estratti
@@ -494,7 +634,24 @@ class CalcolatoreDimensionePMI:
         # Usa il metodo di Cribis per aprire Company Card ed estrarre dati dalla pagina
         # Passa P.IVA se disponibile per migliorare la ricerca (Cribis preferisce P.IVA)
         # Se questo fallisce (Exception), viene propagata e blocca il processo
-        dati = self.cribis.scarica_company_card_completa(codice_fiscale, partita_iva)
+        dati = self._dati_da_cache(codice_fiscale)
+        if dati:
+            print(f"   💾 Dati finanziari di {ragione_sociale} da cache (bilancio {dati.get('anno_riferimento', 'N/D')})")
+            return dati
+        
+        if cribis is None:
+            self._assicura_browser()
+            cribis = self.cribis
+        dati = cribis.scarica_company_card_completa(codice_fiscale, partita_iva)
+        
+        # Cache per (CF, anno di bilancio): gli esiti con errore non vengono salvati
+        from cribis_cache import get_cache_finanziari
+        cache = get_cache_finanziari()
+        if cache:
+            try:
+                cache.salva(codice_fiscale, dati)
+            except Exception as e:
+                print(f"⚠️  Salvataggio cache dati finanziari fallito: {e}")
 
         # PDF: disattivato di default per non bloccare il flusso "Dimensione".
         # Abilitabile impostando CRIBIS_PDF_AUTO=1 (o true) nell'ambiente.
@@ -502,7 +659,7 @@ class CalcolatoreDimensionePMI:
         auto_pdf = os.environ.get("CRIBIS_PDF_AUTO", "0").lower() in {"1", "true", "yes", "on"}
         if auto_pdf:
             try:
-                pdf_res = self.cribis.scarica_pdf_company_card_corrente(codice_fiscale)
+                pdf_res = cribis.scarica_pdf_company_card_corrente(codice_fiscale)
                 if pdf_res.get("success"):
                     dati["pdf_filename"] = pdf_res.get("filename")
                 else:
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Attese a condizione per i flussi Playwright
+===========================================
+
+Sostituisce le pause fisse (time.sleep / wait_for_timeout) con attese su una
+condizione esplicita e un limite massimo:
+- selettore visibile/presente/nascosto
+- URL cambiato o corrispondente a un pattern
+- rete quieta (networkidle)
+- DOM stabile (nessuna mutazione per qualche centinaio di ms, MutationObserver)
+- funzione JS vera
+
+Nessuna attesa solleva eccezioni: alla scadenza del limite il flusso prosegue
+come con la vecchia pausa fissa. Ogni attesa registra, sotto il proprio nome,
+quanto è durata davvero e se è scaduta; le statistiche sono cumulate per
+processo (riepilogo_attese) e per istanza (AttesePagina.riepilogo), così si vede
+dove si perde tempo per ogni società e quali limiti si possono ridurre.
+"""
+
+import threading
+import time
+
+
+# Risolve true quando il DOM resta fermo per "quiete" ms, false allo scadere di "massimo" ms
+JS_DOM_STABILE = """
+([quiete, massimo]) => new Promise(resolve => {
+  const radice = document.body || document.documentElement;
+  let timer = null;
+  let limite = null;
+  const osservatore = new MutationObserver(() => {
+    clearTimeout(timer);
+    timer = setTimeout(() => fine(true), quiete);
+  });
+  function fine(esito) {
+    osservatore.disconnect();
+    clearTimeout(timer);
+    clearTimeout(limite);
+    resolve(esito);
+  }
+  osservatore.observe(radice, { childList: true, subtree: true, attributes: true, characterData: true });
+  timer = setTimeout(() => fine(true), quiete);
+  limite = setTimeout(() => fine(false), massimo);
+})
+"""
+
+_statistiche = {}
+_statistiche_lock = threading.Lock()
+
+
+def _registra(destinazioni: list[dict], nome: str, secondi: float, riuscita: bool):
+    for statistiche in destinazioni:
+        voce = statistiche.setdefault(nome, {"conteggio": 0, "totale_s": 0.0, "massimo_s": 0.0, "scadute": 0})
+        voce["conteggio"] += 1
+        voce["totale_s"] += secondi
+        voce["massimo_s"] = max(voce["massimo_s"], secondi)
+        voce["scadute"] += 0 if riuscita else 1
+
+
+def statistiche_attese() -> dict:
+    """Statistiche cumulate del processo: {nome: {conteggio, totale_s, massimo_s, scadute}}"""
+    with _statistiche_lock:
+        return {nome: dict(voce) for nome, voce in _statistiche.items()}
+
+
+def azzera_statistiche_attese():
+    with _statistiche_lock:
+        _statistiche.clear()
+
+
+def formatta_riepilogo(statistiche: dict, massimo_voci: int = 10) -> str:
+    """Attese ordinate per tempo totale, una riga per nome"""
+    totale = sum(v["totale_s"] for v in statistiche.values())
+    righe = [f"⏱️  Attese: {totale:.1f}s in {sum(v['conteggio'] for v in statistiche.values())} attese"]
+    for nome, voce in sorted(statistiche.items(), key=lambda x: -x[1]["totale_s"])[:massimo_voci]:
+        righe.append(f"   {voce['totale_s']:6.1f}s  {nome} (x{voce['conteggio']}, max {voce['massimo_s']:.1f}s"
+                     f"{', scadute ' + str(voce['scadute']) if voce['scadute'] else ''})")
+    return "\n".join(righe)
+
+
+def riepilogo_attese(massimo_voci: int = 10) -> str:
+    return formatta_riepilogo(statistiche_attese(), massimo_voci)
+
+
+class AttesePagina:
+    """Attese a condizione su una Page Playwright (sync), con misura dei tempi"""
+
+    def __init__(self, page=None):
+        self.page = page
+        self.statistiche = {}
+
+    def _misura(self, nome: str, attesa) -> bool:
+        inizio = time.time()
+        try:
+            attesa()
+            riuscita = True
+        except Exception:
+            riuscita = False
+        secondi = time.time() - inizio
+        with _statistiche_lock:
+            _registra([_statistiche, self.statistiche], nome, secondi, riuscita)
+        return riuscita
+
+    def selettore(self, nome: str, selettore: str, massimo_ms: int = 10000, stato: str = "visible") -> bool:
+        """Attende che il selettore sia nello stato richiesto (visible, attached, hidden, detached)"""
+        return self._misura(nome, lambda: self.page.wait_for_selector(selettore, state=stato, timeout=massimo_ms))
+
+    def uno_tra(self, nome: str, selettori: list[str], massimo_ms: int = 10000) -> bool:
+        """Attende che almeno uno dei selettori (CSS, xpath=, text=...) sia visibile"""
+        def attesa():
+            locator = self.page.locator(selettori[0])
+            for selettore in selettori[1:]:
+                locator = locator.or_(self.page.locator(selettore))
+            locator.first.wait_for(state="visible", timeout=massimo_ms)
+        return self._misura(nome, attesa)
+
+    def url_diverso(self, nome: str, url_precedente: str, massimo_ms: int = 10000) -> bool:
+        """Attende che l'URL cambi rispetto a url_precedente (redirect, navigazione SPA con #)"""
+        return self._misura(nome, lambda: self.page.wait_for_url(lambda url: url != url_precedente, timeout=massimo_ms))
+
+    def url(self, nome: str, condizione, massimo_ms: int = 10000) -> bool:
+        """Attende un URL che soddisfi condizione (glob, regex o funzione url -> bool)"""
+        return self._misura(nome, lambda: self.page.wait_for_url(condizione, timeout=massimo_ms))
+
+    def rete_quieta(self, nome: str, massimo_ms: int = 10000) -> bool:
+        """Attende che non ci siano richieste di rete in corso (networkidle)"""
+        return self._misura(nome, lambda: self.page.wait_for_load_state("networkidle", timeout=massimo_ms))
+
+    def dom_stabile(self, nome: str, quiete_ms: int = 400, massimo_ms: int = 5000) -> bool:
+        """Attende che il DOM non cambi per quiete_ms (rendering JS, espansioni, modali)"""
+        def attesa():
+            try:
+                stabile = self.page.evaluate(JS_DOM_STABILE, [quiete_ms, massimo_ms])
+            except Exception:
+                # Navigazione durante l'osservazione: basta il caricamento del nuovo documento
+                self.page.wait_for_load_state("domcontentloaded", timeout=massimo_ms)
+                stabile = True
+            if not stabile:
+                raise TimeoutError("DOM ancora in modifica")
+        return self._misura(nome, attesa)
+
+    def funzione(self, nome: str, js: str, arg=None, massimo_ms: int = 10000, polling="raf") -> bool:
+        """Attende che la funzione JS restituisca un valore vero (polling: "raf" o millisecondi)"""
+        return self._misura(nome, lambda: self.page.wait_for_function(js, arg=arg, timeout=massimo_ms, polling=polling))
+
+    def riepilogo(self, massimo_voci: int = 10) -> str:
+        return formatta_riepilogo(self.statistiche, massimo_voci)
+
+    def azzera(self):
+        self.statistiche = {}
+
+
+def test_attese():
+    """Misura e conteggio delle scadenze con una pagina finta (senza browser)"""
+    class PaginaFinta:
+        url = "https://example.org/#Home"
+
+        def wait_for_selector(self, selettore, state, timeout):
+            if selettore == "#assente":
+                raise TimeoutError(selettore)
+
+        def wait_for_load_state(self, stato, timeout):
+            pass
+
+    azzera_statistiche_attese()
+    attese = AttesePagina(PaginaFinta())
+    assert attese.selettore("campo", "#presente")
+    assert not attese.selettore("campo", "#assente")
+    assert attese.rete_quieta("rete")
+    assert attese.statistiche["campo"]["conteggio"] == 2 and attese.statistiche["campo"]["scadute"] == 1
+    assert statistiche_attese()["rete"]["conteggio"] == 1
+    assert "campo (x2" in attese.riepilogo()
+    print("✅ test_attese OK")
+
+
+if __name__ == "__main__":
+    test_attese()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Blocco risorse non essenziali per le sessioni Playwright
+========================================================
+
+Instradamento comune (context.route) che interrompe le richieste inutili agli
+scraper: immagini, font, media e script di analytics/tracking di terze parti.
+I fogli di stile restano consentiti: senza CSS elementi nascosti diventano
+visibili e i controlli is_visible() dei flussi cambiano comportamento.
+
+Profili:
+- "rna": solo host RNA e CDN di jQuery/DataTables (allowlist), niente immagini/font/media
+- "cribis": tutti gli host tranne i tracker noti, niente immagini/font/media
+
+Nota: con un route attivo Playwright disattiva la cache HTTP del contesto;
+il benchmark misura l'effetto netto.
+
+Configurazione via variabili d'ambiente:
+- PLAYWRIGHT_BLOCCO_RISORSE=0 disattiva il blocco
+- PLAYWRIGHT_TIPI_BLOCCATI (es. "image,font,media") sostituisce i tipi del profilo
+- PLAYWRIGHT_HOST_CONSENTITI (es. "cdn.example.com,static.example.org") estende l'allowlist
+
+Benchmark (prima/dopo, byte trasferiti e tempo di caricamento):
+    python playwright_risorse.py rna
+    python playwright_risorse.py cribis
+
+Per "rna" con RNA_BENCHMARK_CF impostato si misura l'intero flusso ricerca ->
+risultati (RNACalculator._calcola_su_pagina) per quel beneficiario: tempo, byte
+e aiuti trovati con e senza blocco, così un blocco che affama DataTables/XHR
+si vede come risultato diverso o ricerca non confermata.
+"""
+
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+
+# Host di analytics/tracking mai necessari agli scraper
+HOST_TRACKER = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googleadservices.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "nr-data.net",
+    "newrelic.com",
+    "matomo.cloud",
+)
+
+PROFILI = {
+    "rna": {
+        "url_benchmark": "https://www.rna.gov.it/trasparenza/aiuti",
+        "tipi_bloccati": ("image", "font", "media"),
+        # None = tutti gli host non tracker; altrimenti solo questi (e sottodomini)
+        "host_consentiti": (
+            "rna.gov.it",
+            "code.jquery.com",
+            "cdn.datatables.net",
+            "cdnjs.cloudflare.com",
+            "cdn.jsdelivr.net",
+        ),
+    },
+    "cribis": {
+        "url_benchmark": "https://www2.cribisx.com/#Home/Index",
+        "tipi_bloccati": ("image", "font", "media"),
+        "host_consentiti": None,
+    },
+}
+
+
+def _host_in(host: str, domini) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domini)
+
+
+def blocco_attivo() -> bool:
+    return os.environ.get("PLAYWRIGHT_BLOCCO_RISORSE", "1").lower() not in ("0", "false", "no")
+
+
+def da_bloccare(url: str, tipo_risorsa: str, profilo: str) -> bool:
+    """True se la richiesta (url, resource_type) va interrotta secondo il profilo"""
+    config = PROFILI[profilo]
+    host = (urlparse(url).hostname or "").lower()
+    if not host:
+        # data:, blob: ecc.
+        return False
+    if _host_in(host, HOST_TRACKER):
+        return True
+    tipi = os.environ.get("PLAYWRIGHT_TIPI_BLOCCATI")
+    tipi = [t.strip() for t in tipi.split(",") if t.strip()] if tipi is not None else config["tipi_bloccati"]
+    if tipo_risorsa in tipi:
+        return True
+    consentiti = config["host_consentiti"]
+    if consentiti is None:
+        return False
+    extra = [h.strip().lower() for h in os.environ.get("PLAYWRIGHT_HOST_CONSENTITI", "").split(",") if h.strip()]
+    return not _host_in(host, tuple(consentiti) + tuple(extra))
+
+
+def applica_profilo(target, profilo: str, statistiche: dict = None) -> bool:
+    """
+    Installa il blocco risorse su un BrowserContext (o una Page).
+
+    Args:
+        target: BrowserContext o Page Playwright (sync)
+        profilo (str): "rna" o "cribis"
+        statistiche (dict): Se passato, conta richieste "bloccate" e "consentite"
+
+    Returns:
+        bool: True se il blocco è stato installato
+    """
+    if profilo not in PROFILI:
+        raise ValueError(f"Profilo risorse sconosciuto: {profilo}")
+    if not blocco_attivo():
+        return False
+
+    def gestore(route):
+        richiesta = route.request
+        if da_bloccare(richiesta.url, richiesta.resource_type, profilo):
+            if statistiche is not None:
+                statistiche["bloccate"] = statistiche.get("bloccate", 0) + 1
+            route.abort()
+        else:
+            if statistiche is not None:
+                statistiche["consentite"] = statistiche.get("consentite", 0) + 1
+            route.continue_()
+
+    target.route("**/*", gestore)
+    return True
+
+
+async def applica_profilo_async(target, profilo: str, statistiche: dict = None) -> bool:
+    """Come applica_profilo, per BrowserContext/Page di playwright.async_api"""
+    if profilo not in PROFILI:
+        raise ValueError(f"Profilo risorse sconosciuto: {profilo}")
+    if not blocco_attivo():
+        return False
+
+    async def gestore(route):
+        richiesta = route.request
+        if da_bloccare(richiesta.url, richiesta.resource_type, profilo):
+            if statistiche is not None:
+                statistiche["bloccate"] = statistiche.get("bloccate", 0) + 1
+            await route.abort()
+        else:
+            if statistiche is not None:
+                statistiche["consentite"] = statistiche.get("consentite", 0) + 1
+            await route.continue_()
+
+    await target.route("**/*", gestore)
+    return True
+
+
+def _misura_caricamento(browser, url: str, profilo: str = None, cf: str = None) -> dict:
+    """
+    Carica url in un contesto nuovo e misura byte ricevuti e tempo fino all'evento load;
+    con cf misura invece la ricerca RNA completa fino ai risultati estratti.
+    """
+    context = browser.new_context()
+    statistiche = {}
+    if profilo:
+        applica_profilo(context, profilo, statistiche)
+    richieste = []
+    page = context.new_page()
+    page.on("requestfinished", richieste.append)
+    try:
+        inizio = time.time()
+        risultato = None
+        if cf:
+            from datetime import datetime
+            from rna_deminimis_playwright import RNACalculator
+            try:
+                risultato = RNACalculator(motore="playwright")._calcola_su_pagina(page, cf, datetime.now())
+            except Exception as e:
+                # Risultati mai arrivati (es. XHR bloccata): conta come ricerca non confermata
+                print(f"   ⚠️ Ricerca RNA non completata: {e}")
+                risultato = {}
+        else:
+            page.goto(url, wait_until="load", timeout=90000)
+        secondi = time.time() - inizio
+        byte = 0
+        for richiesta in richieste:
+            try:
+                dimensioni = richiesta.sizes()
+                byte += dimensioni["responseBodySize"] + dimensioni["responseHeadersSize"]
+            except Exception:
+                continue
+        misura = {
+            "secondi": round(secondi, 2),
+            "kb_trasferiti": round(byte / 1024, 1),
+            "richieste": len(richieste),
+            "bloccate": statistiche.get("bloccate", 0),
+        }
+        if risultato is not None:
+            misura["aiuti"] = risultato.get("numero_aiuti", 0)
+            misura["confermate"] = int(bool(risultato.get("ricerca_confermata")))
+        return misura
+    finally:
+        context.close()
+
+
+def benchmark(profilo: str, ripetizioni: int = 3, headless: bool = True) -> dict:
+    """
+    Confronta il flusso senza e con blocco risorse: per "rna" con RNA_BENCHMARK_CF la
+    ricerca completa fino ai risultati, altrimenti il caricamento della pagina di ingresso.
+
+    Returns:
+        dict: {"senza_blocco": {...}, "con_blocco": {...}} con medie di secondi e KB
+            (per la ricerca RNA anche aiuti trovati e quota di ricerche confermate)
+    """
+    from playwright.sync_api import sync_playwright
+    from browser_pool import CHROMIUM_ARGS
+
+    url = PROFILI[profilo]["url_benchmark"]
+    cf = os.environ.get("RNA_BENCHMARK_CF", "").strip() if profilo == "rna" else ""
+    risultati = {"senza_blocco": [], "con_blocco": []}
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless, args=CHROMIUM_ARGS)
+        try:
+            for _ in range(ripetizioni):
+                # Alterna le due modalità per non favorire nessuna delle due
+                risultati["senza_blocco"].append(_misura_caricamento(browser, url, cf=cf))
+                risultati["con_blocco"].append(_misura_caricamento(browser, url, profilo, cf=cf))
+        finally:
+            browser.close()
+
+    medie = {}
+    for modalita, misure in risultati.items():
+        medie[modalita] = {
+            chiave: round(sum(m[chiave] for m in misure) / len(misure), 2)
+            for chiave in ("secondi", "kb_trasferiti", "richieste", "bloccate", "aiuti", "confermate")
+            if chiave in misure[0]
+        }
+    return medie
+
+
+if __name__ == "__main__":
+    profili = sys.argv[1:] or list(PROFILI)
+    for nome in profili:
+        print(f"\n⏱️  Benchmark profilo '{nome}' ({PROFILI[nome]['url_benchmark']})")
+        if nome == "rna":
+            cf = os.environ.get("RNA_BENCHMARK_CF")
+            print(f"   Ricerca completa per {cf}" if cf else
+                  "   ⚠️ RNA_BENCHMARK_CF non impostato: misurata solo la pagina di ingresso")
+        medie = benchmark(nome)
+        prima, dopo = medie["senza_blocco"], medie["con_blocco"]
+        print(f"   Senza blocco: {prima['secondi']}s, {prima['kb_trasferiti']} KB, {prima['richieste']} richieste")
+        print(f"   Con blocco:   {dopo['secondi']}s, {dopo['kb_trasferiti']} KB, {dopo['richieste']} richieste "
+              f"({dopo['bloccate']} bloccate)")
+        if "aiuti" in prima:
+            print(f"   Aiuti trovati: {prima['aiuti']} senza blocco, {dopo['aiuti']} con blocco; "
+                  f"ricerche confermate {prima['confermate']:.0%} / {dopo['confermate']:.0%}")
+            if prima["aiuti"] != dopo["aiuti"] or dopo["confermate"] < prima["confermate"]:
+                print("   ❌ Il blocco risorse cambia i risultati: verificare host e tipi consentiti")
+        if prima["kb_trasferiti"]:
+            risparmio = 100 * (1 - dopo["kb_trasferiti"] / prima["kb_trasferiti"])
+            print(f"   📉 Byte risparmiati: {risparmio:.0f}%")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Filtro di Bloom dei beneficiari De Minimis RNA
+==============================================
+
+Insieme probabilistico compatto (bytearray + hash blake2b) dei codici fiscali
+presenti nei dump OpenData RNA. Se un CF non è nel filtro, nei mesi coperti
+dai dump non ha ricevuto aiuti De Minimis: RNACalculator risponde senza
+scraping (o limita la ricerca live ai giorni dopo l'ultimo dump).
+Un esito positivo può essere un falso positivo (probabilità ~RNA_BLOOM_ERRORE)
+e porta alla ricerca normale.
+
+Il filtro (pochi MB) può essere distribuito anche dove l'archivio SQLite
+OpenData non c'è. Si aggiorna in modo incrementale a ogni dump mensile
+ingerito da rna_opendata_store; i mesi aggiunti determinano la copertura.
+
+Configurazione via variabili d'ambiente:
+- RNA_BLOOM_FILE: percorso del file (default data/rna_bloom.bin)
+- RNA_BLOOM_ABILITATO=0: filtro ignorato e non aggiornato
+- RNA_BLOOM_CAPACITA (default 2.000.000 CF), RNA_BLOOM_ERRORE (default 0.001)
+
+Uso da riga di comando:
+    python rna_bloom.py OpenData_Aiuti_2025_07.xml [altri file o cartelle...]
+    python rna_bloom.py --da-archivio        (ricostruisce dall'archivio SQLite OpenData)
+"""
+
+from contextlib import closing
+from datetime import date
+from hashlib import blake2b
+import json
+import math
+import os
+import sys
+import threading
+
+from archivio_sqlite import percorso_dati
+
+
+INTESTAZIONE = b"RNABLOOM1\n"
+
+
+def filtro_abilitato() -> bool:
+    return os.environ.get("RNA_BLOOM_ABILITATO", "1").lower() not in ("0", "false", "no")
+
+
+class FiltroBeneficiari:
+    """Filtro di Bloom dei CF beneficiari, con l'elenco dei mesi OpenData inseriti"""
+
+    def __init__(self, capacita: int = None, errore: float = None):
+        """
+        Args:
+            capacita (int): Numero di CF previsti (oltre, il tasso di falsi positivi cresce)
+            errore (float): Probabilità di falso positivo alla capacità prevista
+        """
+        capacita = int(capacita or os.environ.get("RNA_BLOOM_CAPACITA", "2000000"))
+        errore = float(errore or os.environ.get("RNA_BLOOM_ERRORE", "0.001"))
+        self.bit = max(8, int(-capacita * math.log(errore) / math.log(2) ** 2))
+        self.hash = max(1, round(self.bit / capacita * math.log(2)))
+        self.capacita = capacita
+        self.inseriti = 0
+        self.mesi: set[str] = set()
+        self._bits = bytearray((self.bit + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _posizioni(self, cf: str):
+        # Doppio hashing (Kirsch-Mitzenmacher): k posizioni da un solo digest blake2b
+        digest = blake2b(cf.strip().upper().encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bit for i in range(self.hash))
+
+    def aggiungi(self, cf: str):
+        with self._lock:
+            nuovo = False
+            for p in self._posizioni(cf):
+                byte, maschera = p >> 3, 1 << (p & 7)
+                if not self._bits[byte] & maschera:
+                    self._bits[byte] |= maschera
+                    nuovo = True
+            self.inseriti += nuovo
+
+    def __contains__(self, cf: str) -> bool:
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._posizioni(cf))
+
+    def aggiungi_mese(self, mese: str, codici_fiscali):
+        """Inserisce i CF beneficiari di un dump mensile ("YYYY-MM") e ne registra la copertura"""
+        for cf in codici_fiscali:
+            self.aggiungi(cf)
+        self.mesi.add(mese)
+        if self.inseriti > self.capacita:
+            print(f"⚠️ Filtro Bloom oltre la capacità ({self.inseriti}/{self.capacita} CF): "
+                  f"ricostruirlo con RNA_BLOOM_CAPACITA più alta")
+
+    def copertura(self) -> tuple[date, date] | None:
+        """Periodo coperto senza buchi dai mesi inseriti (come RNAOpenDataStore.copertura)"""
+        from rna_opendata_store import copertura_mesi
+        return copertura_mesi(self.mesi)
+
+    def salva(self, percorso: str):
+        """Scrittura atomica: intestazione JSON su una riga seguita dai bit"""
+        cartella = os.path.dirname(percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        meta = {"bit": self.bit, "hash": self.hash, "capacita": self.capacita,
+                "inseriti": self.inseriti, "mesi": sorted(self.mesi)}
+        temporaneo = f"{percorso}.tmp"
+        with self._lock, open(temporaneo, "wb") as f:
+            f.write(INTESTAZIONE)
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(self._bits)
+        os.replace(temporaneo, percorso)
+
+    @classmethod
+    def carica(cls, percorso: str) -> "FiltroBeneficiari":
+        with open(percorso, "rb") as f:
+            if f.readline() != INTESTAZIONE:
+                raise ValueError(f"File filtro Bloom non valido: {percorso}")
+            meta = json.loads(f.readline())
+            bits = bytearray(f.read())
+        filtro = cls.__new__(cls)
+        filtro.bit, filtro.hash, filtro.capacita = meta["bit"], meta["hash"], meta["capacita"]
+        filtro.inseriti = meta["inseriti"]
+        filtro.mesi = set(meta["mesi"])
+        if len(bits) != (filtro.bit + 7) // 8:
+            raise ValueError(f"File filtro Bloom troncato: {percorso}")
+        filtro._bits = bits
+        filtro._lock = threading.Lock()
+        return filtro
+
+    @classmethod
+    def da_archivio(cls, store=None) -> "FiltroBeneficiari":
+        """Ricostruisce il filtro dall'archivio SQLite OpenData (tutti i mesi ingeriti)"""
+        from rna_opendata_store import RNAOpenDataStore
+        store = store or RNAOpenDataStore()
+        with closing(store._connessione()) as conn:
+            numero = conn.execute("SELECT COUNT(DISTINCT cf) FROM aiuti").fetchone()[0]
+            filtro = cls(capacita=max(numero * 2, int(os.environ.get("RNA_BLOOM_CAPACITA", "2000000"))))
+            for mese in store.mesi_ingeriti():
+                righe = conn.execute("SELECT DISTINCT cf FROM aiuti WHERE mese_fonte = ?", (mese,))
+                filtro.aggiungi_mese(mese, (r["cf"] for r in righe))
+        return filtro
+
+
+def percorso_filtro() -> str:
+    return percorso_dati("rna_bloom.bin", "RNA_BLOOM_FILE")
+
+
+_filtro = None
+_filtro_mtime = None
+_filtro_lock = threading.Lock()
+
+
+def get_filtro() -> FiltroBeneficiari | None:
+    """
+    Filtro condiviso, ricaricato se il file è cambiato (es. dopo un'ingestione
+    in un altro processo). None se disattivato, assente o illeggibile.
+    """
+    global _filtro, _filtro_mtime
+    if not filtro_abilitato():
+        return None
+    percorso = percorso_filtro()
+    try:
+        mtime = os.path.getmtime(percorso)
+    except OSError:
+        return None
+    with _filtro_lock:
+        if _filtro is None or mtime != _filtro_mtime:
+            try:
+                _filtro = FiltroBeneficiari.carica(percorso)
+                _filtro_mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Filtro Bloom RNA non utilizzabile: {e}")
+                return None
+        return _filtro
+
+
+def aggiorna_con_mese(mese: str, codici_fiscali) -> FiltroBeneficiari | None:
+    """Aggiunge al filtro su disco (creandolo se manca) i CF di un dump appena ingerito"""
+    if not filtro_abilitato():
+        return None
+    percorso = percorso_filtro()
+    filtro = FiltroBeneficiari.carica(percorso) if os.path.exists(percorso) else FiltroBeneficiari()
+    filtro.aggiungi_mese(mese, codici_fiscali)
+    filtro.salva(percorso)
+    return filtro
+
+
+def test_filtro():
+    """Nessun falso negativo, falsi positivi vicini al tasso atteso, persistenza e copertura"""
+    import tempfile
+    filtro = FiltroBeneficiari(capacita=10000, errore=0.01)
+    presenti = [f"{i:011d}" for i in range(10000)]
+    filtro.aggiungi_mese("2025-01", presenti[:5000])
+    filtro.aggiungi_mese("2025-02", presenti[5000:])
+    assert all(cf in filtro for cf in presenti)
+    falsi_positivi = sum(f"X{i:010d}" in filtro for i in range(10000))
+    assert falsi_positivi < 300, falsi_positivi
+    # CF normalizzati come nell'inserimento
+    assert " 00000000007 " in filtro
+
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "bloom.bin")
+        filtro.salva(percorso)
+        riletto = FiltroBeneficiari.carica(percorso)
+        assert riletto.mesi == {"2025-01", "2025-02"} and all(cf in riletto for cf in presenti[:100])
+        assert riletto.copertura() == (date(2025, 1, 1), date(2025, 2, 28))
+    print(f"✅ test_filtro OK ({falsi_positivi} falsi positivi su 10000, {len(filtro._bits) // 1024} KB)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python rna_bloom.py <file.xml | cartella> [...] | --da-archivio")
+        sys.exit(1)
+
+    filtro = None
+    if sys.argv[1] == "--da-archivio":
+        filtro = FiltroBeneficiari.da_archivio()
+        filtro.salva(percorso_filtro())
+    else:
+        from rna_opendata_store import leggi_aiuti_xml, mese_da_nome_file
+        for arg in sys.argv[1:]:
+            nomi = sorted(os.path.join(arg, n) for n in os.listdir(arg)) if os.path.isdir(arg) else [arg]
+            for nome in nomi:
+                mese = mese_da_nome_file(nome)
+                if not mese or not nome.lower().endswith(".xml"):
+                    continue
+                print(f"📥 Filtro Bloom: {os.path.basename(nome)} (mese {mese})...")
+                filtro = aggiorna_con_mese(mese, (a["cf"] for _, a in leggi_aiuti_xml(nome) if a))
+    if filtro is None:
+        print("⚠️ Nessun file OpenData_Aiuti_YYYY_MM.xml trovato")
+        sys.exit(1)
+    print(f"✅ Filtro Bloom: {filtro.inseriti} CF, {len(filtro._bits) // 1024} KB, mesi {', '.join(sorted(filtro.mesi))}")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Cache persistente dei risultati de minimis RNA
+==============================================
+
+Conserva su SQLite (condiviso tra i worker gunicorn) il dict completo restituito
+da RNACalculator.calcola_deminimis, con chiave (codice fiscale, data di fine
+finestra). Le ricerche ripetute sulla stessa P.IVA nello stesso giorno tornano
+in millisecondi invece di rifare lo scraping RNA.
+
+- TTL configurabile con RNA_CACHE_TTL_ORE (default 12 ore)
+- RNA_CACHE_ABILITATA=0 disattiva la cache
+- i risultati con errore non vengono mai salvati, né quelli parziali
+  (copertura_completa=False) o senza aiuti non confermati dalla risposta
+  alla ricerca (ricerca_confermata)
+- invalida() rimuove le voci di un CF (o tutte), force_refresh lato endpoint
+"""
+
+from datetime import date, datetime
+from contextlib import closing
+import json
+import os
+import threading
+import time
+
+from archivio_sqlite import percorso_dati, connetti
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS risultati (
+    cf TEXT NOT NULL,
+    data_fine TEXT NOT NULL,
+    risultato TEXT NOT NULL,
+    salvato_il REAL NOT NULL,
+    PRIMARY KEY (cf, data_fine)
+);
+"""
+
+
+class RNACache:
+    """Cache con scadenza dei risultati calcola_deminimis"""
+
+    def __init__(self, percorso: str = None, ttl_ore: float = None):
+        """
+        Args:
+            percorso (str): File SQLite (default data/rna_cache.sqlite o RNA_CACHE_DB)
+            ttl_ore (float): Validità di un risultato in ore (default RNA_CACHE_TTL_ORE o 12)
+        """
+        self.percorso = percorso or percorso_dati("rna_cache.sqlite", "RNA_CACHE_DB")
+        self.ttl_secondi = float(ttl_ore if ttl_ore is not None else os.environ.get("RNA_CACHE_TTL_ORE", "12")) * 3600
+        self._schema_pronto = False
+
+    def _connessione(self):
+        conn = connetti(self.percorso)
+        if not self._schema_pronto:
+            conn.executescript(SCHEMA)
+            self._schema_pronto = True
+        return conn
+
+    def leggi(self, cf: str, data_fine: date) -> dict | None:
+        """Risultato in cache per (cf, data_fine) se non scaduto, altrimenti None"""
+        with closing(self._connessione()) as conn:
+            riga = conn.execute(
+                "SELECT risultato, salvato_il FROM risultati WHERE cf = ? AND data_fine = ?",
+                (cf.strip().upper(), data_fine.isoformat())
+            ).fetchone()
+        if riga is None or time.time() - riga["salvato_il"] > self.ttl_secondi:
+            return None
+        risultato = json.loads(riga["risultato"])
+        risultato["da_cache"] = True
+        risultato["cache_salvato_il"] = datetime.fromtimestamp(riga["salvato_il"]).strftime("%d/%m/%Y %H:%M")
+        return risultato
+
+    def salva(self, cf: str, data_fine: date, risultato: dict) -> bool:
+        """Salva un risultato valido; errori, risultati parziali e vuoti non confermati vengono ignorati"""
+        if not risultato or risultato.get("errore"):
+            return False
+        if not risultato.get("copertura_completa", True):
+            return False
+        if not risultato.get("aiuti_trovati") and not risultato.get("ricerca_confermata"):
+            return False
+        with closing(self._connessione()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO risultati (cf, data_fine, risultato, salvato_il) VALUES (?, ?, ?, ?)",
+                (cf.strip().upper(), data_fine.isoformat(), json.dumps(risultato, ensure_ascii=False), time.time())
+            )
+        return True
+
+    def invalida(self, cf: str = None) -> int:
+        """
+        Rimuove le voci di un codice fiscale (tutte le date) o, senza cf, l'intera cache.
+
+        Returns:
+            int: Numero di voci rimosse
+        """
+        with closing(self._connessione()) as conn, conn:
+            if cf:
+                cursore = conn.execute("DELETE FROM risultati WHERE cf = ?", (cf.strip().upper(),))
+            else:
+                cursore = conn.execute("DELETE FROM risultati")
+            return cursore.rowcount
+
+    def pulisci_scaduti(self) -> int:
+        """Elimina le voci oltre il TTL. Returns: numero di voci rimosse"""
+        with closing(self._connessione()) as conn, conn:
+            return conn.execute(
+                "DELETE FROM risultati WHERE salvato_il < ?", (time.time() - self.ttl_secondi,)
+            ).rowcount
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> RNACache | None:
+    """Istanza condivisa della cache, None se disattivata con RNA_CACHE_ABILITATA=0"""
+    global _cache
+    if os.environ.get("RNA_CACHE_ABILITATA", "1").lower() in ("0", "false", "no"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RNACache()
+        return _cache
+
+
+def test_cache():
+    """Test rapido su un file temporaneo"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as cartella:
+        cache = RNACache(os.path.join(cartella, "cache.sqlite"), ttl_ore=1)
+        oggi = date.today()
+        risultato = {"partita_iva": "01234567890", "totale_de_minimis": 1500.0,
+                     "aiuti_trovati": [{"data_concessione": "01/02/2024", "importo": 1500.0}]}
+
+        assert cache.leggi("01234567890", oggi) is None
+        assert cache.salva("01234567890", oggi, risultato)
+        letto = cache.leggi("01234567890", oggi)
+        assert letto["totale_de_minimis"] == 1500.0 and letto["da_cache"]
+
+        assert not cache.salva("09876543210", oggi, {"errore": "timeout"})
+        assert cache.leggi("09876543210", oggi) is None
+
+        # Parziali e vuoti non confermati non finiscono in cache
+        assert not cache.salva("09876543210", oggi, {**risultato, "copertura_completa": False})
+        assert not cache.salva("09876543210", oggi, {"aiuti_trovati": [], "totale_de_minimis": 0})
+        assert cache.salva("09876543210", oggi, {"aiuti_trovati": [], "totale_de_minimis": 0, "ricerca_confermata": True})
+
+        cache.ttl_secondi = -1
+        assert cache.leggi("01234567890", oggi) is None
+        assert cache.invalida("01234567890") == 1
+    print("✅ test_cache OK")
+
+
+if __name__ == "__main__":
+    test_cache()
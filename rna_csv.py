@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Lettura dell'export CSV RNA ("SCARICA CSV")
+===========================================
+
+Componente unico usato da tutti i fallback CSV (Playwright sync e async, client HTTP):
+- delimitatore rilevato automaticamente (';' o ',')
+- lettura diretta dal file del download Playwright o dai byte della risposta,
+  senza file temporanei né conversione in stringa
+- date e importi in formato italiano convertiti in blocco con pandas/numpy;
+  fallback riga per riga con il modulo csv se pandas non è disponibile
+"""
+
+from datetime import datetime
+import csv
+import io
+import re
+
+try:
+    import numpy as np
+    import pandas as pd
+    PANDAS_DISPONIBILE = True
+except ImportError:
+    PANDAS_DISPONIBILE = False
+
+
+# Importo: "€ 1.234,56", "1234,56", "1.234" (migliaia) oppure "1234.56" (decimali col punto)
+PATTERN_IMPORTO_IT = r"(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?"
+PATTERN_IMPORTO_PUNTO = r"^\D*?(\d+)\.(\d{1,2})\D*$"
+
+
+def _sniff_delimitatore(campione: str) -> str:
+    try:
+        return csv.Sniffer().sniff(campione, delimiters=";,").delimiter
+    except csv.Error:
+        return ";"
+
+
+def _indici_colonne(headers: list[str]) -> tuple[int, int, int]:
+    """Indici di Elemento Aiuto, Data Concessione e Titolo (-1 se assente)"""
+    headers_low = [h.strip().strip('"').lstrip("﻿").strip().lower() for h in headers]
+    idx_importo = next((i for i, h in enumerate(headers_low) if "elemento aiuto" in h), -1)
+    idx_data = next((i for i, h in enumerate(headers_low) if "data concessione" in h), -1)
+    idx_titolo = next((i for i, h in enumerate(headers_low) if "titolo" in h), -1)
+    if idx_importo == -1 or idx_data == -1:
+        raise ValueError("CSV RNA senza colonne 'Elemento Aiuto'/'Data Concessione'")
+    return idx_importo, idx_data, idx_titolo
+
+
+def _importi_vettoriali(testi: "pd.Series") -> "np.ndarray":
+    """Converte in blocco una colonna di importi testuali in float (NaN se non interpretabili)"""
+    testi = testi.fillna("").astype(str)
+    punto = testi.str.extract(PATTERN_IMPORTO_PUNTO)
+    italiano = testi.str.extract(PATTERN_IMPORTO_IT)
+    interi = punto[0].fillna(italiano[0].str.replace(".", "", regex=False))
+    decimali = punto[1].fillna(italiano[1]).fillna("0")
+    return pd.to_numeric(interi + "." + decimali, errors="coerce").to_numpy()
+
+
+def _aiuti_pandas(sorgente, delimitatore: str, limite: datetime) -> list[dict]:
+    df = pd.read_csv(sorgente, sep=delimitatore, dtype=str, keep_default_na=False,
+                     encoding="utf-8", encoding_errors="ignore", on_bad_lines="skip")
+    idx_importo, idx_data, idx_titolo = _indici_colonne(list(df.columns))
+
+    date_txt = df.iloc[:, idx_data].str.strip()
+    date = pd.to_datetime(date_txt, format="%d/%m/%Y", errors="coerce")
+    importi = _importi_vettoriali(df.iloc[:, idx_importo])
+    validi = (date >= limite).to_numpy() & (importi > 0)
+
+    titoli = df.iloc[:, idx_titolo].str.strip().to_numpy() if idx_titolo >= 0 else np.full(len(df), "", dtype=object)
+    return [
+        {"data_concessione": d, "importo": float(i), "titolo_misura": t, "data": d}
+        for d, i, t in zip(date_txt.to_numpy()[validi], importi[validi], titoli[validi])
+    ]
+
+
+def _aiuti_csv_modulo(testo: str, delimitatore: str, limite: datetime) -> list[dict]:
+    """Fallback senza pandas: stessa logica riga per riga"""
+    reader = csv.reader(io.StringIO(testo), delimiter=delimitatore)
+    idx_importo, idx_data, idx_titolo = _indici_colonne(next(reader, []))
+    aiuti = []
+    for row in reader:
+        if not row or idx_importo >= len(row) or idx_data >= len(row):
+            continue
+        data_txt = row[idx_data].strip()
+        try:
+            if datetime.strptime(data_txt, "%d/%m/%Y") < limite:
+                continue
+        except ValueError:
+            continue
+        testo_importo = row[idx_importo]
+        m = re.match(PATTERN_IMPORTO_PUNTO, testo_importo)
+        if m:
+            interi, decimali = m.groups()
+        else:
+            m = re.search(PATTERN_IMPORTO_IT, testo_importo)
+            if not m:
+                continue
+            interi, decimali = m.group(1).replace(".", ""), m.group(2)
+        importo = float(f"{interi}.{decimali or '0'}")
+        if importo <= 0:
+            continue
+        aiuti.append({
+            "data_concessione": data_txt,
+            "importo": importo,
+            "titolo_misura": row[idx_titolo].strip() if 0 <= idx_titolo < len(row) else "",
+            "data": data_txt,
+        })
+    return aiuti
+
+
+def aiuti_da_csv(dati, limite: datetime) -> list[dict]:
+    """
+    Aiuti De Minimis concessi da limite in poi, dall'export CSV RNA.
+
+    Args:
+        dati: bytes, str o file binario aperto (es. il file di un download Playwright)
+        limite (datetime): Data minima di concessione (inizio triennio)
+
+    Raises:
+        ValueError: se mancano le colonne Elemento Aiuto / Data Concessione
+    """
+    if isinstance(dati, str):
+        dati = dati.encode("utf-8")
+    if isinstance(dati, (bytes, bytearray)):
+        dati = io.BytesIO(dati)
+    campione = dati.read(4096)
+    dati.seek(0)
+    delimitatore = _sniff_delimitatore(campione.decode("utf-8", errors="ignore"))
+
+    if PANDAS_DISPONIBILE:
+        return _aiuti_pandas(dati, delimitatore, limite)
+    return _aiuti_csv_modulo(dati.read().decode("utf-8", errors="ignore"), delimitatore, limite)
+
+
+def aiuti_da_file(percorso: str, limite: datetime) -> list[dict]:
+    """Come aiuti_da_csv, leggendo il file in streaming (es. download.path() di Playwright)"""
+    with open(percorso, "rb") as f:
+        return aiuti_da_csv(f, limite)
+
+
+def test_csv():
+    """Stesso risultato con pandas e con il modulo csv, con entrambi i delimitatori"""
+    limite = datetime(2023, 1, 1)
+    righe = [
+        ("Titolo Misura", "Data Concessione", "Elemento Aiuto"),
+        ("Misura A", "15/03/2024", "€ 1.234,56"),
+        ("Misura B", "01/01/2020", "€ 999,00"),
+        ("Misura C", "02/02/2025", "2500.5"),
+        ("Misura D", "data errata", "€ 10,00"),
+        ("Misura E", "03/03/2025", "€ 0,00"),
+    ]
+    for delimitatore in (";", ","):
+        testo = "\n".join(delimitatore.join(f'"{c}"' for c in r) for r in righe)
+        attesi = [("15/03/2024", 1234.56, "Misura A"), ("02/02/2025", 2500.5, "Misura C")]
+        for risultato in (aiuti_da_csv(testo, limite),
+                          _aiuti_csv_modulo(testo, _sniff_delimitatore(testo), limite)):
+            assert [(a["data"], a["importo"], a["titolo_misura"]) for a in risultato] == attesi, risultato
+
+    if PANDAS_DISPONIBILE:
+        import time
+        grande = "Data Concessione;Elemento Aiuto\n" + "01/06/2024;€ 1.000,00\n" * 20000
+        inizio = time.time()
+        assert len(aiuti_da_csv(grande, limite)) == 20000
+        print(f"   20.000 righe in {(time.time() - inizio) * 1000:.0f} ms")
+    print("✅ test_csv OK")
+
+
+if __name__ == "__main__":
+    test_csv()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Deduplica degli aiuti RNA
+=========================
+
+Indice hash alimentato man mano che gli aiuti vengono estratti (pagine
+DataTables, strategie JS/regex/CSV, risposte di rete, archivio OpenData):
+ogni aiuto già visto viene scartato in O(1) e contato in duplicati_rimossi.
+
+Chiavi:
+- COR (codice univoco della concessione) quando presente
+- altrimenti (CF, data concessione ISO, importo in centesimi, titolo normalizzato);
+  un titolo vuoto vale solo come titolo vuoto, non come jolly
+
+Senza COR due concessioni identiche sono indistinguibili: la molteplicità di
+una stessa fonte (una chiamata a filtra, es. una pagina o un CSV) viene
+conservata e tra fonti diverse si tiene il massimo delle occorrenze. Un aiuto
+con COR nuovo si abbina prima a un aiuto senza COR già visto con la stessa
+chiave (stessa concessione da un'altra fonte); due COR diversi restano distinti.
+"""
+
+from datetime import datetime
+import re
+import unicodedata
+
+
+def normalizza_titolo(titolo: str) -> str:
+    """Minuscolo, senza accenti, punteggiatura e spazi multipli; "N/A" diventa vuoto"""
+    testo = unicodedata.normalize("NFKD", str(titolo or "")).encode("ascii", "ignore").decode().lower()
+    testo = re.sub(r"[^a-z0-9]+", " ", testo).strip()
+    return "" if testo in ("n a", "na") else testo
+
+
+def _data_iso(aiuto: dict) -> str:
+    testo = str(aiuto.get("data_concessione") or aiuto.get("data") or "").strip()[:10]
+    try:
+        return datetime.strptime(testo, "%d/%m/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return testo
+
+
+class IndiceDeduplicaAiuti:
+    """Indice degli aiuti già visti, da alimentare riga per riga durante l'estrazione"""
+
+    def __init__(self):
+        self._cor = set()
+        # (cf, data ISO, centesimi, titolo normalizzato) -> COR accettati / aiuti senza COR non abbinati
+        self._cor_per_chiave = {}
+        self._senza_cor = {}
+        # (fonte, chiave) -> occorrenze viste in quella fonte
+        self._occorrenze = {}
+        self.aggiunti = 0
+        self.duplicati_rimossi = 0
+
+    def aggiungi(self, aiuto: dict, cf: str = None, fonte=None) -> bool:
+        """
+        Registra un aiuto.
+
+        Args:
+            aiuto (dict): Aiuto nel formato di calcola_deminimis
+            cf (str): Codice fiscale del beneficiario (default aiuto["societa_cf"])
+            fonte: Identifica la fonte (pagina, CSV, archivio): aiuti identici senza COR
+                della stessa fonte sono concessioni distinte. None: fonte a sé
+
+        Returns:
+            bool: True se l'aiuto è nuovo, False se duplicato
+        """
+        try:
+            centesimi = int(round(float(aiuto.get("importo") or 0) * 100))
+        except (TypeError, ValueError):
+            centesimi = 0
+        chiave = ((cf or aiuto.get("societa_cf") or "").strip().upper(), _data_iso(aiuto), centesimi,
+                  normalizza_titolo(aiuto.get("titolo_misura")))
+        cor = str(aiuto.get("cor") or "").strip()
+        fonte = object() if fonte is None else fonte
+        occorrenza = self._occorrenze.get((fonte, chiave), 0) + 1
+        self._occorrenze[(fonte, chiave)] = occorrenza
+
+        if cor:
+            duplicato = cor in self._cor
+            if not duplicato:
+                self._cor.add(cor)
+                self._cor_per_chiave[chiave] = self._cor_per_chiave.get(chiave, 0) + 1
+                if self._senza_cor.get(chiave):
+                    # Stessa concessione già vista senza COR: ora identificata
+                    self._senza_cor[chiave] -= 1
+                    duplicato = True
+        else:
+            accettati = self._cor_per_chiave.get(chiave, 0) + self._senza_cor.get(chiave, 0)
+            duplicato = occorrenza <= accettati
+            if not duplicato:
+                self._senza_cor[chiave] = self._senza_cor.get(chiave, 0) + 1
+
+        if duplicato:
+            self.duplicati_rimossi += 1
+            return False
+        self.aggiunti += 1
+        return True
+
+    def filtra(self, aiuti: list[dict], cf: str = None, fonte=None) -> list[dict]:
+        """Restituisce solo gli aiuti non ancora visti (registrandoli); ogni chiamata è una fonte"""
+        fonte = object() if fonte is None else fonte
+        return [a for a in aiuti if self.aggiungi(a, cf, fonte)]
+
+
+def test_deduplica():
+    indice = IndiceDeduplicaAiuti()
+    a = {"data_concessione": "01/02/2025", "importo": 1000.0, "titolo_misura": "Bando Export"}
+    assert indice.filtra([a], "X") == [a]
+    # Stessa riga ripetuta tra due pagine
+    assert indice.filtra([dict(a)], "X") == []
+    # Riga senza titolo: non è un jolly, aiuto distinto
+    assert indice.aggiungi({"data_concessione": "01/02/2025", "importo": 1000.0, "titolo_misura": ""}, "X")
+    # Stesso aiuto dall'archivio OpenData (ISO, con COR, titolo formattato diversamente)
+    assert not indice.aggiungi({"data_concessione": "2025-02-01", "importo": 1000, "titolo_misura": "BANDO  EXPORT.", "cor": "77"}, "X")
+    # Altra società, altro titolo, altro importo: aiuti distinti
+    assert indice.aggiungi(a, "Y")
+    assert indice.aggiungi({"data_concessione": "01/02/2025", "importo": 1000.0, "titolo_misura": "Altro"}, "X")
+    assert indice.aggiungi({"data_concessione": "01/02/2025", "importo": 1000.01, "titolo_misura": "Bando Export"}, "X")
+    assert indice.duplicati_rimossi == 2 and indice.aggiunti == 5
+
+    # Due concessioni identiche ma con COR diversi restano distinte
+    indice_cor = IndiceDeduplicaAiuti()
+    assert indice_cor.aggiungi({"data_concessione": "2024-05-05", "importo": 50, "cor": "1"}, "Z")
+    assert indice_cor.aggiungi({"data_concessione": "2024-05-05", "importo": 50, "cor": "2"}, "Z")
+    assert not indice_cor.aggiungi({"data_concessione": "2024-05-05", "importo": 50, "cor": "2"}, "Z")
+
+    # Senza COR: molteplicità conservata nella fonte, massimo tra fonti
+    b = {"data_concessione": "03/03/2024", "importo": 200.0, "titolo_misura": "Voucher"}
+    indice_molti = IndiceDeduplicaAiuti()
+    assert len(indice_molti.filtra([b, dict(b)], "W")) == 2
+    assert len(indice_molti.filtra([dict(b), dict(b), dict(b)], "W")) == 1
+    # Stesse concessioni dall'archivio con COR: abbinate alle tre già viste
+    con_cor = [{**b, "data_concessione": "2024-03-03", "cor": str(c)} for c in (10, 11, 12, 13)]
+    assert len(indice_molti.filtra(con_cor, "W")) == 1
+    print("✅ test_deduplica OK")
+
+
+if __name__ == "__main__":
+    test_deduplica()
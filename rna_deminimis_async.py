@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+RNA De Minimis - motore asyncio (playwright.async_api)
+======================================================
+
+Alternativa al flusso sync di rna_deminimis_playwright: un solo browser e un
+solo contesto su un event loop, una pagina per ricerca, concorrenza limitata
+da un semaforo. Decine di ricerche vengono così multiplexate su un thread e un
+browser invece di un thread e un browser per ricerca.
+
+Costanti JS e parser sono condivisi con il flusso sync (snapshot tabelle,
+risposte di rete, strategie di estrazione).
+
+Uso async:
+    motore = MotoreRNAAsync()
+    risultato = await motore.calcola_deminimis("01234567890")
+
+Uso sync (façade su un event loop in un thread dedicato, usata da RNACalculator
+con RNA_PLAYWRIGHT_ASYNC=1):
+    get_motore_sync().calcola_deminimis("01234567890")
+
+Configurazione via variabili d'ambiente:
+- RNA_ASYNC_CONCORRENZA (default 8): pagine contemporanee nel browser
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright
+
+from browser_pool import CHROMIUM_ARGS
+from playwright_risorse import applica_profilo_async
+from rna_csv import aiuti_da_file
+from rna_deduplica import IndiceDeduplicaAiuti
+from rna_strategie import get_registro, esito_valido
+from rna_deminimis_playwright import (
+    JS_SNAPSHOT_TABELLE,
+    JS_TABELLA_POPOLATA,
+    JS_DATATABLES_MOSTRA_TUTTO,
+    JS_DATATABLES_INFO,
+    JS_ESITO_RICERCA,
+    JS_MARCA_FORM,
+    JS_PAGINA_AGGIORNATA,
+    TESTI_NESSUN_RISULTATO,
+    SOGLIA_DE_MINIMIS,
+    aiuti_per_header,
+    aiuti_per_posizione,
+    aiuti_per_regex,
+    costruisci_risultato,
+    estrai_aiuti_tabella,
+    righe_dati,
+    righe_json,
+    risposta_della_ricerca,
+    seleziona_tabella_aiuti,
+    tabella_da_html,
+    tabella_da_json,
+    tabella_fuori_periodo,
+    testo_tabella,
+)
+
+
+# Attende che la prima riga della tabella cambi dopo un cambio pagina DataTables
+JS_PRIMA_RIGA_CAMBIATA = """
+(prima) => {
+  const t = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
+  const r = t && t.querySelector('tbody tr');
+  return !!r && r.innerText !== prima;
+}
+"""
+
+JS_PRIMA_RIGA = """
+() => {
+  const t = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
+  const r = t && t.querySelector('tbody tr');
+  return r ? r.innerText : '';
+}
+"""
+
+
+class MotoreRNAAsync:
+    """Ricerche RNA su un browser condiviso con pagine concorrenti (asyncio)"""
+
+    def __init__(self, headless: bool = True, concorrenza: int = None,
+                 url: str = "https://www.rna.gov.it/trasparenza/aiuti"):
+        """
+        Args:
+            headless (bool): Se True, browser in background
+            concorrenza (int): Pagine contemporanee (default RNA_ASYNC_CONCORRENZA o 8)
+            url (str): Pagina "Trasparenza aiuti" RNA
+        """
+        self.headless = headless
+        self.url = url
+        self.concorrenza = concorrenza or int(os.environ.get("RNA_ASYNC_CONCORRENZA", "8"))
+        self._semaforo = asyncio.Semaphore(self.concorrenza)
+        self._avvio_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    async def avvia(self):
+        """Lancia browser e contesto al primo uso (o dopo un crash)"""
+        async with self._avvio_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._browser is not None:
+                print("⚠️ Browser async RNA non più connesso, rilancio...")
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch(headless=self.headless, args=CHROMIUM_ARGS)
+            self._context = await self._browser.new_context()
+            await applica_profilo_async(self._context, "rna")
+            print(f"✅ Browser Chromium lanciato con successo (RNA async, concorrenza {self.concorrenza})")
+
+    async def chiudi(self):
+        """Chiude browser e Playwright"""
+        async with self._avvio_lock:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+            if self._playwright is not None:
+                await self._playwright.stop()
+            self._browser = self._context = self._playwright = None
+
+    async def calcola_deminimis(self, partita_iva: str, oggi: datetime = None, dal: datetime = None) -> dict:
+        """
+        Stesso dict risultato di RNACalculator.calcola_deminimis (motore "playwright-async").
+
+        Args:
+            dal (datetime): Se indicato, cerca solo gli aiuti concessi da questa data
+
+        Raises:
+            Exception: errori Playwright (timeout, selettori), gestiti dal chiamante
+        """
+        oggi = oggi or datetime.now()
+        await self.avvia()
+        async with self._semaforo:
+            page = await self._context.new_page()
+            try:
+                return await self._calcola_su_pagina(page, partita_iva, oggi, dal)
+            finally:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+    async def calcola_batch(self, partite_iva: list[str], oggi: datetime = None) -> list[dict]:
+        """Più ricerche in parallelo (entro il semaforo); errori restituiti come dict con "errore" """
+        oggi = oggi or datetime.now()
+        esiti = await asyncio.gather(
+            *(self.calcola_deminimis(cf, oggi) for cf in partite_iva), return_exceptions=True
+        )
+        risultati = []
+        for cf, esito in zip(partite_iva, esiti):
+            if isinstance(esito, Exception):
+                esito = {
+                    "errore": f"Errore Playwright: {esito}",
+                    "partita_iva": cf,
+                    "totale_de_minimis": 0.0,
+                    "numero_aiuti": 0,
+                    "aiuti_trovati": [],
+                    "margine_rimanente": SOGLIA_DE_MINIMIS,
+                    "data_ricerca": oggi.strftime("%d/%m/%Y %H:%M"),
+                }
+            risultati.append(esito)
+        return risultati
+
+    async def _calcola_su_pagina(self, page, partita_iva: str, oggi: datetime, dal: datetime = None) -> dict:
+        tre_anni_fa = oggi - timedelta(days=3 * 365)
+        if dal:
+            tre_anni_fa = max(tre_anni_fa, dal)
+
+        await page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
+        try:
+            cookie_btn = page.locator("xpath=//button[contains(., 'Accett') or contains(., 'accett') or contains(., 'OK')]").first
+            if await cookie_btn.is_visible():
+                await cookie_btn.click()
+        except Exception:
+            pass
+        # Ricarica per mostrare il form, come nel flusso sync
+        await page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
+
+        await page.locator("input[name='cfBen']").fill(partita_iva)
+        await page.select_option("select[name='tipp']", label="De Minimis")
+        inizio = dal or oggi - timedelta(days=6 * 365)
+        try:
+            await page.fill("input[name='annoc']", inizio.strftime('%d/%m/%Y'))
+            await page.fill("input[name='annoc2']", oggi.strftime('%d/%m/%Y'))
+        except Exception:
+            try:
+                await page.fill("input[name='annoc']", inizio.strftime('%Y-%m-%d'))
+                await page.fill("input[name='annoc2']", oggi.strftime('%Y-%m-%d'))
+            except Exception:
+                pass
+
+        # Invio con intercettazione delle risposte di rete
+        risposte = []
+        gestore_risposte = risposte.append
+        page.on("response", gestore_risposte)
+        try:
+            try:
+                await page.evaluate(JS_MARCA_FORM)
+            except Exception:
+                pass
+            host = urlparse(self.url).netloc
+            risposta_ricerca = None
+            try:
+                # Solo dopo la risposta alla ricerca stessa il messaggio di nessun risultato è affidabile
+                async with page.expect_response(lambda r: risposta_della_ricerca(r, host), timeout=60000) as info_ricerca:
+                    await page.locator("xpath=//input[@type='submit'] | //button[@type='submit']").first.click()
+                risposta_ricerca = await info_ricerca.value
+            except Exception as e:
+                print(f"⚠️ RNA async: risposta alla ricerca non intercettata ({e}), esito vuoto non accettato")
+            tabella_rete, completa_rete, esito_dom = await self._attendi_risultati(page, risposte, risposta_ricerca)
+        finally:
+            page.remove_listener("response", gestore_risposte)
+        has_euro = esito_dom == "risultati"
+
+        if esito_dom == "vuoto":
+            risultato = costruisci_risultato(partita_iva, [], oggi, pagine=1)
+            risultato["motore"] = "playwright-async"
+            risultato["ricerca_confermata"] = True
+            return risultato
+
+        if tabella_rete is not None and completa_rete:
+            indice = IndiceDeduplicaAiuti()
+            aiuti = indice.filtra(estrai_aiuti_tabella(tabella_rete, tre_anni_fa)[0], partita_iva)
+            risultato = costruisci_risultato(partita_iva, aiuti, oggi, pagine=1,
+                                             duplicati_rimossi=indice.duplicati_rimossi)
+            risultato["motore"] = "playwright-async-rete"
+            risultato["ricerca_confermata"] = True
+            return risultato
+        if tabella_rete is not None:
+            try:
+                await page.wait_for_function(JS_TABELLA_POPOLATA, timeout=20000)
+                has_euro = True
+            except Exception:
+                pass
+
+        # Tabella DOM: tutte le righe in una pagina se DataTables lo consente
+        tutte_le_righe = await self._mostra_tutte_le_righe(page)
+        max_pagine = int(os.environ.get("RNA_MAX_PAGINE", "10"))
+        tutti_aiuti = []
+        indice = IndiceDeduplicaAiuti()
+        date_vecchie = [0]
+        pagina = 1
+        while pagina <= max_pagine:
+            aiuti, continua = await self._estrai_dalla_pagina(page, tre_anni_fa, date_vecchie, has_euro)
+            tutti_aiuti.extend(indice.filtra(aiuti, partita_iva))
+            if not continua or tutte_le_righe:
+                break
+            if not await self._pagina_successiva(page):
+                break
+            pagina += 1
+
+        copertura_completa = pagina <= max_pagine
+        if not copertura_completa:
+            pagina = max_pagine
+            print(f"⚠️ RNA async: lette solo le prime {max_pagine} pagine per {partita_iva}, risultato parziale")
+
+        if not tutti_aiuti and has_euro:
+            try:
+                tutti_aiuti = indice.filtra(await self._aiuti_da_csv(page, tre_anni_fa), partita_iva)
+            except Exception as e:
+                print(f"❌ Errore fallback CSV (async): {e}")
+
+        risultato = costruisci_risultato(partita_iva, tutti_aiuti, oggi, pagine=pagina, copertura_completa=copertura_completa,
+                                         duplicati_rimossi=indice.duplicati_rimossi)
+        risultato["motore"] = "playwright-async"
+        risultato["ricerca_confermata"] = has_euro or tabella_rete is not None
+        return risultato
+
+    async def _attendi_risultati(self, page, risposte: list, risposta_ricerca=None,
+                                 timeout_ms: int = 60000) -> tuple[dict | None, bool, str]:
+        """Come RNACalculator._attendi_risultati: prima risposta utile, tabella DOM popolata o nessun risultato"""
+        host = urlparse(self.url).netloc
+        lette = 0
+        scadenza = time.time() + timeout_ms / 1000
+        while time.time() < scadenza:
+            while lette < len(risposte):
+                risposta = risposte[lette]
+                tabella, completa = await self._tabella_da_risposta(page, risposta, host)
+                lette += 1
+                if tabella is not None:
+                    return tabella, completa, ""
+            try:
+                esito = await page.evaluate(JS_ESITO_RICERCA, TESTI_NESSUN_RISULTATO)
+                if esito == "risultati":
+                    return None, False, esito
+                if esito == "vuoto" and risposta_ricerca is not None and await page.evaluate(JS_PAGINA_AGGIORNATA):
+                    return None, False, esito
+            except Exception:
+                pass
+            await asyncio.sleep(0.25)
+        return None, False, ""
+
+    async def _tabella_da_risposta(self, page, risposta, host: str) -> tuple[dict | None, bool]:
+        try:
+            if risposta.status != 200 or risposta.request.resource_type not in ("xhr", "fetch", "document"):
+                return None, False
+            if urlparse(risposta.url).netloc != host:
+                return None, False
+            tipo = (risposta.headers.get("content-type") or "").lower()
+
+            if "json" in tipo:
+                dati = await risposta.json()
+                righe, totale = righe_json(dati)
+                if righe is None:
+                    return None, False
+                headers_dom = None
+                if righe and not isinstance(righe[0], dict):
+                    tabella_dom = seleziona_tabella_aiuti(await page.evaluate(JS_SNAPSHOT_TABELLE))
+                    headers_dom = tabella_dom["headers"] if tabella_dom else []
+                tabella, completa = tabella_da_json(dati, headers_dom)
+                if not righe:
+                    return (tabella, completa) if totale == 0 else (None, False)
+            elif "html" in tipo:
+                tabella, completa = tabella_da_html(await risposta.text())
+                if not tabella or not righe_dati(tabella):
+                    return None, False
+            else:
+                return None, False
+
+            if seleziona_tabella_aiuti([tabella]) is None:
+                return None, False
+            return tabella, completa
+        except Exception:
+            return None, False
+
+    async def _mostra_tutte_le_righe(self, page) -> bool:
+        try:
+            if not await page.evaluate(JS_DATATABLES_MOSTRA_TUTTO):
+                return False
+            await page.wait_for_function("() => window.__rnaDrawCompletato === true", timeout=30000)
+            info = await page.evaluate(JS_DATATABLES_INFO)
+        except Exception:
+            return False
+        return info["righe"] >= info["totale"]
+
+    async def _estrai_dalla_pagina(self, page, limite: datetime, date_vecchie: list[int],
+                                   has_euro: bool = False) -> tuple[list[dict], bool]:
+        """Snapshot della pagina corrente letto con le strategie nell'ordine del registro adattivo"""
+        try:
+            tabella = seleziona_tabella_aiuti(await page.evaluate(JS_SNAPSHOT_TABELLE))
+            if not tabella or not righe_dati(tabella):
+                return [], False
+            if "€" not in testo_tabella(tabella):
+                try:
+                    await page.wait_for_function(JS_TABELLA_POPOLATA, timeout=10000)
+                    tabella = seleziona_tabella_aiuti(await page.evaluate(JS_SNAPSHOT_TABELLE)) or tabella
+                except Exception:
+                    pass
+        except Exception:
+            # Errore transitorio dello snapshot: come il motore sincrono, la paginazione prosegue
+            return [], True
+
+        registro = get_registro()
+        vecchie_iniziali = date_vecchie[0]
+        fuori_periodo = tabella_fuori_periodo(tabella, limite)
+        for nome in registro.ordine():
+            if nome == "csv" and not has_euro:
+                continue
+            date_vecchie[0] = vecchie_iniziali
+            inizio = time.time()
+            try:
+                if nome == "header":
+                    aiuti, continua = aiuti_per_header(tabella, limite, date_vecchie)
+                elif nome == "regex":
+                    aiuti, continua = aiuti_per_regex(tabella, limite), True
+                elif nome == "csv":
+                    # Il CSV contiene l'intero risultato: continua=False ferma la paginazione
+                    aiuti, continua = await self._aiuti_da_csv(page, limite), False
+                else:
+                    aiuti, continua = aiuti_per_posizione(tabella, limite, date_vecchie)
+                # CSV letto o righe tutte fuori periodo: zero aiuti è un esito valido
+                letta = nome == "csv" or fuori_periodo
+            except Exception as e:
+                print(f"❌ Strategia {nome} non riuscita (async): {e}")
+                aiuti, continua, letta = [], True, False
+            riuscita = esito_valido(aiuti, continua, letta)
+            registro.registra(nome, riuscita, time.time() - inizio)
+            if riuscita:
+                return aiuti, continua
+        return [], True
+
+    async def _pagina_successiva(self, page) -> bool:
+        """Clic su "successiva" DataTables e attesa del ridisegno; False se non ci sono altre pagine"""
+        try:
+            next_btn = page.locator("a.paginate_button.next")
+            if not await next_btn.is_visible() or "disabled" in (await next_btn.get_attribute("class") or ""):
+                return False
+            prima = await page.evaluate(JS_PRIMA_RIGA)
+            await next_btn.click()
+            await page.wait_for_function(JS_PRIMA_RIGA_CAMBIATA, arg=prima, timeout=15000)
+            return True
+        except Exception:
+            return False
+
+    async def _aiuti_da_csv(self, page, limite: datetime) -> list[dict]:
+        """Come RNACalculator._aiuti_da_csv_scaricato: eccezione se il pulsante manca o il file non si legge"""
+        btn = page.locator("xpath=//a[contains(translate(., 'abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'), 'SCARICA CSV')]").first
+        if not await btn.is_visible():
+            raise Exception('Scarica CSV non trovato')
+        async with page.expect_download() as dl_info:
+            await btn.click()
+        download = await dl_info.value
+        # Parsing (pandas) fuori dall'event loop: non blocca le ricerche concorrenti
+        return await asyncio.to_thread(aiuti_da_file, await download.path(), limite)
+
+
+class MotoreRNAAsyncSync:
+    """Façade sincrona: esegue le coroutine del motore su un event loop in un thread dedicato"""
+
+    def __init__(self, headless: bool = True, concorrenza: int = None):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="rna-async-loop", daemon=True)
+        self._thread.start()
+        # Il motore (semaforo, lock) va creato dentro il proprio event loop
+        self.motore = self._esegui(self._crea_motore(headless, concorrenza))
+
+    @staticmethod
+    async def _crea_motore(headless, concorrenza):
+        return MotoreRNAAsync(headless=headless, concorrenza=concorrenza)
+
+    def _esegui(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def calcola_deminimis(self, partita_iva: str, oggi: datetime = None, dal: datetime = None) -> dict:
+        """Thread-safe: più thread possono chiamarla insieme, le pagine condividono lo stesso browser"""
+        return self._esegui(self.motore.calcola_deminimis(partita_iva, oggi, dal))
+
+    def calcola_batch(self, partite_iva: list[str], oggi: datetime = None) -> list[dict]:
+        return self._esegui(self.motore.calcola_batch(partite_iva, oggi))
+
+    def chiudi(self):
+        if not self._loop.is_running():
+            return
+        try:
+            self._esegui(self.motore.chiudi())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+
+_motori_sync = {}
+_motori_lock = threading.Lock()
+
+
+def get_motore_sync(headless: bool = True) -> MotoreRNAAsyncSync:
+    """Façade sync condivisa per processo (una per modalità headless)"""
+    with _motori_lock:
+        motore = _motori_sync.get(headless)
+        if motore is None:
+            motore = MotoreRNAAsyncSync(headless=headless)
+            _motori_sync[headless] = motore
+        return motore
+
+
+def chiudi_tutti():
+    """Chiude i motori condivisi (registrata con atexit)"""
+    with _motori_lock:
+        motori = list(_motori_sync.values())
+        _motori_sync.clear()
+    for motore in motori:
+        try:
+            motore.chiudi()
+        except Exception:
+            pass
+
+
+atexit.register(chiudi_tutti)
+
+
+if __name__ == "__main__":
+    import sys
+    cfs = sys.argv[1:] or ["03254550738"]
+
+    async def main():
+        motore = MotoreRNAAsync(headless=True)
+        try:
+            inizio = time.time()
+            for r in await motore.calcola_batch(cfs):
+                print(f"{r['partita_iva']}: {r.get('errore') or r['totale_de_minimis']}")
+            print(f"⏱️  {len(cfs)} ricerche in {time.time() - inizio:.1f}s")
+        finally:
+            await motore.chiudi()
+
+    asyncio.run(main())
@@ -4,12 +4,18 @@ RNA De Minimis Calculator (Playwright)
 Sostituisce Selenium/Geckodriver con Playwright per maggiore stabilità.
 """
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import re
-import io
-import csv
 import os
+import time
+from html import unescape
+from urllib.parse import urlparse
 from playwright.sync_api import sync_playwright
+from browser_pool import get_pool, CHROMIUM_ARGS
+from playwright_risorse import applica_profilo
+from rna_csv import aiuti_da_file
+from rna_deduplica import IndiceDeduplicaAiuti
+from rna_strategie import get_registro, esito_valido
 
 # Import sistema alert email
 try:
@@ -20,553 +26,997 @@ except ImportError:
     print("⚠️ Modulo email_alert non disponibile - alert disabilitati")
 
 
+SOGLIA_DE_MINIMIS = 300000.0
+
+
+def parse_importo_it(text: str) -> float | None:
+    """Converte un importo in formato italiano (es. "€ 1.234,56") in float, None se assente o nullo"""
+    if not text:
+        return None
+    match = re.search(r"([0-9]{1,3}(?:\.[0-9]{3})*(?:,[0-9]{2}))", text)
+    if not match:
+        return None
+    value = match.group(1).replace(".", "").replace(",", ".")
+    try:
+        amount = float(value)
+        return amount if amount > 0 else None
+    except ValueError:
+        return None
+
+
+def costruisci_risultato(partita_iva: str, aiuti: list[dict], oggi: datetime, pagine: int = 1,
+                         copertura_completa: bool = True, duplicati_rimossi: int = 0) -> dict:
+    """
+    Costruisce il dict risultato standard di calcola_deminimis a partire dagli aiuti nel triennio.
+    copertura_completa è False se la ricerca si è fermata prima di leggere tutte le righe RNA;
+    duplicati_rimossi conta le righe scartate dall'indice di deduplica durante l'estrazione.
+    """
+    totale = round(sum(a["importo"] for a in aiuti), 2)
+    soglia = SOGLIA_DE_MINIMIS
+    return {
+        "partita_iva": partita_iva,
+        "totale_de_minimis": totale,
+        "numero_aiuti": len(aiuti),
+        "aiuti_trovati": aiuti,
+        "soglia_superata": totale > soglia,
+        "margine_rimanente": round(max(0, soglia - totale), 2),
+        "soglia_limite": soglia,
+        "percentuale_utilizzata": round((totale / soglia) * 100, 1) if soglia else 0.0,
+        "data_ricerca": oggi.strftime("%d/%m/%Y %H:%M"),
+        "pagine_analizzate": pagine,
+        "copertura_completa": copertura_completa,
+        "duplicati_rimossi": duplicati_rimossi,
+    }
+
+
+def unisci_aiuti(*liste: list[dict], indice: IndiceDeduplicaAiuti = None) -> list[dict]:
+    """
+    Unisce liste di aiuti (es. storico locale + ricerca live) eliminando i doppioni
+    tramite IndiceDeduplicaAiuti (COR, oppure data, importo e titolo normalizzato).
+    Passando indice si ottiene anche il conteggio dei duplicati rimossi.
+    """
+    indice = indice or IndiceDeduplicaAiuti()
+    uniti = []
+    for aiuti in liste:
+        uniti.extend(indice.filtra(aiuti))
+    return uniti
+
+
+# Snapshot di tutte le tabelle visibili della pagina in un'unica chiamata page.evaluate:
+# le strategie di estrazione lavorano poi in Python sul risultato, senza altre IPC
+JS_SNAPSHOT_TABELLE = """
+() => Array.from(document.querySelectorAll('table'))
+  .filter(t => t.getClientRects().length > 0)
+  .map(t => {
+    const thead = t.querySelector('thead');
+    const headers = Array.from((thead || t).querySelectorAll('th')).map(th => th.innerText.trim().toLowerCase());
+    let rows = Array.from(t.querySelectorAll('tbody tr'));
+    if (!rows.length) rows = Array.from(t.querySelectorAll('tr'));
+    return {
+      id: t.id || '',
+      headers: headers,
+      righe: rows.map(tr => Array.from(tr.querySelectorAll('td')).map(td => td.innerText.trim()))
+    };
+  })
+"""
+
+# DataTables: lunghezza pagina "tutti" (-1) e segnale di fine ridisegno (anche server-side)
+JS_DATATABLES_MOSTRA_TUTTO = """
+() => {
+  const $ = window.jQuery;
+  if (!$ || !$.fn || !$.fn.dataTable) return false;
+  const tbl = document.querySelector('#trasparenzaAiuti') || document.querySelector('table.dataTable');
+  if (!tbl || !$.fn.dataTable.isDataTable(tbl)) return false;
+  const api = $(tbl).DataTable();
+  window.__rnaDrawCompletato = false;
+  api.one('draw.dt', () => { window.__rnaDrawCompletato = true; });
+  api.page.len(-1).draw(false);
+  return true;
+}
+"""
+
+JS_DATATABLES_INFO = """
+() => {
+  const $ = window.jQuery;
+  const tbl = document.querySelector('#trasparenzaAiuti') || document.querySelector('table.dataTable');
+  const api = $(tbl).DataTable();
+  const info = api.page.info();
+  return { righe: api.rows({ page: 'current' }).count(), totale: info.recordsDisplay, server_side: !!info.serverSide };
+}
+"""
+
+JS_TABELLA_POPOLATA = """
+() => {
+  const t = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
+  if (!t) return false;
+  const txt = t.innerText || '';
+  if (!txt.includes('€')) return false;
+  const body = t.querySelector('tbody');
+  if (!body) return false;
+  return body.querySelectorAll('tr').length > 0;
+}
+"""
+
+# Testi con cui RNA/DataTables segnala una ricerca senza risultati
+TESTI_NESSUN_RISULTATO = [
+    "nessun risultato",
+    "nessun dato",
+    "nessun aiuto",
+    "nessun elemento",
+    "no data available",
+]
+
+# Esito della ricerca nel DOM: "risultati" (tabella con importi), "vuoto" (cella
+# dataTables_empty o messaggio di nessun risultato) oppure "" se ancora in caricamento
+JS_ESITO_RICERCA = """
+(testi) => {
+  const elaborazione = document.querySelector('.dataTables_processing');
+  if (elaborazione && elaborazione.offsetParent !== null) return '';
+  const t = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
+  if (t && (t.innerText || '').includes('€') && t.querySelectorAll('tbody tr').length > 0) return 'risultati';
+  const vuota = document.querySelector('td.dataTables_empty');
+  if (vuota && vuota.offsetParent !== null) return 'vuoto';
+  const area = ((t || document.querySelector('main') || document.body).innerText || '').toLowerCase();
+  return testi.some(x => area.includes(x)) ? 'vuoto' : '';
+}
+"""
+
+# Marca il documento del form prima dell'invio: dopo la risposta alla ricerca
+# la pagina è aggiornata se il documento è nuovo (submit con navigazione) o se
+# DataTables ha ridisegnato la tabella (ricerca via XHR)
+JS_MARCA_FORM = """
+() => {
+  window.__rnaPaginaForm = true;
+  window.__rnaRidisegnata = false;
+  if (window.jQuery) window.jQuery(document).on('draw.dt', () => { window.__rnaRidisegnata = true; });
+}
+"""
+
+JS_PAGINA_AGGIORNATA = "() => window.__rnaPaginaForm !== true || window.__rnaRidisegnata === true"
+
+PATTERN_DATA_IT = re.compile(r"\b(\d{2}/\d{2}/\d{4})\b")
+
+
+def _data_it(testo: str) -> datetime | None:
+    try:
+        return datetime.strptime((testo or "").strip(), "%d/%m/%Y")
+    except ValueError:
+        return None
+
+
+def _indice_header(headers: list[str], predicato) -> int:
+    return next((i for i, h in enumerate(headers) if predicato(h)), -1)
+
+
+def _aiuto(data_txt: str, importo: float, titolo: str, cor: str = "") -> dict:
+    aiuto = {
+        "data_concessione": data_txt,
+        "importo": importo,
+        "titolo_misura": titolo,
+        "data": data_txt,
+    }
+    if cor:
+        aiuto["cor"] = cor
+    return aiuto
+
+
+def _indice_cor(headers: list[str]) -> int:
+    """Colonna COR (codice univoco della concessione), usata dalla deduplica"""
+    return _indice_header(headers, lambda h: h.strip() == "cor" or "codice univoco" in h)
+
+
+def _cor(celle: list[str], idx_cor: int) -> str:
+    return celle[idx_cor].strip() if 0 <= idx_cor < len(celle) else ""
+
+
+def risposta_della_ricerca(risposta, host: str) -> bool:
+    """True per la risposta RNA al submit del form: documento (navigazione) o XHR/fetch dello stesso host"""
+    try:
+        return (urlparse(risposta.url).netloc == host
+                and risposta.request.resource_type in ("document", "xhr", "fetch"))
+    except Exception:
+        return False
+
+
+def seleziona_tabella_aiuti(tabelle: list[dict]) -> dict | None:
+    """Dallo snapshot JS_SNAPSHOT_TABELLE, la tabella risultati RNA (riconosciuta dagli header)"""
+    candidate = sorted(tabelle or [], key=lambda t: t.get("id") != "trasparenzaAiuti")
+    for t in candidate:
+        header_text = " ".join(t.get("headers", []))
+        if ("elemento" in header_text and "aiuto" in header_text) or ("data" in header_text and "concessione" in header_text) or ("importo" in header_text):
+            return t
+    return None
+
+
+def righe_dati(tabella: dict) -> list[list[str]]:
+    """Righe con almeno una cella td (esclude le righe di sole intestazioni)"""
+    return [r for r in (tabella or {}).get("righe", []) if r]
+
+
+def testo_tabella(tabella: dict) -> str:
+    return "\n".join("\t".join(r) for r in righe_dati(tabella))
+
+
+def _normalizza_chiave(chiave) -> str:
+    """Nome campo JSON come intestazione ("elementoAiuto", "data_concessione" -> "elemento aiuto", "data concessione")"""
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", str(chiave)).replace("_", " ").lower().strip()
+
+
+def _testo_cella(valore, importo: bool = False) -> str:
+    """Valore di una risposta di rete come testo di cella (date in dd/mm/yyyy, importi in formato IT)"""
+    if valore is None:
+        return ""
+    if isinstance(valore, (int, float)) and not isinstance(valore, bool):
+        if importo:
+            return "€ " + f"{valore:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return str(valore)
+    testo = re.sub(r"\s+", " ", unescape(re.sub(r"<[^>]+>", " ", str(valore)))).strip()
+    iso = re.match(r"^(\d{4})-(\d{2})-(\d{2})", testo)
+    if iso:
+        return f"{iso.group(3)}/{iso.group(2)}/{iso.group(1)}"
+    return testo
+
+
+def righe_json(dati) -> tuple[list | None, int | None]:
+    """Righe e totale record da una risposta JSON DataTables (data/aaData) o da una lista"""
+    if isinstance(dati, list):
+        return dati, None
+    if not isinstance(dati, dict):
+        return None, None
+    righe = next((dati[k] for k in ("data", "aaData", "aiuti", "risultati") if isinstance(dati.get(k), list)), None)
+    totale = next((dati[k] for k in ("recordsFiltered", "iTotalDisplayRecords", "recordsTotal", "iTotalRecords") if k in dati), None)
+    try:
+        totale = int(totale) if totale is not None else None
+    except (TypeError, ValueError):
+        totale = None
+    return righe, totale
+
+
+def tabella_da_json(dati, headers_dom: list[str] = None) -> tuple[dict | None, bool]:
+    """
+    Converte la risposta JSON della tabella RNA nel formato di JS_SNAPSHOT_TABELLE.
+
+    Args:
+        headers_dom (list): Intestazioni della tabella, necessarie se le righe sono array
+
+    Returns:
+        (tabella o None, completa): completa è False se il server ha restituito solo una pagina
+    """
+    righe, totale = righe_json(dati)
+    if righe is None:
+        return None, False
+    if righe and isinstance(righe[0], dict):
+        chiavi = list(righe[0].keys())
+        headers = [_normalizza_chiave(k) for k in chiavi]
+        valori = [[r.get(k) for k in chiavi] for r in righe if isinstance(r, dict)]
+    else:
+        headers = list(headers_dom or [])
+        valori = [list(r) if isinstance(r, (list, tuple)) else [r] for r in righe]
+    colonne_importo = {i for i, h in enumerate(headers) if any(p in h for p in ("importo", "elemento", "agevolazione"))}
+    tabella = {
+        "id": "rete",
+        "headers": headers,
+        "righe": [[_testo_cella(v, i in colonne_importo) for i, v in enumerate(r)] for r in valori],
+    }
+    return tabella, totale is None or totale <= len(righe)
+
+
+def tabella_da_html(testo: str) -> tuple[dict | None, bool]:
+    """
+    Tabella aiuti da un documento o frammento HTML (formato di JS_SNAPSHOT_TABELLE).
+
+    Returns:
+        (tabella o None, completa): completa è False se il documento è paginato dal server
+            o dichiara più risultati delle righe presenti (stessi controlli di RNAHttpClient)
+    """
+    from bs4 import BeautifulSoup
+    from rna_http_client import link_pagina_successiva, paginazione_presente, totale_dichiarato
+    soup = BeautifulSoup(testo, "html.parser")
+    tabelle = []
+    for t in soup.find_all("table"):
+        thead = t.find("thead")
+        headers = [th.get_text(" ", strip=True).lower() for th in (thead or t).find_all("th")]
+        tbody = t.find("tbody")
+        righe = (tbody or t).find_all("tr")
+        tabelle.append({
+            "id": t.get("id") or "",
+            "headers": headers,
+            "righe": [[td.get_text(" ", strip=True) for td in tr.find_all("td")] for tr in righe],
+        })
+    tabella = seleziona_tabella_aiuti(tabelle)
+    if tabella is None:
+        return None, False
+    totale = totale_dichiarato(soup)
+    completa = (link_pagina_successiva(soup) is None and not paginazione_presente(soup)
+                and (totale is None or totale <= len(righe_dati(tabella))))
+    return tabella, completa
+
+
+def tabella_fuori_periodo(tabella: dict, limite: datetime) -> bool:
+    """
+    True se la tabella è stata letta (righe con data) e nessuna riga cade nel periodo:
+    zero aiuti è allora il risultato corretto per qualunque strategia, non un fallimento.
+    """
+    date_righe = []
+    for celle in righe_dati(tabella):
+        data_txt = next((m.group(1) for m in map(PATTERN_DATA_IT.search, celle) if m), "")
+        date_righe.append(_data_it(data_txt))
+    return bool(date_righe) and all(d is not None and d < limite for d in date_righe)
+
+
+def aiuti_per_header(tabella: dict, limite: datetime, date_vecchie: list[int] | None) -> tuple[list[dict], bool]:
+    """
+    Strategia principale: colonne Data Concessione / Elemento Aiuto / Titolo dagli header;
+    se un header manca cerca la prima data e la prima cella con € della riga.
+
+    date_vecchie è un contatore condiviso tra le pagine: dopo 3 aiuti consecutivi
+    più vecchi di limite restituisce continua=False (None: nessuna interruzione, per righe
+    non ordinate per data).
+    """
+    headers = tabella.get("headers", [])
+    idx_data = _indice_header(headers, lambda h: "data" in h and "concessione" in h)
+    idx_importo = _indice_header(headers, lambda h: "elemento" in h and "aiuto" in h)
+    idx_titolo = _indice_header(headers, lambda h: "titolo" in h)
+    idx_cor = _indice_cor(headers)
+
+    aiuti = []
+    for celle in righe_dati(tabella):
+        if len(celle) < 3:
+            continue
+        if 0 <= idx_data < len(celle):
+            data_txt = celle[idx_data]
+        else:
+            data_txt = next((m.group(1) for m in map(PATTERN_DATA_IT.search, celle) if m), "")
+        data_conc = _data_it(data_txt)
+        if not data_conc:
+            continue
+        if data_conc < limite:
+            if date_vecchie is not None:
+                date_vecchie[0] += 1
+                if date_vecchie[0] >= 3:
+                    return aiuti, False
+            continue
+        if date_vecchie is not None:
+            date_vecchie[0] = 0
+
+        if 0 <= idx_importo < len(celle):
+            importo_txt = celle[idx_importo]
+        else:
+            importo_txt = next((c for c in celle if "€" in c), "")
+        importo = parse_importo_it(importo_txt)
+        if not importo:
+            continue
+        titolo = celle[idx_titolo] if 0 <= idx_titolo < len(celle) else celle[2]
+        aiuti.append(_aiuto(data_txt.strip(), importo, titolo.strip() or "N/A", _cor(celle, idx_cor)))
+    return aiuti, True
+
+
+def aiuti_per_regex(tabella: dict, limite: datetime) -> list[dict]:
+    """Strategia di riserva: date e importi con € cercati nel testo della tabella e associati per posizione"""
+    testo = testo_tabella(tabella)
+    date_list = PATTERN_DATA_IT.findall(testo)
+    importi_list = re.findall(r"€\s*[0-9.]+,[0-9]{2}", testo)
+    titoli_list = [c for r in righe_dati(tabella) for c in r if 3 <= len(c) <= 100]
+    aiuti = []
+    for i in range(min(len(date_list), len(importi_list))):
+        data_conc = _data_it(date_list[i])
+        if not data_conc or data_conc < limite:
+            continue
+        importo = parse_importo_it(importi_list[i])
+        if not importo:
+            continue
+        aiuti.append(_aiuto(date_list[i], importo, titoli_list[i] if i < len(titoli_list) else "N/A"))
+    return aiuti
+
+
+def aiuti_per_posizione(tabella: dict, limite: datetime, date_vecchie: list[int] | None) -> tuple[list[dict], bool]:
+    """
+    Ultima strategia, tollerante: indici di colonna di default (data 7ª, importo ultima)
+    e ricerca di data/importo in qualunque cella della riga.
+    """
+    headers = tabella.get("headers", [])
+    data_idx = _indice_header(headers, lambda t: "data" in t and "concessione" in t)
+    importo_idx = _indice_header(headers, lambda t: ("elemento" in t and "aiuto" in t) or "importo" in t)
+    titolo_idx = _indice_header(headers, lambda t: "titolo" in t and ("misura" in t or "progetto" in t))
+    cor_idx = _indice_cor(headers)
+    if titolo_idx == -1:
+        titolo_idx = 2 if len(headers) > 2 else -1
+    if data_idx == -1:
+        data_idx = 6
+    if importo_idx == -1:
+        importo_idx = len(headers) - 1 if headers else -1
+
+    aiuti = []
+    for celle in righe_dati(tabella):
+        candidates = ([celle[data_idx]] if data_idx < len(celle) else []) + [c for c in celle if c]
+        data_txt = next((m.group(1) for m in map(PATTERN_DATA_IT.search, candidates) if m), "")
+        data_conc = _data_it(data_txt)
+        if not data_conc:
+            continue
+        if data_conc < limite:
+            if date_vecchie is not None:
+                date_vecchie[0] += 1
+                if date_vecchie[0] >= 3:
+                    return aiuti, False
+            continue
+        if date_vecchie is not None:
+            date_vecchie[0] = 0
+
+        importo = parse_importo_it(celle[importo_idx]) if 0 <= importo_idx < len(celle) else None
+        if not importo:
+            # Fallback: prima cella con simbolo euro o decimali
+            importo = next((imp for imp in (parse_importo_it(c) for c in celle if "€" in c or "," in c) if imp), None)
+        if not importo:
+            continue
+        titolo = celle[titolo_idx] if 0 <= titolo_idx < len(celle) else "N/A"
+        aiuti.append(_aiuto(data_txt, importo, titolo, _cor(celle, cor_idx)))
+    return aiuti, True
+
+
+def estrai_aiuti_tabella(tabella: dict, limite: datetime, date_vecchie: list[int] | None = None) -> tuple[list[dict], bool]:
+    """Applica in ordine le strategie per header, regex e posizione; restituisce (aiuti, continua)"""
+    aiuti, continua = aiuti_per_header(tabella, limite, date_vecchie)
+    if aiuti or not continua:
+        return aiuti, continua
+    aiuti = aiuti_per_regex(tabella, limite)
+    if aiuti:
+        return aiuti, True
+    return aiuti_per_posizione(tabella, limite, date_vecchie)
+
+
 class RNACalculator:
     """Calcolatore automatico de minimis RNA con Playwright"""
 
-    def __init__(self, headless: bool = True, slow_mo_ms: int = 0):
+    def __init__(self, headless: bool = True, slow_mo_ms: int = 0, usa_pool: bool = True, motore: str = None,
+                 playwright_async: bool = None):
+        """
+        Args:
+            headless (bool): Se True, browser in background
+            slow_mo_ms (int): Rallentamento Playwright (debug)
+            usa_pool (bool): Se True, usa il pool di browser persistenti
+            motore (str): "auto" (HTTP con fallback Playwright), "http" o "playwright".
+                Default da variabile d'ambiente RNA_MOTORE, altrimenti "auto".
+            playwright_async (bool): Se True la parte Playwright usa il motore asyncio
+                (rna_deminimis_async) invece del pool sync. Default da RNA_PLAYWRIGHT_ASYNC.
+        """
         self.headless = headless
         self.slow_mo_ms = slow_mo_ms
+        # Con il pool i browser restano aperti tra una ricerca e l'altra
+        self.usa_pool = usa_pool
+        self.motore = (motore or os.environ.get("RNA_MOTORE", "auto")).lower()
+        if playwright_async is None:
+            playwright_async = os.environ.get("RNA_PLAYWRIGHT_ASYNC", "0").lower() in ("1", "true", "si")
+        self.playwright_async = playwright_async
         self.url = "https://www.rna.gov.it/trasparenza/aiuti"
 
     def _parse_importo_it(self, text: str) -> float | None:
-        if not text:
-            return None
-        match = re.search(r"([0-9]{1,3}(?:\.[0-9]{3})*(?:,[0-9]{2}))", text)
-        if not match:
-            return None
-        value = match.group(1).replace(".", "").replace(",", ".")
-        try:
-            amount = float(value)
-            return amount if amount > 0 else None
-        except ValueError:
-            return None
-
-    def calcola_deminimis(self, partita_iva: str) -> dict:
+        return parse_importo_it(text)
+
+    def calcola_deminimis(self, partita_iva: str, force_refresh: bool = False) -> dict:
+        """
+        Args:
+            partita_iva (str): Codice fiscale / P.IVA del beneficiario
+            force_refresh (bool): Ignora la cache dei risultati (rna_cache) e ricalcola
+        """
         oggi = datetime.now()
-        tre_anni_fa = oggi - timedelta(days=3 * 365)
 
-        with sync_playwright() as p:
-            # Logging per debug Playwright su Render
-            import os
-            print(f"🔍 DEBUG Playwright:")
-            print(f"  - PLAYWRIGHT_BROWSERS_PATH: {os.environ.get('PLAYWRIGHT_BROWSERS_PATH', 'NON IMPOSTATO')}")
-            print(f"  - Headless: {self.headless}")
-            print(f"  - Chromium path: {p.chromium.executable_path if hasattr(p.chromium, 'executable_path') else 'N/A'}")
-            
-            # Configurazione browser per ambienti cloud (Render, etc.)
+        # Cache persistente: stesso CF e stessa fine finestra entro il TTL
+        cache = None
+        try:
+            from rna_cache import get_cache
+            cache = get_cache()
+            if cache and not force_refresh:
+                risultato = cache.leggi(partita_iva, oggi.date())
+                if risultato:
+                    print(f"⚡ De minimis da cache per {partita_iva} (salvato il {risultato['cache_salvato_il']})")
+                    return risultato
+        except Exception as e:
+            print(f"⚠️ Cache RNA non utilizzabile: {e}")
+            cache = None
+
+        risultato = self._calcola(partita_iva, oggi)
+
+        if cache:
             try:
-                browser = p.chromium.launch(
-                    headless=self.headless, 
-                    slow_mo=self.slow_mo_ms,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-gpu'
-                    ]
-                )
-                print("✅ Browser Chromium lanciato con successo")
+                cache.salva(partita_iva, oggi.date(), risultato)
             except Exception as e:
-                print(f"❌ ERRORE lancio browser: {str(e)}")
-                print(f"   Tipo errore: {type(e).__name__}")
-                raise
-            page = browser.new_page()
+                print(f"⚠️ Salvataggio cache RNA fallito: {e}")
+        return risultato
 
-            try:
-                page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
+    def calcola_batch(self, partite_iva: list[str], concorrenza: int = None, force_refresh: bool = False) -> list[dict]:
+        """
+        Calcola il de minimis di più società in parallelo.
 
-                # Chiudi cookie se presente
-                try:
-                    # diversi possibili testi del bottone
-                    cookie_btn = page.locator("xpath=//button[contains(., 'Accett') or contains(., 'accett') or contains(., 'OK')]")
-                    if cookie_btn.first.is_visible():
-                        cookie_btn.first.click()
-                except Exception:
-                    pass
+        Ogni CF gira in un thread: il motore HTTP procede in piena concorrenza, mentre il
+        fallback Playwright è limitato dalla dimensione del pool browser (BROWSER_POOL_DIMENSIONE).
 
-                # Ricarica per mostrare il form, come da flusso verificato
-                page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
+        Args:
+            partite_iva (list): Codici fiscali / P.IVA (i duplicati vengono calcolati una volta)
+            concorrenza (int): Ricerche contemporanee (default RNA_BATCH_CONCORRENZA o 4)
+            force_refresh (bool): Ignora la cache dei risultati
 
-                # Compila form: campo CF/P.IVA
-                cf_input = page.locator("input[name='cfBen']")
-                cf_input.fill(partita_iva)
+        Returns:
+            list: Risultati di calcola_deminimis nello stesso ordine di partite_iva
+        """
+        from concurrent.futures import ThreadPoolExecutor
 
-                # Tipo: De Minimis
-                page.select_option("select[name='tipp']", label="De Minimis")
+        unici = list(dict.fromkeys(partite_iva))
+        if not unici:
+            return []
+        concorrenza = concorrenza or int(os.environ.get("RNA_BATCH_CONCORRENZA", "4"))
+        concorrenza = max(1, min(concorrenza, len(unici)))
 
-                # Date: estendiamo a 6 anni per garantire presenza dati, filtreremo a 3 anni
-                sei_anni_fa = oggi - timedelta(days=6 * 365)
-                try:
-                    page.fill("input[name='annoc']", sei_anni_fa.strftime('%d/%m/%Y'))
-                    page.fill("input[name='annoc2']", oggi.strftime('%d/%m/%Y'))
-                except Exception:
-                    # Fallback ISO
-                    try:
-                        page.fill("input[name='annoc']", sei_anni_fa.strftime('%Y-%m-%d'))
-                        page.fill("input[name='annoc2']", oggi.strftime('%Y-%m-%d'))
-                    except Exception:
-                        pass
+        def calcola_uno(cf):
+            try:
+                return self.calcola_deminimis(cf, force_refresh=force_refresh)
+            except Exception as e:
+                return self._risultato_errore(cf, f"Errore calcolo RNA: {e}", e, datetime.now())
+
+        print(f"🚀 Batch RNA: {len(unici)} società, concorrenza {concorrenza}")
+        inizio = time.time()
+        with ThreadPoolExecutor(max_workers=concorrenza, thread_name_prefix="rna-batch") as executor:
+            risultati = dict(zip(unici, executor.map(calcola_uno, unici)))
+        print(f"✅ Batch RNA completato in {time.time() - inizio:.1f}s")
+        return [risultati[cf] for cf in partite_iva]
+
+    def _calcola(self, partita_iva: str, oggi: datetime) -> dict:
+        # Archivio OpenData locale: storico fino all'ultimo mese ingerito
+        storico = self._storico_locale(partita_iva, oggi)
+        if storico is None:
+            return self._calcola_live(partita_iva, oggi)
+
+        aiuti_locali, fine_copertura, fonte = storico
+        tolleranza = int(os.environ.get("RNA_OPENDATA_TOLLERANZA_GIORNI", "0"))
+        if fine_copertura >= (oggi - timedelta(days=tolleranza)).date():
+            print(f"📚 De minimis da {fonte} per {partita_iva}: {len(aiuti_locali)} aiuti")
+            risultato = costruisci_risultato(partita_iva, aiuti_locali, oggi, pagine=0)
+            risultato["motore"] = fonte
+            risultato["ricerca_confermata"] = True
+            return risultato
+
+        # Ricerca live solo sui giorni successivi all'ultimo mese ingerito
+        dal = datetime.combine(fine_copertura + timedelta(days=1), datetime.min.time())
+        print(f"📚 Storico locale fino al {fine_copertura.strftime('%d/%m/%Y')} "
+              f"({len(aiuti_locali)} aiuti), ricerca RNA dal {dal.strftime('%d/%m/%Y')}")
+        risultato_live = self._calcola_live(partita_iva, oggi, dal)
+        if risultato_live.get("errore"):
+            return risultato_live
+
+        # Il primo mese live può sovrapporsi all'ultimo ingerito: l'indice scarta i doppioni
+        indice = IndiceDeduplicaAiuti()
+        aiuti = unisci_aiuti(aiuti_locali, risultato_live["aiuti_trovati"], indice=indice)
+        risultato = costruisci_risultato(partita_iva, aiuti, oggi, pagine=risultato_live.get("pagine_analizzate", 1),
+                                         copertura_completa=risultato_live.get("copertura_completa", True),
+                                         duplicati_rimossi=indice.duplicati_rimossi
+                                         + risultato_live.get("duplicati_rimossi", 0))
+        risultato["motore"] = f"{fonte}+{risultato_live.get('motore', 'live')}"
+        risultato["ricerca_confermata"] = bool(aiuti) or risultato_live.get("ricerca_confermata", False)
+        risultato["storico_locale_fino_al"] = fine_copertura.strftime("%d/%m/%Y")
+        return risultato
+
+    def _calcola_live(self, partita_iva: str, oggi: datetime, dal: datetime = None) -> dict:
+        """Ricerca sul sito RNA (HTTP, poi Playwright), eventualmente ristretta agli aiuti da dal in poi"""
+        # Motore HTTP (senza browser): Playwright solo se fallisce
+        if self.motore in ("auto", "http"):
+            try:
+                from rna_http_client import RNAHttpClient
+                risultato = RNAHttpClient(url=self.url).calcola_deminimis(partita_iva, oggi, dal)
+                # Risultati paginati non letti per intero: in auto li rilegge Playwright
+                if risultato.get("copertura_completa", True) or self.motore == "http":
+                    return risultato
+                print("⚠️ Motore HTTP RNA: copertura parziale, fallback Playwright...")
+            except Exception as e:
+                if self.motore == "http":
+                    return self._risultato_errore(partita_iva, f"Errore HTTP RNA: {e}", e, oggi)
+                print(f"⚠️ Motore HTTP RNA non riuscito ({e}), fallback Playwright...")
 
-                # Invia ricerca
-                submit = page.locator("xpath=//input[@type='submit'] | //button[@type='submit']").first
-                submit.click()
-                # Attendi che appaiano risultati o messaggio
-                try:
-                    page.wait_for_selector("table", timeout=60000)
-                    page.wait_for_selector("table tbody tr td", timeout=60000)
-                except Exception:
-                    pass
-                # Ulteriore attesa per popolamento DataTables
-                page.wait_for_timeout(5000)
-                # Polling: attendi finché compare almeno un simbolo euro nella tabella (max ~10s)
-                has_euro = False
+        try:
+            if self.playwright_async:
+                # Un browser e un event loop condivisi, pagine concorrenti
+                from rna_deminimis_async import get_motore_sync
+                return get_motore_sync(self.headless).calcola_deminimis(partita_iva, oggi, dal)
+
+            if self.usa_pool:
+                pool = get_pool(self.headless, self.slow_mo_ms, profilo_risorse="rna")
+                return pool.esegui(self._calcola_su_pagina, partita_iva, oggi, dal)
+
+            # Browser dedicato (senza pool): lanciato e chiuso ad ogni chiamata
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=self.headless, slow_mo=self.slow_mo_ms, args=CHROMIUM_ARGS)
                 try:
-                    for _ in range(40):  # fino a ~20s
-                        has_euro = page.evaluate(
-                            """
-                            () => {
-                              const t = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
-                              if (!t) return false;
-                              const txt = t.innerText || '';
-                              if (!txt.includes('€')) return false;
-                              const body = t.querySelector('tbody');
-                              if (!body) return false;
-                              return body.querySelectorAll('tr').length > 0;
-                            }
-                            """
-                        )
-                        if has_euro:
-                            break
-                        page.wait_for_timeout(500)
-                except Exception:
-                    pass
+                    context = browser.new_context()
+                    applica_profilo(context, "rna")
+                    return self._calcola_su_pagina(context.new_page(), partita_iva, oggi, dal)
+                finally:
+                    browser.close()
+
+        except Exception as e:
+            return self._risultato_errore(partita_iva, f"Errore Playwright: {e}", e, oggi)
+
+    def _storico_locale(self, partita_iva: str, oggi: datetime) -> tuple[list[dict], date, str] | None:
+        """
+        Aiuti del triennio già noti dai dump OpenData: prima il filtro Bloom dei beneficiari
+        (rna_bloom, un CF assente non ha aiuti nei mesi coperti), poi l'archivio SQLite
+        (rna_opendata_store).
+
+        Returns:
+            (aiuti fino alla fine della copertura, ultimo giorno coperto, fonte "bloom"/"opendata")
+            oppure None se nessuna delle due fonti copre l'inizio del triennio
+        """
+        tre_anni_fa = oggi - timedelta(days=3 * 365)
+        try:
+            from rna_bloom import get_filtro
+            filtro = get_filtro()
+            if filtro is not None and partita_iva not in filtro:
+                copertura = filtro.copertura()
+                if copertura and copertura[0] <= tre_anni_fa.date():
+                    return [], min(copertura[1], oggi.date()), "bloom"
+        except Exception as e:
+            print(f"⚠️ Filtro Bloom RNA non utilizzabile: {e}")
 
-                # Salva debug post-submit
-                try:
-                    page.screenshot(path="debug_rna_post_submit.png", full_page=True)
-                    with open("debug_rna_post_submit.html", "w", encoding="utf-8") as f:
-                        f.write(page.content())
-                except Exception:
-                    pass
+        try:
+            from rna_opendata_store import RNAOpenDataStore
+            store = RNAOpenDataStore()
+            if not store.esiste():
+                return None
+            copertura = store.copertura()
+            if not copertura or copertura[0] > tre_anni_fa.date():
+                return None
+            fine_copertura = min(copertura[1], oggi.date())
+            aiuti = store.aiuti_per_cf(partita_iva, tre_anni_fa, datetime.combine(fine_copertura, datetime.min.time()))
+        except Exception as e:
+            print(f"⚠️ Archivio OpenData locale non utilizzabile: {e}")
+            return None
+        return aiuti, fine_copertura, "opendata"
 
-                tutti_aiuti: list[dict] = []
-                max_pagine = 10
-                pagina = 1
-                date_vecchie_consecutive = 0
+    def _risultato_errore(self, partita_iva: str, errore_msg: str, e: Exception, oggi: datetime) -> dict:
+        """Costruisce il risultato di errore e invia l'alert email per gli errori critici"""
+        # Invia alert email se abilitato
+        if EMAIL_ALERTS_ENABLED:
+            try:
+                # Verifica se è un errore critico (selettori non funzionano)
+                errore_str = str(e).lower()
+                if any(keyword in errore_str for keyword in ['timeout', 'selector', 'element', 'not found']):
+                    print("📧 Invio alert email per errore critico RNA...")
+                    alert_rna_error(
+                        partita_iva=partita_iva,
+                        errore=errore_msg,
+                        dettagli={
+                            "Tipo Errore": type(e).__name__,
+                            "URL": self.url,
+                            "Browser": "Chromium/Playwright" if self.motore != "http" else "HTTP (requests)",
+                            "Headless": str(self.headless)
+                        },
+                        screenshot_path="debug_rna_post_submit.png" if os.path.exists("debug_rna_post_submit.png") else None
+                    )
+            except Exception as email_err:
+                print(f"⚠️ Errore invio alert email: {email_err}")
+            
+        return {
+            "errore": errore_msg,
+            "partita_iva": partita_iva,
+            "totale_de_minimis": 0.0,
+            "numero_aiuti": 0,
+            "aiuti_trovati": [],
+            "margine_rimanente": SOGLIA_DE_MINIMIS,
+            "data_ricerca": oggi.strftime("%d/%m/%Y %H:%M"),
+        }
+
+    def _calcola_su_pagina(self, page, partita_iva: str, oggi: datetime, dal: datetime = None) -> dict:
+        """
+        Esegue ricerca ed estrazione RNA sulla pagina fornita (dal pool o da un browser dedicato).
+        Con dal la ricerca è limitata agli aiuti concessi da quella data (delta dopo lo storico locale).
+        """
+        tre_anni_fa = oggi - timedelta(days=3 * 365)
+        if dal:
+            tre_anni_fa = max(tre_anni_fa, dal)
 
-                def estrai_dalla_pagina() -> tuple[list[dict], bool]:
-                    aiuti: list[dict] = []
-                    continua = True
-                    try:
-                        # Seleziona la tabella corretta per header "Elemento Aiuto"
-                        candidate_tables = page.locator("table").all()
-                        table = None
-                        for t in candidate_tables:
-                            try:
-                                hdr_nodes = t.locator("thead th, tr th").all()
-                                headers_lower = [h.inner_text().strip().lower() for h in hdr_nodes]
-                                header_text = " ".join(headers_lower)
-                                if ("elemento" in header_text and "aiuto" in header_text) or ("data" in header_text and "concessione" in header_text) or ("importo" in header_text):
-                                    table = t
-                                    break
-                            except Exception:
-                                continue
-                        if not table or not table.is_visible():
-                            return aiuti, False
-
-                        rows = table.locator("tbody tr").all()
-                        if not rows:
-                            rows = table.locator("tr").all()
-                        if len(rows) < 2:
-                            return aiuti, False
-
-                        # Primo tentativo: estrazione lato client con JS (header -> index per "Elemento Aiuto")
-                        try:
-                            js_results = page.evaluate(
-                                """
-                                () => {
-                                  const tbl = document.querySelector('#trasparenzaAiuti') || document.querySelector('table');
-                                  const out = [];
-                                  if (!tbl) return out;
-                                  const thead = tbl.querySelector('thead');
-                                  const headers = thead ? Array.from(thead.querySelectorAll('th')).map(th => th.innerText.trim().toLowerCase()) : [];
-                                  const findIdx = (pred) => headers.findIndex(h => pred(h));
-                                  const idxData = findIdx(h => h.includes('data') && h.includes('concessione'));
-                                  const idxImporto = findIdx(h => h.includes('elemento') && h.includes('aiuto'));
-                                  const idxTitolo = findIdx(h => h.includes('titolo'));
-                                  const rows = tbl.querySelectorAll('tbody tr');
-                                  rows.forEach(tr => {
-                                    const cells = Array.from(tr.querySelectorAll('td')).map(td => td.innerText.trim());
-                                    if (cells.length < 3) return;
-                                    const dateCell = idxData >= 0 ? (cells[idxData] || '') : (cells.map(t => (t.match(/\b\d{2}\/\d{2}\/\d{4}\b/)||[])[0]).find(Boolean) || '');
-                                    const importoCell = idxImporto >= 0 ? (cells[idxImporto] || '') : (cells.find(t => t.includes('€')) || '');
-                                    const titoloCell = idxTitolo >= 0 ? (cells[idxTitolo] || '') : (cells[2] || '');
-                                    out.push({ data: dateCell, importoTxt: importoCell, titolo: titoloCell });
-                                  });
-                                  return out;
-                                }
-                                """
-                            )
-                            # Converte risultati JS in aiuti strutturati
-                            for item in js_results or []:
-                                data_txt = item.get('data') or ''
-                                if not data_txt:
-                                    continue
-                                try:
-                                    data_conc = datetime.strptime(data_txt, "%d/%m/%Y")
-                                except Exception:
-                                    continue
-                                if data_conc < tre_anni_fa:
-                                    date_vecchie_consecutive_nonlocal[0] += 1
-                                    if date_vecchie_consecutive_nonlocal[0] >= 3:
-                                        continua = False
-                                        break
-                                    continue
-                                else:
-                                    date_vecchie_consecutive_nonlocal[0] = 0
-
-                                importo = self._parse_importo_it(item.get('importoTxt') or '')
-                                if not importo:
-                                    continue
-                                titolo = (item.get('titolo') or '').strip() or 'N/A'
-                                aiuti.append({
-                                    "data_concessione": data_txt,
-                                    "importo": importo,
-                                    "titolo_misura": titolo,
-                                    "data": data_txt,
-                                })
-                            # Se abbiamo trovato aiuti via JS, ritorna subito
-                            if aiuti:
-                                return aiuti, True
-                        except Exception:
-                            pass
-
-                        # Secondo tentativo: parsing diretto dell'HTML della tabella (regex)
-                        try:
-                            for _ in range(20):  # ~10s
-                                html = page.evaluate("() => (document.querySelector('#trasparenzaAiuti')||{}).outerHTML || '';")
-                                if not html or '€' not in html:
-                                    page.wait_for_timeout(500)
-                                    continue
-                                # Estrai righe
-                                import re as _re
-                                # Trova tutte le date dd/mm/yyyy
-                                date_list = _re.findall(r"(\d{2}/\d{2}/\d{4})", html)
-                                # Trova tutti gli importi formattati IT con euro nella tabella
-                                importi_list = _re.findall(r"€\s*[0-9.]+,[0-9]{2}", html)
-                                # Trova titoli Grezzi (colonna Titolo Misura)
-                                titoli_list = _re.findall(r">\s*([^<]{3,100})\s*</td>", html)
-                                # Associa per posizione prudente: usa numero minimo tra liste
-                                n = min(len(date_list), len(importi_list))
-                                for i in range(n):
-                                    data_txt = date_list[i]
-                                    try:
-                                        data_conc = datetime.strptime(data_txt, "%d/%m/%Y")
-                                    except Exception:
-                                        continue
-                                    if data_conc < tre_anni_fa:
-                                        continue
-                                    importo = self._parse_importo_it(importi_list[i])
-                                    if not importo:
-                                        continue
-                                    titolo = titoli_list[i] if i < len(titoli_list) else 'N/A'
-                                    aiuti.append({
-                                        "data_concessione": data_txt,
-                                        "importo": importo,
-                                        "titolo_misura": titolo,
-                                        "data": data_txt,
-                                    })
-                                if aiuti:
-                                    return aiuti, True
-                                page.wait_for_timeout(500)
-                        except Exception:
-                            pass
-
-                        # Terzo tentativo: fallback Scarica CSV (se polling trova € ma non importi)
-                        print(f"🔍 Debug: aiuti={len(aiuti)}, has_euro={has_euro}")
-                        if not aiuti and has_euro:
-                            print("📥 Attivazione fallback CSV...")
-                            try:
-                                with page.expect_download() as dl_info:
-                                    # Link visibile in basso: SCARICA CSV
-                                    btn = page.locator("xpath=//a[contains(translate(., 'abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'), 'SCARICA CSV')]").first
-                                    if btn and btn.is_visible():
-                                        btn.click()
-                                    else:
-                                        raise Exception('Scarica CSV non trovato')
-                                download = dl_info.value
-                                # Salva CSV su file temporaneo e leggi il contenuto (Download non ha .content())
-                                import tempfile
-                                import os as _os
-                                with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as _tmp_csv:
-                                    download.save_as(_tmp_csv.name)
-                                    with open(_tmp_csv.name, 'r', encoding='utf-8', errors='ignore') as _f:
-                                        text = _f.read()
-                                    _os.unlink(_tmp_csv.name)
-                                # Parse CSV italiano: cerca header Elemento Aiuto e Data Concessione
-                                reader = csv.reader(io.StringIO(text), delimiter=';')
-                                headers = next(reader, [])
-                                headers_low = [h.strip().lower() for h in headers]
-                                try:
-                                    idx_importo = headers_low.index('elemento aiuto')
-                                except ValueError:
-                                    idx_importo = -1
-                                try:
-                                    idx_data = headers_low.index('data concessione')
-                                except ValueError:
-                                    idx_data = -1
-                                for row in reader:
-                                    if not row or (idx_importo == -1 or idx_data == -1) or idx_importo >= len(row) or idx_data >= len(row):
-                                        continue
-                                    data_txt = row[idx_data].strip()
-                                    try:
-                                        data_conc = datetime.strptime(data_txt, '%d/%m/%Y')
-                                    except Exception:
-                                        continue
-                                    if data_conc < tre_anni_fa:
-                                        continue
-                                    importo = self._parse_importo_it(row[idx_importo])
-                                    if not importo:
-                                        continue
-                                    aiuti.append({
-                                        'data_concessione': data_txt,
-                                        'importo': importo,
-                                        'titolo_misura': '',
-                                        'data': data_txt,
-                                    })
-                                if aiuti:
-                                    return aiuti, True
-                            except Exception as e:
-                                print(f"❌ Errore fallback CSV: {e}")
-                                pass
-
-                        # Header: trova indici
-                        # Ricava header: se non in tbody, prendi thead
-                        header_nodes = table.locator("thead th").all()
-                        if not header_nodes:
-                            header_nodes = rows[0].locator("th").all()
-                        headers = [h.inner_text().strip().lower() for h in header_nodes]
-                        has_thead = len(table.locator("thead th").all()) > 0
-                        def idx_of(predicate):
-                            for i, t in enumerate(headers):
-                                if predicate(t):
-                                    return i
-                            return -1
-
-                        data_idx = idx_of(lambda t: ("data" in t and "concessione" in t))
-                        importo_idx = idx_of(lambda t: (("elemento" in t and "aiuto" in t) or ("importo" in t)))
-                        titolo_idx = idx_of(lambda t: ("titolo" in t and ("misura" in t or "progetto" in t)))
-                        if titolo_idx == -1:
-                            titolo_idx = 2 if len(headers) > 2 else -1
-                        if data_idx == -1:
-                            data_idx = 6
-                        if importo_idx == -1:
-                            importo_idx = len(headers) - 1 if headers else -1
-
-                        start_index = 0 if has_thead else 1
-                        for r in rows[start_index:]:
-                            cells = r.locator("td").all()
-                            if len(cells) < 3:
-                                # Tabelle compatte: prova un parsing più tollerante
-                                pass
-                            # Cerca data in qualunque cella se l'indice non è affidabile
-                            data_txt = ""
-                            candidates = []
-                            if data_idx < len(cells):
-                                try:
-                                    candidates.append(cells[data_idx].inner_text().strip())
-                                except Exception:
-                                    pass
-                            # Aggiungi tutte le celle per ricerca regex
-                            for c in cells:
-                                try:
-                                    txt = c.inner_text().strip()
-                                    if txt:
-                                        candidates.append(txt)
-                                except Exception:
-                                    continue
-                            for txt in candidates:
-                                m = re.search(r"\b(\d{2}/\d{2}/\d{4})\b", txt)
-                                if m:
-                                    data_txt = m.group(1)
-                                    break
-                            if not data_txt:
-                                continue
-                            try:
-                                data_conc = datetime.strptime(data_txt, "%d/%m/%Y")
-                            except Exception:
-                                continue
-                            if data_conc < tre_anni_fa:
-                                date_vecchie_consecutive_nonlocal[0] += 1
-                                if date_vecchie_consecutive_nonlocal[0] >= 3:
-                                    continua = False
-                                    break
-                                continue
-                            else:
-                                date_vecchie_consecutive_nonlocal[0] = 0
-
-                            importo_txt = cells[importo_idx].inner_text().strip() if importo_idx < len(cells) else ""
-                            importo = self._parse_importo_it(importo_txt)
-                            if not importo:
-                                # Fallback: cerca la prima cella con simbolo euro
-                                for c in cells:
-                                    txt = c.inner_text().strip()
-                                    if "€" in txt or "," in txt:
-                                        imp = self._parse_importo_it(txt)
-                                        if imp:
-                                            importo = imp
-                                            break
-                            if not importo:
-                                continue
-                            titolo = cells[titolo_idx].inner_text().strip() if 0 <= titolo_idx < len(cells) else "N/A"
-                            aiuti.append({
-                                "data_concessione": data_txt,
-                                "importo": importo,
-                                "titolo_misura": titolo,
-                                "data": data_txt,
-                            })
-                    except Exception:
-                        pass
-                    return aiuti, continua
+        page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
 
-                # trick per mutare nel nested scope
-                date_vecchie_consecutive_nonlocal = [0]
+        # Chiudi cookie se presente
+        try:
+            # diversi possibili testi del bottone
+            cookie_btn = page.locator("xpath=//button[contains(., 'Accett') or contains(., 'accett') or contains(., 'OK')]")
+            if cookie_btn.first.is_visible():
+                cookie_btn.first.click()
+        except Exception:
+            pass
 
-                while pagina <= max_pagine:
-                    aiuti_pagina, continua = estrai_dalla_pagina()
-                    tutti_aiuti.extend(aiuti_pagina)
-                    if not continua:
-                        break
-                    # Vai pagina successiva: DataTables next
-                    try:
-                        next_btn = page.locator("a.paginate_button.next")
-                        if next_btn.is_visible():
-                            cls = next_btn.get_attribute("class") or ""
-                            if "disabled" not in cls:
-                                next_btn.click()
-                                page.wait_for_load_state("domcontentloaded", timeout=30000)
-                                pagina += 1
-                                continue
-                    except Exception:
-                        pass
-                    # Prova numeri pagina
-                    avanzato = False
-                    for n in [2, 3, 4, 5]:
-                        try:
-                            num_btn = page.locator(f"xpath=//a[contains(@class,'paginate_button') and text()='{n}']")
-                            if num_btn.is_visible():
-                                num_btn.click()
-                                page.wait_for_load_state("domcontentloaded", timeout=30000)
-                                pagina += 1
-                                avanzato = True
-                                break
-                        except Exception:
-                            continue
-                    if not avanzato:
-                        break
+        # Ricarica per mostrare il form, come da flusso verificato
+        page.goto(self.url, wait_until="domcontentloaded", timeout=60000)
 
-                # Fallback CSV se nessun aiuto trovato
-                if not tutti_aiuti:
-                    try:
-                        with page.expect_download() as dl_info:
-                            btn = page.locator("xpath=//a[contains(translate(., 'abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'), 'SCARICA CSV')]").first
-                            if btn and btn.is_visible():
-                                btn.click()
-                            else:
-                                raise Exception('Scarica CSV non trovato')
-                        download = dl_info.value
-                        # Salva il file temporaneamente e leggilo
-                        import tempfile
-                        import os
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-                            download.save_as(tmp.name)
-                            with open(tmp.name, 'r', encoding='utf-8', errors='ignore') as f:
-                                text = f.read()
-                            os.unlink(tmp.name)
-                        # Parse CSV italiano
-                        reader = csv.reader(io.StringIO(text), delimiter=',')
-                        headers = next(reader, [])
-                        headers_low = [h.strip().lower().strip('"') for h in headers]
-                        try:
-                            idx_importo = next(i for i, h in enumerate(headers_low) if 'elemento aiuto' in h)
-                        except StopIteration:
-                            idx_importo = -1
-                        try:
-                            idx_data = next(i for i, h in enumerate(headers_low) if 'data concessione' in h)
-                        except StopIteration:
-                            idx_data = -1
-                        for row in reader:
-                            if not row or (idx_importo == -1 or idx_data == -1) or idx_importo >= len(row) or idx_data >= len(row):
-                                continue
-                            data_txt = row[idx_data].strip()
-                            try:
-                                data_conc = datetime.strptime(data_txt, '%d/%m/%Y')
-                            except Exception:
-                                continue
-                            if data_conc < tre_anni_fa:
-                                continue
-                            importo = self._parse_importo_it(row[idx_importo])
-                            if not importo:
-                                continue
-                            tutti_aiuti.append({
-                                'data_concessione': data_txt,
-                                'importo': importo,
-                                'titolo_misura': '',
-                                'data': data_txt,
-                            })
-                    except Exception as e:
-                        pass
+        # Compila form: campo CF/P.IVA
+        cf_input = page.locator("input[name='cfBen']")
+        cf_input.fill(partita_iva)
 
-                totale = round(sum(a["importo"] for a in tutti_aiuti), 2)
-                soglia = 300000.0
-                risultato = {
-                    "partita_iva": partita_iva,
-                    "totale_de_minimis": totale,
-                    "numero_aiuti": len(tutti_aiuti),
-                    "aiuti_trovati": tutti_aiuti,
-                    "soglia_superata": totale > soglia,
-                    "margine_rimanente": round(max(0, soglia - totale), 2),
-                    "soglia_limite": soglia,
-                    "percentuale_utilizzata": round((totale / soglia) * 100, 1) if soglia else 0.0,
-                    "data_ricerca": oggi.strftime("%d/%m/%Y %H:%M"),
-                    "pagine_analizzate": pagina,
-                }
-                return risultato
+        # Tipo: De Minimis
+        page.select_option("select[name='tipp']", label="De Minimis")
 
+        # Date: estendiamo a 6 anni per garantire presenza dati, filtreremo a 3 anni
+        sei_anni_fa = dal or oggi - timedelta(days=6 * 365)
+        try:
+            page.fill("input[name='annoc']", sei_anni_fa.strftime('%d/%m/%Y'))
+            page.fill("input[name='annoc2']", oggi.strftime('%d/%m/%Y'))
+        except Exception:
+            # Fallback ISO
+            try:
+                page.fill("input[name='annoc']", sei_anni_fa.strftime('%Y-%m-%d'))
+                page.fill("input[name='annoc2']", oggi.strftime('%Y-%m-%d'))
+            except Exception:
+                pass
+
+        # Invia ricerca intercettando le risposte di rete: la tabella DataTables
+        # viene costruita da un JSON (o da un frammento HTML) che leggiamo direttamente
+        risposte = []
+        gestore_risposte = risposte.append
+        page.on("response", gestore_risposte)
+        try:
+            try:
+                page.evaluate(JS_MARCA_FORM)
+            except Exception:
+                pass
+            submit = page.locator("xpath=//input[@type='submit'] | //button[@type='submit']").first
+            host = urlparse(self.url).netloc
+            risposta_ricerca = None
+            try:
+                # Risposta della ricerca stessa (navigazione del form o XHR DataTables):
+                # solo dopo di essa un messaggio di nessun risultato è affidabile
+                with page.expect_response(lambda r: risposta_della_ricerca(r, host), timeout=60000) as info_ricerca:
+                    submit.click()
+                risposta_ricerca = info_ricerca.value
             except Exception as e:
-                errore_msg = f"Errore Playwright: {e}"
-                
-                # Invia alert email se abilitato
-                if EMAIL_ALERTS_ENABLED:
-                    try:
-                        # Verifica se è un errore critico (selettori non funzionano)
-                        errore_str = str(e).lower()
-                        if any(keyword in errore_str for keyword in ['timeout', 'selector', 'element', 'not found']):
-                            print("📧 Invio alert email per errore critico RNA...")
-                            alert_rna_error(
-                                partita_iva=partita_iva,
-                                errore=errore_msg,
-                                dettagli={
-                                    "Tipo Errore": type(e).__name__,
-                                    "URL": self.url,
-                                    "Browser": "Chromium/Playwright",
-                                    "Headless": str(self.headless)
-                                },
-                                screenshot_path="debug_rna_post_submit.png" if os.path.exists("debug_rna_post_submit.png") else None
-                            )
-                    except Exception as email_err:
-                        print(f"⚠️ Errore invio alert email: {email_err}")
-                
-                return {
-                    "errore": errore_msg,
-                    "partita_iva": partita_iva,
-                    "totale_de_minimis": 0.0,
-                    "numero_aiuti": 0,
-                    "aiuti_trovati": [],
-                    "margine_rimanente": 300000.0,
-                    "data_ricerca": oggi.strftime("%d/%m/%Y %H:%M"),
-                }
-            finally:
-                browser.close()
-
+                print(f"⚠️ RNA: risposta alla ricerca non intercettata ({e}), esito vuoto non accettato")
+            tabella_rete, completa_rete, esito_dom = self._attendi_risultati(page, risposte, risposta_ricerca)
+        finally:
+            page.remove_listener("response", gestore_risposte)
+        has_euro = esito_dom == "risultati"
+
+        if esito_dom == "vuoto":
+            # Nessun aiuto per il beneficiario: niente polling, fallback né download CSV
+            print(f"📭 RNA: nessun risultato per {partita_iva}")
+            risultato = costruisci_risultato(partita_iva, [], oggi, pagine=1)
+            risultato["motore"] = "playwright"
+            # Esito letto dopo la risposta alla ricerca: può essere messo in cache
+            risultato["ricerca_confermata"] = True
+            return risultato
+
+        if tabella_rete is not None and completa_rete:
+            # Dati già completi dalla rete: niente parsing DOM né paginazione
+            indice = IndiceDeduplicaAiuti()
+            aiuti = indice.filtra(estrai_aiuti_tabella(tabella_rete, tre_anni_fa)[0], partita_iva)
+            print(f"📡 RNA: {len(righe_dati(tabella_rete))} righe lette dalla risposta di rete, {len(aiuti)} aiuti nel triennio")
+            risultato = costruisci_risultato(partita_iva, aiuti, oggi, pagine=1,
+                                             duplicati_rimossi=indice.duplicati_rimossi)
+            risultato["motore"] = "playwright-rete"
+            risultato["ricerca_confermata"] = True
+            return risultato
+        if tabella_rete is not None:
+            # Risposta paginata lato server: si prosegue sulla tabella DOM appena popolata
+            try:
+                page.wait_for_function(JS_TABELLA_POPOLATA, timeout=20000)
+                has_euro = True
+            except Exception:
+                pass
 
+        # Salva debug post-submit
+        try:
+            page.screenshot(path="debug_rna_post_submit.png", full_page=True)
+            with open("debug_rna_post_submit.html", "w", encoding="utf-8") as f:
+                f.write(page.content())
+        except Exception:
+            pass
+
+        tutti_aiuti: list[dict] = []
+        # Righe ripetute tra pagine o tra strategie (es. CSV completo letto a pagina 2) scartate in O(1)
+        indice = IndiceDeduplicaAiuti()
+        max_pagine = int(os.environ.get("RNA_MAX_PAGINE", "10"))
+        pagina = 1
+        # Prima prova a caricare tutte le righe in un'unica pagina DataTables
+        tutte_le_righe = self._mostra_tutte_le_righe(page)
+        # Aiuti fuori periodo consecutivi, condiviso tra le pagine
+        date_vecchie = [0]
+
+        registro = get_registro()
+
+        def estrai_dalla_pagina() -> tuple[list[dict], bool]:
+            try:
+                # Snapshot della pagina (una sola IPC); se DataTables non ha ancora
+                # popolato gli importi si attende l'evento invece di ripetere le strategie
+                tabella = seleziona_tabella_aiuti(page.evaluate(JS_SNAPSHOT_TABELLE))
+                if not tabella or not righe_dati(tabella):
+                    return [], False
+                if "€" not in testo_tabella(tabella):
+                    try:
+                        page.wait_for_function(JS_TABELLA_POPOLATA, timeout=10000)
+                        tabella = seleziona_tabella_aiuti(page.evaluate(JS_SNAPSHOT_TABELLE)) or tabella
+                    except Exception:
+                        pass
+            except Exception:
+                return [], True
+
+            strategie = {
+                "header": lambda: aiuti_per_header(tabella, tre_anni_fa, date_vecchie),
+                "regex": lambda: (aiuti_per_regex(tabella, tre_anni_fa), True),
+                # Il CSV contiene l'intero risultato: continua=False ferma la paginazione
+                "csv": lambda: (self._aiuti_da_csv_scaricato(page, tre_anni_fa), False),
+                "posizione": lambda: aiuti_per_posizione(tabella, tre_anni_fa, date_vecchie),
+            }
+            # header per primo; il CSV solo se non escluso dal registro per fallimenti ripetuti
+            vecchie_iniziali = date_vecchie[0]
+            fuori_periodo = tabella_fuori_periodo(tabella, tre_anni_fa)
+            for nome in registro.ordine():
+                if nome == "csv" and not has_euro:
+                    continue
+                date_vecchie[0] = vecchie_iniziali
+                inizio = time.time()
+                try:
+                    aiuti, continua = strategie[nome]()
+                    # CSV letto o righe tutte fuori periodo: zero aiuti è un esito valido
+                    letta = nome == "csv" or fuori_periodo
+                except Exception as e:
+                    print(f"❌ Strategia {nome} non riuscita: {e}")
+                    aiuti, continua, letta = [], True, False
+                riuscita = esito_valido(aiuti, continua, letta)
+                registro.registra(nome, riuscita, time.time() - inizio)
+                if riuscita:
+                    return aiuti, continua
+            return [], True
+
+        while pagina <= max_pagine:
+            aiuti_pagina, continua = estrai_dalla_pagina()
+            tutti_aiuti.extend(indice.filtra(aiuti_pagina, partita_iva))
+            if not continua or tutte_le_righe:
+                break
+            # Vai pagina successiva: DataTables next
+            try:
+                next_btn = page.locator("a.paginate_button.next")
+                if next_btn.is_visible():
+                    cls = next_btn.get_attribute("class") or ""
+                    if "disabled" not in cls:
+                        next_btn.click()
+                        page.wait_for_load_state("domcontentloaded", timeout=30000)
+                        pagina += 1
+                        continue
+            except Exception:
+                pass
+            # Prova numeri pagina
+            avanzato = False
+            for n in [2, 3, 4, 5]:
+                try:
+                    num_btn = page.locator(f"xpath=//a[contains(@class,'paginate_button') and text()='{n}']")
+                    if num_btn.is_visible():
+                        num_btn.click()
+                        page.wait_for_load_state("domcontentloaded", timeout=30000)
+                        pagina += 1
+                        avanzato = True
+                        break
+                except Exception:
+                    continue
+            if not avanzato:
+                break
+
+        # Limite pagine raggiunto con altre pagine ancora da leggere: risultato parziale
+        copertura_completa = pagina <= max_pagine
+        if not copertura_completa:
+            pagina = max_pagine
+            print(f"⚠️ RNA: lette solo le prime {max_pagine} pagine per {partita_iva}, risultato parziale")
+
+        # Fallback CSV se nessun aiuto trovato
+        if not tutti_aiuti:
+            try:
+                tutti_aiuti = indice.filtra(self._aiuti_da_csv_scaricato(page, tre_anni_fa), partita_iva)
+            except Exception:
+                pass
+
+        if indice.duplicati_rimossi:
+            print(f"🧹 RNA: {indice.duplicati_rimossi} righe duplicate scartate per {partita_iva}")
+        risultato = costruisci_risultato(partita_iva, tutti_aiuti, oggi, pagine=pagina, copertura_completa=copertura_completa,
+                                         duplicati_rimossi=indice.duplicati_rimossi)
+        risultato["motore"] = "playwright"
+        # Zero aiuti senza tabella risultati né risposta di rete (es. attesa scaduta) non è un esito confermato
+        risultato["ricerca_confermata"] = has_euro or tabella_rete is not None
+        return risultato
+
+    def _aiuti_da_csv_scaricato(self, page, limite: datetime) -> list[dict]:
+        """Scarica l'export "SCARICA CSV" e lo legge direttamente dal file del download (rna_csv)"""
+        btn = page.locator("xpath=//a[contains(translate(., 'abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'), 'SCARICA CSV')]").first
+        if not btn.is_visible():
+            raise Exception('Scarica CSV non trovato')
+        with page.expect_download() as dl_info:
+            btn.click()
+        return aiuti_da_file(dl_info.value.path(), limite)
+
+    def _attendi_risultati(self, page, risposte: list, risposta_ricerca=None,
+                           timeout_ms: int = 60000) -> tuple[dict | None, bool, str]:
+        """
+        Dopo l'invio del form attende il primo tra: risposta di rete con i dati della
+        tabella risultati, tabella DOM popolata con importi e messaggio RNA di nessun
+        risultato. Nessuna attesa fissa: un beneficiario senza aiuti si chiude in un caricamento.
+
+        Args:
+            risposte (list): Response raccolte dal listener page.on("response")
+            risposta_ricerca: Response del submit (expect_response); senza, "vuoto" non è mai accettato
+
+        Returns:
+            (tabella dalla rete o None, tabella di rete completa,
+             esito DOM: "risultati", "vuoto" o "" se scaduto il timeout)
+        """
+        host = urlparse(self.url).netloc
+        lette = 0
+        scadenza = time.time() + timeout_ms / 1000
+        while time.time() < scadenza:
+            while lette < len(risposte):
+                risposta = risposte[lette]
+                tabella, completa = self._tabella_da_risposta(page, risposta, host)
+                lette += 1
+                if tabella is not None:
+                    return tabella, completa, ""
+            try:
+                esito = page.evaluate(JS_ESITO_RICERCA, TESTI_NESSUN_RISULTATO)
+                if esito == "risultati":
+                    return None, False, esito
+                # "vuoto" vale solo sulla pagina aggiornata dalla risposta alla ricerca,
+                # non sul documento del form ancora visibile durante la navigazione
+                if esito == "vuoto" and risposta_ricerca is not None and page.evaluate(JS_PAGINA_AGGIORNATA):
+                    return None, False, esito
+            except Exception:
+                # Navigazione in corso dopo il submit
+                pass
+            page.wait_for_timeout(250)
+        return None, False, ""
+
+    def _tabella_da_risposta(self, page, risposta, host: str) -> tuple[dict | None, bool]:
+        """Tabella aiuti (formato snapshot) da una risposta XHR/documento RNA, se la contiene"""
+        try:
+            if risposta.status != 200 or risposta.request.resource_type not in ("xhr", "fetch", "document"):
+                return None, False
+            if urlparse(risposta.url).netloc != host:
+                return None, False
+            tipo = (risposta.headers.get("content-type") or "").lower()
+
+            if "json" in tipo:
+                dati = risposta.json()
+                righe, totale = righe_json(dati)
+                if righe is None:
+                    return None, False
+                headers_dom = None
+                if righe and not isinstance(righe[0], dict):
+                    # Righe come array: i nomi colonna sono nell'intestazione della tabella
+                    tabella_dom = seleziona_tabella_aiuti(page.evaluate(JS_SNAPSHOT_TABELLE))
+                    headers_dom = tabella_dom["headers"] if tabella_dom else []
+                tabella, completa = tabella_da_json(dati, headers_dom)
+                if not righe:
+                    return (tabella, completa) if totale == 0 else (None, False)
+            elif "html" in tipo:
+                # Documento paginato dal server: la tabella DOM e la paginazione proseguono la lettura
+                tabella, completa = tabella_da_html(risposta.text())
+                if not tabella or not righe_dati(tabella):
+                    return None, False
+            else:
+                return None, False
+
+            if seleziona_tabella_aiuti([tabella]) is None:
+                return None, False
+            return tabella, completa
+        except Exception:
+            return None, False
+
+    def _mostra_tutte_le_righe(self, page) -> bool:
+        """
+        Imposta la tabella DataTables su "tutte le righe" e attende il ridisegno.
+
+        Returns:
+            bool: True se tutte le righe risultano caricate nel DOM (niente paginazione),
+                False se DataTables non è disponibile o il server limita la lunghezza pagina
+        """
+        try:
+            if not page.evaluate(JS_DATATABLES_MOSTRA_TUTTO):
+                return False
+            page.wait_for_function("() => window.__rnaDrawCompletato === true", timeout=30000)
+            info = page.evaluate(JS_DATATABLES_INFO)
+        except Exception as e:
+            print(f"⚠️ DataTables 'mostra tutto' non disponibile ({e}), uso la paginazione")
+            return False
+        tutte = info["righe"] >= info["totale"]
+        print(f"📄 DataTables: {info['righe']}/{info['totale']} righe caricate in un'unica pagina")
+        return tutte
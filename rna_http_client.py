@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+RNA De Minimis - Client HTTP (senza browser)
+=============================================
+
+Invia lo stesso form della pagina "Trasparenza aiuti" (cfBen, tipp, annoc,
+annoc2) con una requests.Session persistente e legge la tabella risultati
+dall'HTML oppure dal CSV di "SCARICA CSV". Nessun Chromium: la ricerca costa
+un paio di round-trip HTTP e può girare in parallelo.
+
+Se la risposta non è interpretabile (form cambiato, tabella popolata solo via
+JavaScript, errore di rete) solleva RNAHttpErrore: RNACalculator in tal caso
+ripiega sul flusso Playwright.
+
+Tabella paginata lato server: si seguono i link "successiva" (fino a
+RNA_MAX_PAGINE) o si legge il CSV completo; se nessuno dei due è possibile il
+risultato ha copertura_completa=False e in modalità auto si ripiega su Playwright.
+"""
+
+from datetime import datetime, timedelta
+from urllib.parse import urljoin
+import os
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+from rna_deminimis_playwright import parse_importo_it, costruisci_risultato, TESTI_NESSUN_RISULTATO
+from rna_csv import aiuti_da_csv
+from rna_deduplica import IndiceDeduplicaAiuti
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/140.0 Safari/537.36"
+)
+
+
+class RNAHttpErrore(Exception):
+    """Risposta RNA non interpretabile dal client HTTP (serve il fallback Playwright)"""
+
+
+# Totale righe dichiarato dalla tabella: "Visualizzati da 1 a 10 di 57 elementi", "Showing 1 to 10 of 57"
+PATTERN_TOTALE_RIGHE = re.compile(r"\b\d+\s+(?:a|to)\s+\d+\s+(?:di|of)\s+([\d.]+)", re.IGNORECASE)
+
+# Testi dei link alla pagina successiva
+TESTI_PAGINA_SUCCESSIVA = ("successiva", "successivo", "avanti", "next", "»", "›", ">")
+
+
+def link_pagina_successiva(soup) -> str | None:
+    """href del link alla pagina successiva dei risultati, None se non c'è o è solo JavaScript"""
+    candidati = soup.find_all("a", rel="next")
+    for contenitore in soup.find_all(class_=re.compile(r"pagina|paginat|pager", re.IGNORECASE)):
+        candidati += [a for a in contenitore.find_all("a")
+                      if a.get_text(" ", strip=True).lower() in TESTI_PAGINA_SUCCESSIVA]
+    for a in candidati:
+        classi = " ".join(a.get("class") or []) + " " + " ".join(a.parent.get("class") or [])
+        href = (a.get("href") or "").strip()
+        if "disabled" in classi or not href or href.startswith(("#", "javascript")):
+            continue
+        return href
+    return None
+
+
+def totale_dichiarato(soup) -> int | None:
+    """Numero di risultati dichiarato nell'info della tabella, se presente"""
+    m = PATTERN_TOTALE_RIGHE.search(soup.get_text(" ", strip=True))
+    return int(m.group(1).replace(".", "")) if m else None
+
+
+def paginazione_presente(soup) -> bool:
+    """Controlli di paginazione nella pagina (anche solo JavaScript, non seguibili via HTTP)"""
+    return soup.find(class_=re.compile(r"paginate_button|pagination", re.IGNORECASE)) is not None
+
+
+# Una Session per thread: connessioni keep-alive riutilizzate tra ricerche,
+# senza condividere i cookie di sessione RNA tra ricerche concorrenti
+_sessioni = threading.local()
+
+
+def _get_sessione() -> requests.Session:
+    sessione = getattr(_sessioni, "sessione", None)
+    if sessione is None:
+        sessione = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=2)
+        sessione.mount("https://", adapter)
+        sessione.mount("http://", adapter)
+        sessione.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "it-IT,it;q=0.9"})
+        _sessioni.sessione = sessione
+    return sessione
+
+
+class RNAHttpClient:
+    """Ricerca aiuti De Minimis sul portale RNA via HTTP puro"""
+
+    def __init__(self, url: str = "https://www.rna.gov.it/trasparenza/aiuti", timeout: int = 30):
+        self.url = url
+        self.timeout = timeout
+        self._url_risultati = url
+
+    def calcola_deminimis(self, partita_iva: str, oggi: datetime = None, dal: datetime = None) -> dict:
+        """
+        Stessa interfaccia e stesso dict risultato di RNACalculator.calcola_deminimis.
+
+        Args:
+            dal (datetime): Se indicato, cerca solo gli aiuti concessi da questa data
+                (delta non coperto dall'archivio locale)
+
+        Raises:
+            RNAHttpErrore: se form o risultati non sono interpretabili
+            requests.RequestException: per errori di rete
+        """
+        oggi = oggi or datetime.now()
+        tre_anni_fa = oggi - timedelta(days=3 * 365)
+        # Come nel flusso Playwright: finestra di 6 anni, filtro a 3 anni
+        sei_anni_fa = oggi - timedelta(days=6 * 365)
+        if dal:
+            sei_anni_fa = dal
+            tre_anni_fa = max(tre_anni_fa, dal)
+
+        sessione = _get_sessione()
+        html = self._invia_ricerca(sessione, partita_iva, sei_anni_fa, oggi)
+        indice = IndiceDeduplicaAiuti()
+        aiuti, completa, pagine = self._estrai_aiuti(sessione, html, tre_anni_fa)
+        aiuti = indice.filtra(aiuti, partita_iva)
+        if not completa:
+            print(f"⚠️ RNA HTTP: risultati paginati non letti per intero per {partita_iva}, risultato parziale")
+
+        risultato = costruisci_risultato(partita_iva, aiuti, oggi, pagine=pagine, copertura_completa=completa,
+                                         duplicati_rimossi=indice.duplicati_rimossi)
+        risultato["motore"] = "http"
+        # Esito letto dalla risposta stessa alla ricerca (tabella, CSV o messaggio esplicito)
+        risultato["ricerca_confermata"] = True
+        return risultato
+
+    def _invia_ricerca(self, sessione: requests.Session, partita_iva: str, dal: datetime, al: datetime) -> str:
+        """Carica la pagina, compila il form come farebbe il browser e restituisce l'HTML dei risultati"""
+        risposta = sessione.get(self.url, timeout=self.timeout)
+        risposta.raise_for_status()
+        soup = BeautifulSoup(risposta.text, "lxml")
+
+        campo_cf = soup.find("input", attrs={"name": "cfBen"})
+        form = campo_cf.find_parent("form") if campo_cf else None
+        if form is None:
+            raise RNAHttpErrore("Form di ricerca (cfBen) non trovato")
+
+        # Campi del form con i valori di default (token nascosti inclusi)
+        dati = {}
+        for inp in form.find_all("input"):
+            nome = inp.get("name")
+            if not nome or inp.get("type") in ("submit", "button", "image", "reset"):
+                continue
+            if inp.get("type") in ("checkbox", "radio") and not inp.has_attr("checked"):
+                continue
+            dati[nome] = inp.get("value", "")
+        for sel in form.find_all("select"):
+            nome = sel.get("name")
+            if not nome:
+                continue
+            opzione = sel.find("option", selected=True) or sel.find("option")
+            dati[nome] = opzione.get("value", opzione.get_text(strip=True)) if opzione else ""
+
+        # Tipo: De Minimis (come page.select_option(label="De Minimis"))
+        select_tipo = form.find("select", attrs={"name": "tipp"})
+        opzione_dm = None
+        if select_tipo:
+            for opt in select_tipo.find_all("option"):
+                if opt.get_text(strip=True).lower() == "de minimis":
+                    opzione_dm = opt
+                    break
+        if opzione_dm is None:
+            raise RNAHttpErrore("Opzione 'De Minimis' non trovata nel campo tipp")
+
+        dati["cfBen"] = partita_iva
+        dati["tipp"] = opzione_dm.get("value", opzione_dm.get_text(strip=True))
+        dati["annoc"] = dal.strftime("%d/%m/%Y")
+        dati["annoc2"] = al.strftime("%d/%m/%Y")
+
+        action = urljoin(risposta.url, form.get("action") or risposta.url)
+        metodo = (form.get("method") or "get").lower()
+        if metodo == "post":
+            risultati = sessione.post(action, data=dati, timeout=self.timeout, headers={"Referer": risposta.url})
+        else:
+            risultati = sessione.get(action, params=dati, timeout=self.timeout, headers={"Referer": risposta.url})
+        risultati.raise_for_status()
+        self._url_risultati = risultati.url
+        return risultati.text
+
+    @staticmethod
+    def _trova_tabella(soup):
+        for t in soup.find_all("table"):
+            header_text = " ".join(th.get_text(" ", strip=True).lower() for th in t.find_all("th"))
+            if ("elemento" in header_text and "aiuto" in header_text) or ("data" in header_text and "concessione" in header_text) or ("importo" in header_text):
+                return t
+        return None
+
+    def _estrai_aiuti(self, sessione: requests.Session, html: str, tre_anni_fa: datetime) -> tuple[list[dict], bool, int]:
+        """
+        Legge gli aiuti dalla tabella HTML seguendo le pagine successive; se vuota o
+        paginata in modo non seguibile usa il CSV; altrimenti verifica l'esito vuoto esplicito.
+
+        Returns:
+            (aiuti, copertura completa, pagine lette)
+        """
+        soup = BeautifulSoup(html, "lxml")
+
+        link_csv = None
+        for a in soup.find_all("a"):
+            if "scarica csv" in a.get_text(" ", strip=True).lower() and a.get("href"):
+                link_csv = a
+                break
+
+        tabella = self._trova_tabella(soup)
+        if tabella is not None:
+            aiuti, righe_lette = self._aiuti_da_tabella(tabella, tre_anni_fa)
+            if righe_lette:
+                totale = totale_dichiarato(soup)
+                max_pagine = int(os.environ.get("RNA_MAX_PAGINE", "10"))
+                pagine = 1
+                url_pagina = self._url_risultati
+                successiva = link_pagina_successiva(soup)
+                while successiva and pagine < max_pagine:
+                    url_pagina = urljoin(url_pagina, successiva)
+                    risposta = sessione.get(url_pagina, timeout=self.timeout)
+                    risposta.raise_for_status()
+                    pagina_soup = BeautifulSoup(risposta.text, "lxml")
+                    tabella = self._trova_tabella(pagina_soup)
+                    if tabella is None:
+                        break
+                    aiuti_pagina, righe_pagina = self._aiuti_da_tabella(tabella, tre_anni_fa)
+                    if not righe_pagina:
+                        break
+                    aiuti += aiuti_pagina
+                    righe_lette += righe_pagina
+                    pagine += 1
+                    successiva = link_pagina_successiva(pagina_soup)
+
+                completa = not successiva and (
+                    righe_lette >= totale if totale is not None else not (pagine == 1 and paginazione_presente(soup))
+                )
+                if completa:
+                    return aiuti, True, pagine
+                # Pagine non seguibili o oltre il limite: il CSV contiene tutte le righe
+                if link_csv is not None:
+                    return self._aiuti_da_csv_link(sessione, link_csv, tre_anni_fa), True, pagine
+                return aiuti, False, pagine
+
+        # Tabella assente o senza righe: prova il CSV
+        if link_csv is not None:
+            return self._aiuti_da_csv_link(sessione, link_csv, tre_anni_fa), True, 1
+
+        testo = soup.get_text(" ", strip=True).lower()
+        if any(t in testo for t in TESTI_NESSUN_RISULTATO):
+            return [], True, 1
+
+        raise RNAHttpErrore("Nessuna tabella risultati, CSV o messaggio 'nessun risultato' nella risposta")
+
+    def _aiuti_da_csv_link(self, sessione: requests.Session, link_csv, tre_anni_fa: datetime) -> list[dict]:
+        risposta = sessione.get(urljoin(self._url_risultati, link_csv["href"]), timeout=self.timeout)
+        risposta.raise_for_status()
+        return self._aiuti_da_csv(risposta.content, tre_anni_fa)
+
+    def _aiuti_da_tabella(self, tabella, tre_anni_fa: datetime) -> tuple[list[dict], int]:
+        """Restituisce (aiuti nel triennio, numero di righe dati lette)"""
+        headers = [th.get_text(" ", strip=True).lower() for th in tabella.find_all("th")]
+
+        def idx_of(predicate):
+            for i, t in enumerate(headers):
+                if predicate(t):
+                    return i
+            return -1
+
+        data_idx = idx_of(lambda t: "data" in t and "concessione" in t)
+        importo_idx = idx_of(lambda t: ("elemento" in t and "aiuto" in t) or "importo" in t)
+        titolo_idx = idx_of(lambda t: "titolo" in t)
+        cor_idx = idx_of(lambda t: t.strip() == "cor" or "codice univoco" in t)
+
+        aiuti = []
+        righe_dati = 0
+        corpo = tabella.find("tbody") or tabella
+        for tr in corpo.find_all("tr"):
+            celle = [td.get_text(" ", strip=True) for td in tr.find_all("td")]
+            if len(celle) < 3:
+                continue
+            righe_dati += 1
+
+            data_txt = celle[data_idx] if 0 <= data_idx < len(celle) else ""
+            m = re.search(r"\b(\d{2}/\d{2}/\d{4})\b", data_txt) or next(
+                (m for m in (re.search(r"\b(\d{2}/\d{2}/\d{4})\b", c) for c in celle) if m), None
+            )
+            if not m:
+                continue
+            data_txt = m.group(1)
+            try:
+                data_conc = datetime.strptime(data_txt, "%d/%m/%Y")
+            except ValueError:
+                continue
+            if data_conc < tre_anni_fa:
+                continue
+
+            importo = parse_importo_it(celle[importo_idx]) if 0 <= importo_idx < len(celle) else None
+            if not importo:
+                importo = next((parse_importo_it(c) for c in celle if "€" in c and parse_importo_it(c)), None)
+            if not importo:
+                continue
+
+            titolo = celle[titolo_idx] if 0 <= titolo_idx < len(celle) else (celle[2] or "N/A")
+            aiuto = {
+                "data_concessione": data_txt,
+                "importo": importo,
+                "titolo_misura": titolo or "N/A",
+                "data": data_txt,
+            }
+            if 0 <= cor_idx < len(celle) and celle[cor_idx]:
+                aiuto["cor"] = celle[cor_idx]
+            aiuti.append(aiuto)
+        return aiuti, righe_dati
+
+    def _aiuti_da_csv(self, dati: bytes, tre_anni_fa: datetime) -> list[dict]:
+        """Parse CSV RNA con il lettore comune (rna_csv)"""
+        try:
+            return aiuti_da_csv(dati, tre_anni_fa)
+        except ValueError as e:
+            raise RNAHttpErrore(str(e))
+
+
+# ============================================================================
+# FUNZIONI DI TEST
+# ============================================================================
+
+def test_client_http_locale():
+    """
+    Test del client HTTP contro un server locale che imita il form RNA
+    (token nascosto, select tipp, tabella risultati e link SCARICA CSV).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    oggi = datetime.now()
+    recente = (oggi - timedelta(days=100)).strftime("%d/%m/%Y")
+    vecchia = (oggi - timedelta(days=4 * 365)).strftime("%d/%m/%Y")
+
+    form_html = """
+    <html><body>
+    <form action="/trasparenza/aiuti" method="get">
+      <input type="hidden" name="_token" value="abc123">
+      <input type="text" name="cfBen">
+      <select name="tipp"><option value="">Tutti</option><option value="DM">De Minimis</option></select>
+      <input type="text" name="annoc"><input type="text" name="annoc2">
+      <input type="submit" value="Cerca">
+    </form>
+    </body></html>
+    """
+
+    def riga(n):
+        return f"<tr><td>{n}</td><td>{n}{n}</td><td>Bando {n}</td><td>{recente}</td><td>€ 100,00</td></tr>"
+
+    intestazione = ("<table id=\"trasparenzaAiuti\"><thead><tr><th>CAR</th><th>COR</th><th>Titolo Misura</th>"
+                    "<th>Data Concessione</th><th>Elemento Aiuto</th></tr></thead><tbody>")
+
+    def risultati_html(cf, pagina=1):
+        if cf == "33333333333":
+            # Paginazione lato server con link seguibili: 2 righe per pagina, 3 pagine
+            successiva = (f'<ul class="pagination"><li><a href="?cfBen={cf}&page={pagina + 1}">Successiva</a></li></ul>'
+                          if pagina < 3 else '<ul class="pagination"><li class="disabled"><a href="#">Successiva</a></li></ul>')
+            return (f"<html><body>{intestazione}{riga(2 * pagina - 1)}{riga(2 * pagina)}</tbody></table>"
+                    f"<div>Visualizzati da {2 * pagina - 1} a {2 * pagina} di 6 elementi</div>{successiva}</body></html>")
+        if cf == "44444444444":
+            # Paginazione solo JavaScript, senza CSV: risultato parziale
+            return (f"<html><body>{intestazione}{riga(1)}{riga(2)}</tbody></table>"
+                    "<div>Visualizzati da 1 a 2 di 9 elementi</div>"
+                    '<a class="paginate_button next" href="#">Successiva</a></body></html>')
+        if cf == "00000000000":
+            return "<html><body><p>Nessun risultato trovato</p></body></html>"
+        if cf == "22222222222":
+            # Tabella vuota (DataTables lato client): i dati arrivano dal CSV
+            return """<html><body><table id="trasparenzaAiuti"><thead><tr><th>Titolo Misura</th>
+            <th>Data Concessione</th><th>Elemento Aiuto</th></tr></thead><tbody></tbody></table>
+            <a href="/export.csv">SCARICA CSV</a></body></html>"""
+        return f"""<html><body><table id="trasparenzaAiuti">
+        <thead><tr><th>CAR</th><th>COR</th><th>Titolo Misura</th><th>Data Concessione</th><th>Elemento Aiuto</th></tr></thead>
+        <tbody>
+          <tr><td>1</td><td>111</td><td>Bando digitale</td><td>{recente}</td><td>€ 12.345,67</td></tr>
+          <tr><td>2</td><td>222</td><td>Bando vecchio</td><td>{vecchia}</td><td>€ 50.000,00</td></tr>
+        </tbody></table></body></html>"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path == "/export.csv":
+                corpo = f'"Titolo Misura";"Data Concessione";"Elemento Aiuto"\n"Bando CSV";"{recente}";"€ 1.000,00"\n'
+                tipo = "text/csv; charset=utf-8"
+            elif "cfBen" in params:
+                if "page" not in params:
+                    assert params.get("_token") == ["abc123"], "token nascosto non inviato"
+                    assert params.get("tipp") == ["DM"], "tipp non impostato a De Minimis"
+                corpo = risultati_html(params["cfBen"][0], int(params.get("page", ["1"])[0]))
+                tipo = "text/html; charset=utf-8"
+            else:
+                corpo = form_html
+                tipo = "text/html; charset=utf-8"
+            dati = corpo.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(dati)))
+            self.end_headers()
+            self.wfile.write(dati)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = RNAHttpClient(url=f"http://127.0.0.1:{server.server_port}/trasparenza/aiuti")
+
+        r = client.calcola_deminimis("11111111111", oggi)
+        assert r["numero_aiuti"] == 1 and r["totale_de_minimis"] == 12345.67, r
+        assert r["aiuti_trovati"][0]["titolo_misura"] == "Bando digitale", r
+        assert r["aiuti_trovati"][0]["cor"] == "111", r
+
+        r = client.calcola_deminimis("22222222222", oggi)
+        assert r["numero_aiuti"] == 1 and r["totale_de_minimis"] == 1000.0, r
+
+        r = client.calcola_deminimis("00000000000", oggi)
+        assert r["numero_aiuti"] == 0 and r["margine_rimanente"] == 300000.0, r
+
+        r = client.calcola_deminimis("33333333333", oggi)
+        assert r["numero_aiuti"] == 6 and r["copertura_completa"] and r["pagine_analizzate"] == 3, r
+
+        r = client.calcola_deminimis("44444444444", oggi)
+        assert r["numero_aiuti"] == 2 and not r["copertura_completa"], r
+        print("✅ Test client HTTP RNA superato")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_client_http_locale()
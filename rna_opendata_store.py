@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+RNA OpenData - Archivio locale indicizzato
+==========================================
+
+Ingestione dei dump mensili OpenData_Aiuti_YYYY_MM.xml del Registro Nazionale
+Aiuti in un archivio SQLite su disco, indicizzato per codice fiscale del
+beneficiario e data di concessione.
+
+- I file XML (anche diversi GB) vengono letti in streaming con iterparse:
+  ogni <AIUTO> viene elaborato e subito liberato, memoria costante.
+- Si conservano solo gli aiuti con componenti De Minimis (regolamento
+  contenente "minimis"); l'importo è la somma degli ELEMENTO_DI_AIUTO.
+- La tabella file_ingeriti traccia i mesi coperti: calcola_deminimis usa
+  l'archivio solo per i periodi interamente coperti dai dump.
+- Ogni mese ingerito aggiorna anche il filtro Bloom dei beneficiari (rna_bloom).
+
+Uso da riga di comando:
+    python rna_opendata_store.py OpenData_Aiuti_2025_07.xml [altri file o cartelle...]
+"""
+
+from datetime import datetime, date, timedelta
+from contextlib import closing
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from archivio_sqlite import percorso_dati, connetti
+
+
+# Righe inserite per transazione durante l'ingestione
+DIMENSIONE_BATCH = 5000
+
+PATTERN_NOME_FILE = re.compile(r"OpenData_Aiuti_(\d{4})_(\d{2})", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS aiuti (
+    chiave TEXT PRIMARY KEY,
+    cf TEXT NOT NULL,
+    data_concessione TEXT NOT NULL,
+    importo REAL NOT NULL,
+    titolo_misura TEXT,
+    cor TEXT,
+    car TEXT,
+    mese_fonte TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_aiuti_cf_data ON aiuti (cf, data_concessione);
+CREATE TABLE IF NOT EXISTS file_ingeriti (
+    mese TEXT PRIMARY KEY,
+    nome_file TEXT,
+    aiuti_letti INTEGER,
+    aiuti_de_minimis INTEGER,
+    ingerito_il TEXT
+);
+"""
+
+
+def _tag_locale(tag: str) -> str:
+    """Rimuove l'eventuale namespace XML ({uri}TAG -> TAG)"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _float_xml(testo: str) -> float:
+    if not testo:
+        return 0.0
+    testo = testo.strip()
+    # I dump usano il punto decimale; tollera anche il formato italiano
+    if "," in testo:
+        testo = testo.replace(".", "").replace(",", ".")
+    try:
+        return float(testo)
+    except ValueError:
+        return 0.0
+
+
+def _fine_mese(anno: int, mese: int) -> date:
+    if mese == 12:
+        return date(anno, 12, 31)
+    return date(anno, mese + 1, 1) - timedelta(days=1)
+
+
+def copertura_mesi(mesi) -> tuple[date, date] | None:
+    """
+    Periodo coperto senza buchi da un insieme di mesi "YYYY-MM", fino al più recente.
+
+    Returns:
+        (primo giorno, ultimo giorno) oppure None se l'insieme è vuoto
+    """
+    mesi = set(mesi)
+    if not mesi:
+        return None
+    anno, mese = map(int, max(mesi).split("-"))
+    fine = _fine_mese(anno, mese)
+    # Risale a ritroso finché i mesi sono contigui
+    while True:
+        prec_anno, prec_mese = (anno, mese - 1) if mese > 1 else (anno - 1, 12)
+        if f"{prec_anno:04d}-{prec_mese:02d}" not in mesi:
+            break
+        anno, mese = prec_anno, prec_mese
+    return date(anno, mese, 1), fine
+
+
+def mese_da_nome_file(percorso: str) -> str | None:
+    """Estrae "YYYY-MM" dal nome OpenData_Aiuti_YYYY_MM.xml"""
+    m = PATTERN_NOME_FILE.search(os.path.basename(percorso))
+    return f"{m.group(1)}-{m.group(2)}" if m else None
+
+
+def leggi_aiuti_xml(percorso: str):
+    """
+    Generatore sugli aiuti De Minimis di un dump XML, in streaming (memoria costante).
+
+    Yields:
+        tuple: (aiuti_letti_finora, dict aiuto) con chiavi cf, data_concessione (ISO),
+            importo, titolo_misura, cor, car
+    """
+    letti = 0
+    # Elementi aperti: il padre di un AIUTO è l'ultimo ancora aperto (radice o wrapper LISTA_AIUTI)
+    aperti = []
+    for evento, elem in ET.iterparse(percorso, events=("start", "end")):
+        if evento == "start":
+            aperti.append(elem)
+            continue
+        aperti.pop()
+        if _tag_locale(elem.tag) != "AIUTO":
+            continue
+
+        letti += 1
+        campi = {}
+        importo_dm = 0.0
+        componente_dm = False
+        for figlio in elem.iter():
+            nome = _tag_locale(figlio.tag)
+            if nome == "COMPONENTE_AIUTO":
+                testo_reg = " ".join(
+                    (c.text or "") for c in figlio.iter()
+                    if _tag_locale(c.tag) in ("COD_REGOLAMENTO", "DES_REGOLAMENTO", "DES_PROCEDIMENTO")
+                ).lower()
+                if "minimis" in testo_reg:
+                    componente_dm = True
+                    importo_dm += sum(
+                        _float_xml(c.text) for c in figlio.iter() if _tag_locale(c.tag) == "ELEMENTO_DI_AIUTO"
+                    )
+            elif nome in ("CODICE_FISCALE_BENEFICIARIO", "DATA_CONCESSIONE", "TITOLO_MISURA", "COR", "CAR"):
+                campi.setdefault(nome, (figlio.text or "").strip())
+
+        # Libera l'elemento e lo stacca dal padre: root.clear() non basta se gli
+        # AIUTO stanno sotto un wrapper, che li terrebbe tutti in memoria
+        elem.clear()
+        if aperti:
+            padre = aperti[-1]
+            if len(padre) and padre[0] is elem:
+                del padre[0]
+            else:
+                padre.remove(elem)
+
+        cf = campi.get("CODICE_FISCALE_BENEFICIARIO", "").upper()
+        data_txt = campi.get("DATA_CONCESSIONE", "")[:10]
+        if not componente_dm or not cf or importo_dm <= 0 or not re.match(r"\d{4}-\d{2}-\d{2}$", data_txt):
+            yield letti, None
+            continue
+
+        yield letti, {
+            "cf": cf,
+            "data_concessione": data_txt,
+            "importo": round(importo_dm, 2),
+            "titolo_misura": campi.get("TITOLO_MISURA") or "N/A",
+            "cor": campi.get("COR") or None,
+            "car": campi.get("CAR") or None,
+        }
+
+
+class RNAOpenDataStore:
+    """Archivio locale degli aiuti De Minimis costruito dai dump OpenData RNA"""
+
+    def __init__(self, percorso: str = None):
+        """
+        Args:
+            percorso (str): File SQLite (default data/rna_opendata.sqlite o RNA_OPENDATA_DB)
+        """
+        self.percorso = percorso or percorso_dati("rna_opendata.sqlite", "RNA_OPENDATA_DB")
+
+    def esiste(self) -> bool:
+        return os.path.exists(self.percorso)
+
+    def _connessione(self):
+        conn = connetti(self.percorso)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def ingerisci_file(self, percorso_xml: str, mese: str = None, forza: bool = False) -> dict:
+        """
+        Importa un dump mensile nell'archivio.
+
+        Args:
+            percorso_xml (str): File OpenData_Aiuti_YYYY_MM.xml
+            mese (str): "YYYY-MM" coperto dal file (default: ricavato dal nome)
+            forza (bool): Reimporta anche se il mese è già stato ingerito
+
+        Returns:
+            dict: Statistiche (mese, aiuti_letti, aiuti_de_minimis, secondi, saltato)
+        """
+        mese = mese or mese_da_nome_file(percorso_xml)
+        if not mese:
+            raise ValueError(f"Impossibile ricavare il mese dal nome file: {percorso_xml} (usa mese='YYYY-MM')")
+
+        inizio = time.time()
+        with closing(self._connessione()) as conn:
+            if not forza and conn.execute("SELECT 1 FROM file_ingeriti WHERE mese = ?", (mese,)).fetchone():
+                print(f"⏭️  Mese {mese} già ingerito, skip ({os.path.basename(percorso_xml)})")
+                return {"mese": mese, "saltato": True}
+
+            print(f"📥 Ingestione {os.path.basename(percorso_xml)} (mese {mese})...")
+            letti = 0
+            de_minimis = 0
+            batch = []
+            # CF del mese per l'aggiornamento incrementale del filtro Bloom (rna_bloom)
+            codici_fiscali = set()
+            sql = (
+                "INSERT OR REPLACE INTO aiuti "
+                "(chiave, cf, data_concessione, importo, titolo_misura, cor, car, mese_fonte) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            )
+            try:
+                for letti, aiuto in leggi_aiuti_xml(percorso_xml):
+                    if aiuto is None:
+                        continue
+                    de_minimis += 1
+                    codici_fiscali.add(aiuto["cf"])
+                    chiave = aiuto["cor"] or f"{aiuto['car']}|{aiuto['cf']}|{aiuto['data_concessione']}|{aiuto['importo']}"
+                    batch.append((
+                        chiave, aiuto["cf"], aiuto["data_concessione"], aiuto["importo"],
+                        aiuto["titolo_misura"], aiuto["cor"], aiuto["car"], mese
+                    ))
+                    if len(batch) >= DIMENSIONE_BATCH:
+                        conn.executemany(sql, batch)
+                        batch.clear()
+                        if de_minimis % (DIMENSIONE_BATCH * 20) == 0:
+                            print(f"   ⏳ {letti} aiuti letti, {de_minimis} De Minimis...")
+                if batch:
+                    conn.executemany(sql, batch)
+                conn.execute(
+                    "INSERT OR REPLACE INTO file_ingeriti (mese, nome_file, aiuti_letti, aiuti_de_minimis, ingerito_il) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (mese, os.path.basename(percorso_xml), letti, de_minimis, datetime.now().isoformat(timespec="seconds"))
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        try:
+            from rna_bloom import aggiorna_con_mese
+            aggiorna_con_mese(mese, codici_fiscali)
+        except Exception as e:
+            print(f"⚠️ Filtro Bloom non aggiornato per {mese}: {e} (ricostruibile con python rna_bloom.py --da-archivio)")
+
+        secondi = round(time.time() - inizio, 1)
+        print(f"✅ {mese}: {letti} aiuti letti, {de_minimis} De Minimis indicizzati in {secondi}s")
+        return {"mese": mese, "aiuti_letti": letti, "aiuti_de_minimis": de_minimis, "secondi": secondi, "saltato": False}
+
+    def ingerisci_cartella(self, cartella: str, forza: bool = False) -> list[dict]:
+        """Importa tutti i file OpenData_Aiuti_YYYY_MM.xml di una cartella, in ordine di mese"""
+        nomi = sorted(n for n in os.listdir(cartella) if mese_da_nome_file(n) and n.lower().endswith(".xml"))
+        return [self.ingerisci_file(os.path.join(cartella, n), forza=forza) for n in nomi]
+
+    def mesi_ingeriti(self) -> list[str]:
+        if not self.esiste():
+            return []
+        with closing(self._connessione()) as conn:
+            return [r["mese"] for r in conn.execute("SELECT mese FROM file_ingeriti ORDER BY mese")]
+
+    def copertura(self) -> tuple[date, date] | None:
+        """
+        Periodo coperto senza buchi dai dump, fino all'ultimo mese ingerito.
+
+        Returns:
+            (primo giorno, ultimo giorno) oppure None se l'archivio è vuoto
+        """
+        return copertura_mesi(self.mesi_ingeriti())
+
+    def copre(self, dal: datetime, al: datetime) -> bool:
+        """True se l'intervallo [dal, al] è interamente coperto dai dump ingeriti"""
+        copertura = self.copertura()
+        if not copertura:
+            return False
+        inizio, fine = copertura
+        return inizio <= dal.date() and al.date() <= fine
+
+    def aiuti_per_cf(self, cf: str, dal: datetime, al: datetime) -> list[dict]:
+        """
+        Aiuti De Minimis del beneficiario concessi tra dal e al (inclusi), dal più recente.
+
+        Returns:
+            list: Aiuti nel formato di calcola_deminimis (date dd/mm/yyyy)
+        """
+        if not self.esiste():
+            return []
+        with closing(self._connessione()) as conn:
+            righe = conn.execute(
+                "SELECT data_concessione, importo, titolo_misura, cor FROM aiuti "
+                "WHERE cf = ? AND data_concessione BETWEEN ? AND ? ORDER BY data_concessione DESC",
+                (cf.strip().upper(), dal.strftime("%Y-%m-%d"), al.strftime("%Y-%m-%d"))
+            ).fetchall()
+        aiuti = []
+        for r in righe:
+            data_txt = datetime.strptime(r["data_concessione"], "%Y-%m-%d").strftime("%d/%m/%Y")
+            aiuti.append({
+                "data_concessione": data_txt,
+                "importo": r["importo"],
+                "titolo_misura": r["titolo_misura"] or "N/A",
+                "data": data_txt,
+                "cor": r["cor"],
+            })
+        return aiuti
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python rna_opendata_store.py <file.xml | cartella> [...]")
+        sys.exit(1)
+
+    store = RNAOpenDataStore()
+    for arg in sys.argv[1:]:
+        if os.path.isdir(arg):
+            store.ingerisci_cartella(arg)
+        else:
+            store.ingerisci_file(arg)
+
+    copertura = store.copertura()
+    if copertura:
+        print(f"📊 Copertura archivio: {copertura[0].strftime('%d/%m/%Y')} → {copertura[1].strftime('%d/%m/%Y')}")
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Registro adattivo delle strategie di estrazione RNA
+===================================================
+
+La tabella dei risultati RNA si può leggere in più modi (header della tabella,
+regex sul testo, export CSV, parsing per posizione). Il registro tiene per
+ogni strategia tasso di successo e latenza (medie mobili esponenziali),
+salvati su file JSON così da sopravvivere ai riavvii:
+
+- i parser in memoria (header, regex, posizione) costano microsecondi e restano
+  nell'ordine di accuratezza: header sempre per primo, la lettura per posizione per ultima
+- solo le strategie costose (download CSV) sono adattive: ordinate tra loro per
+  costo atteso (latenza / tasso di successo) e, se falliscono N volte di fila,
+  saltate e riprovate dopo RNA_STRATEGIE_RIPROVA_OGNI tentativi delle altre
+  nel caso il layout RNA cambi di nuovo
+- una tabella letta correttamente ma senza aiuti nel periodo è un successo
+  (esito "zero"), non un fallimento della strategia
+
+Il file JSON viene riscritto al più ogni RNA_STRATEGIE_SALVA_SECONDI (e all'uscita
+del processo), non a ogni tentativo.
+
+Configurazione via variabili d'ambiente:
+- RNA_STRATEGIE_FILE: percorso del file JSON (default data/rna_strategie.json)
+- RNA_STRATEGIE_ADATTIVE=0: ordine fisso (le statistiche vengono comunque registrate)
+- RNA_STRATEGIE_SOGLIA_FALLIMENTI (default 3), RNA_STRATEGIE_RIPROVA_OGNI (default 25)
+- RNA_STRATEGIE_SALVA_SECONDI: intervallo minimo tra due scritture del file (default 30)
+
+Statistiche correnti:
+    python rna_strategie.py
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from archivio_sqlite import percorso_dati
+
+
+# Ordine predefinito, lo stesso di estrai_aiuti_tabella con il CSV prima del parsing per posizione
+STRATEGIE_ESTRAZIONE = ("header", "regex", "csv", "posizione")
+
+# Strategie costose (download, rete): le sole riordinate ed escluse in base alle statistiche
+STRATEGIE_COSTOSE = ("csv",)
+
+# Peso dell'ultima osservazione nelle medie mobili
+ALFA = 0.3
+
+
+# Esiti di un tentativo: aiuti trovati, tabella letta senza aiuti nel periodo, fallito
+ESITO_AIUTI = "aiuti"
+ESITO_ZERO = "zero"
+ESITO_FALLITO = "fallito"
+
+
+def esito_strategia(aiuti: list[dict], continua: bool, letta: bool = False) -> str:
+    """
+    Args:
+        letta (bool): La strategia ha interpretato i dati (es. CSV letto, righe tutte
+            fuori periodo): zero aiuti è un risultato, non un fallimento
+    """
+    if aiuti:
+        return ESITO_AIUTI
+    if letta or not continua:
+        return ESITO_ZERO
+    return ESITO_FALLITO
+
+
+def esito_valido(aiuti: list[dict], continua: bool, letta: bool = False) -> bool:
+    """Una strategia è riuscita se ha trovato aiuti o ha stabilito che non ce ne sono"""
+    return esito_strategia(aiuti, continua, letta) != ESITO_FALLITO
+
+
+class RegistroStrategie:
+    """Statistiche per strategia con persistenza JSON, condivise tra thread"""
+
+    def __init__(self, percorso: str = None, soglia_fallimenti: int = None, riprova_ogni: int = None,
+                 salva_ogni: float = None):
+        self.percorso = percorso or percorso_dati("rna_strategie.json", "RNA_STRATEGIE_FILE")
+        self.soglia_fallimenti = int(soglia_fallimenti or os.environ.get("RNA_STRATEGIE_SOGLIA_FALLIMENTI", "3"))
+        self.riprova_ogni = int(riprova_ogni or os.environ.get("RNA_STRATEGIE_RIPROVA_OGNI", "25"))
+        self.salva_ogni = float(os.environ.get("RNA_STRATEGIE_SALVA_SECONDI", "30") if salva_ogni is None else salva_ogni)
+        self._lock = threading.Lock()
+        self._statistiche = self._carica()
+        self._modificate = False
+        self._ultimo_salvataggio = time.time()
+
+    def _carica(self) -> dict:
+        try:
+            with open(self.percorso, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _tentativi_totali(self) -> int:
+        return sum(stat["tentativi"] for stat in self._statistiche.values())
+
+    def _salva(self):
+        cartella = os.path.dirname(self.percorso)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+        temporaneo = f"{self.percorso}.tmp"
+        with open(temporaneo, "w", encoding="utf-8") as f:
+            json.dump(self._statistiche, f, indent=2)
+        os.replace(temporaneo, self.percorso)
+        self._modificate = False
+        self._ultimo_salvataggio = time.time()
+
+    def salva(self):
+        """Scrive su file le statistiche non ancora salvate"""
+        with self._lock:
+            if not self._modificate:
+                return
+            try:
+                self._salva()
+            except OSError as e:
+                print(f"⚠️ Statistiche strategie RNA non salvate: {e}")
+
+    def ordine(self, strategie=STRATEGIE_ESTRAZIONE) -> list[str]:
+        """
+        Strategie da provare (sola lettura): i parser in memoria nell'ordine dato,
+        le strategie costose nei loro posti ordinate per costo atteso. Una strategia
+        costosa esclusa per fallimenti consecutivi torna tra le candidate dopo
+        riprova_ogni tentativi complessivi dall'ultimo fallimento.
+        """
+        if os.environ.get("RNA_STRATEGIE_ADATTIVE", "1").lower() in ("0", "false", "no"):
+            return list(strategie)
+
+        with self._lock:
+            totale = self._tentativi_totali()
+            costose = []
+            for posizione, nome in enumerate(strategie):
+                if nome not in STRATEGIE_COSTOSE:
+                    continue
+                stat = self._statistiche.get(nome)
+                if stat and stat["fallimenti_consecutivi"] >= self.soglia_fallimenti:
+                    if totale - stat.get("esclusa_a", 0) < self.riprova_ogni:
+                        continue
+                if stat and stat["successi"]:
+                    costo = stat["latenza"] / max(stat["tasso_successo"], 0.05)
+                else:
+                    costo = float("inf")
+                costose.append((costo, posizione, nome))
+
+        # Posti delle strategie costose rimaste, riempiti in ordine di costo
+        posti = sorted(posizione for _, posizione, _ in costose)
+        per_posto = dict(zip(posti, (nome for _, _, nome in sorted(costose))))
+        return [per_posto[posizione] if nome in STRATEGIE_COSTOSE else nome
+                for posizione, nome in enumerate(strategie)
+                if nome not in STRATEGIE_COSTOSE or posizione in per_posto]
+
+    def registra(self, nome: str, successo: bool, secondi: float):
+        """Aggiorna le statistiche di una strategia dopo un tentativo (file riscritto al più ogni salva_ogni s)"""
+        with self._lock:
+            stat = self._statistiche.get(nome)
+            if stat is None:
+                stat = self._statistiche[nome] = {
+                    "tentativi": 0, "successi": 0, "tasso_successo": float(successo),
+                    "latenza": secondi, "fallimenti_consecutivi": 0, "esclusa_a": 0,
+                }
+            stat.pop("saltata", None)
+            stat["tentativi"] += 1
+            stat["successi"] += int(successo)
+            stat["tasso_successo"] = round((1 - ALFA) * stat["tasso_successo"] + ALFA * float(successo), 4)
+            stat["latenza"] = round((1 - ALFA) * stat["latenza"] + ALFA * secondi, 4)
+            stat["fallimenti_consecutivi"] = 0 if successo else stat["fallimenti_consecutivi"] + 1
+            if stat["fallimenti_consecutivi"] >= self.soglia_fallimenti:
+                # Da qui si contano i tentativi fino alla prossima riprova
+                stat["esclusa_a"] = self._tentativi_totali()
+            self._modificate = True
+            if time.time() - self._ultimo_salvataggio >= self.salva_ogni:
+                try:
+                    self._salva()
+                except OSError as e:
+                    print(f"⚠️ Statistiche strategie RNA non salvate: {e}")
+
+    def statistiche(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._statistiche))
+
+    def azzera(self):
+        """Dimentica le statistiche (es. dopo un cambio noto del sito RNA)"""
+        with self._lock:
+            self._statistiche = {}
+            self._modificate = False
+            try:
+                os.remove(self.percorso)
+            except OSError:
+                pass
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def get_registro() -> RegistroStrategie:
+    """Istanza condivisa del registro"""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroStrategie()
+            # Statistiche accumulate dopo l'ultima scrittura salvate all'uscita
+            atexit.register(_registro.salva)
+        return _registro
+
+
+def test_registro():
+    """Parser in memoria a ordine fisso, esclusione delle strategie costose, esito zero e persistenza"""
+    import tempfile
+    assert esito_strategia([], True, letta=True) == ESITO_ZERO and esito_valido([], True, letta=True)
+    assert esito_strategia([], True) == ESITO_FALLITO and esito_valido([], False)
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, "strategie.json")
+        registro = RegistroStrategie(percorso, soglia_fallimenti=2, riprova_ogni=3, salva_ogni=3600)
+        assert registro.ordine() == list(STRATEGIE_ESTRAZIONE)
+
+        # La latenza non sposta i parser in memoria: header resta primo, posizione ultima
+        for _ in range(2):
+            registro.registra("header", False, 0.002)
+            registro.registra("posizione", True, 0.0001)
+        assert registro.ordine() == list(STRATEGIE_ESTRAZIONE)
+
+        # csv fallisce due volte di fila: saltato
+        for _ in range(2):
+            registro.registra("csv", False, 4.0)
+        assert registro.ordine() == ["header", "regex", "posizione"]
+
+        # Leggere l'ordine non avvicina la riprova: contano i tentativi registrati
+        for _ in range(10):
+            registro.ordine()
+        assert "csv" not in registro.ordine()
+        for _ in range(3):
+            registro.registra("header", True, 0.001)
+        assert registro.ordine() == list(STRATEGIE_ESTRAZIONE)
+        registro.registra("csv", True, 3.0)
+
+        # Scrittura a lotti: nulla su file fino a salva()
+        assert not os.path.exists(percorso)
+        registro.salva()
+
+        # Persistenza tra istanze
+        riaperto = RegistroStrategie(percorso, soglia_fallimenti=2, riprova_ogni=3)
+        assert riaperto.statistiche()["csv"]["successi"] == 1
+        assert riaperto.ordine() == registro.ordine()
+    print("✅ test_registro OK")
+
+
+if __name__ == "__main__":
+    for nome, stat in get_registro().statistiche().items():
+        print(f"{nome:10} tentativi={stat['tentativi']:5} successo={stat['tasso_successo']:.2f} "
+              f"latenza={stat['latenza']:.2f}s fallimenti_consecutivi={stat['fallimenti_consecutivi']}")
+    print(f"Ordine corrente: {', '.join(get_registro().ordine())}")
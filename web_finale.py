@@ -57,6 +57,8 @@ def calcola_deminimis():
     try:
         data = request.get_json()
         mode = data.get('mode', 'auto')  # 'auto' o 'manual'
+        # force_refresh: ignora la cache dei risultati RNA e rifà la ricerca
+        force_refresh = bool(data.get('force_refresh', False))
         
         risultati = []
         
@@ -73,9 +75,12 @@ def calcola_deminimis():
                 print(f"⚠️ Errore inizializzazione RNA Calculator: {e}")
                 return jsonify({"errore": f"❌ Servizio RNA temporaneamente non disponibile: {str(e)}"}), 503
             
+            partite_iva = [piva.strip() for piva in partite_iva]
+            valide = [piva for piva in partite_iva if re.match(r'^\d{11}$', piva)]
+            # Calcolo reale da RNA, più società in parallelo
+            risultati_rna = dict(zip(valide, calc.calcola_batch(valide, force_refresh=force_refresh)))
+            
             for piva in partite_iva:
-                piva = piva.strip()
-                
                 if not re.match(r'^\d{11}$', piva):
                     risultati.append({
                         "partita_iva": piva,
@@ -84,9 +89,7 @@ def calcola_deminimis():
                     })
                     continue
                 
-                # Calcolo reale da RNA
-                print(f"🔍 Calcolo de minimis per C.F.: {piva}")
-                risultato_rna = calc.calcola_deminimis(piva)
+                risultato_rna = risultati_rna[piva]
                 
                 if risultato_rna.get("errore"):
                     risultati.append({
@@ -120,7 +123,9 @@ def calcola_deminimis():
                     "stato": stato,
                     "data_ricerca": risultato_rna["data_ricerca"],
                     "fonte": "RNA.gov.it",
-                    "pagine_analizzate": risultato_rna.get("pagine_analizzate", 1)
+                    "pagine_analizzate": risultato_rna.get("pagine_analizzate", 1),
+                    "copertura_completa": risultato_rna.get("copertura_completa", True),
+                    "da_cache": risultato_rna.get("da_cache", False)
                 })
         
         elif mode == 'aggregato':
@@ -173,16 +178,17 @@ def calcola_deminimis():
             except Exception as e:
                 print(f"⚠️ Errore inizializzazione RNA Calculator: {e}")
                 return jsonify({"errore": f"❌ Servizio RNA temporaneamente non disponibile: {str(e)}"}), 503
+            from deminimis_ledger import LedgerAiutiGruppo
             risultati_dettaglio = []
-            totale_gruppo = 0
+            ledger_gruppo = LedgerAiutiGruppo()
             
-            for cf in societa_da_calcolare:
-                print(f"  🔍 Calcolo de minimis per C.F.: {cf}")
-                risultato_rna = calc.calcola_deminimis(cf)
+            # Tutte le società del gruppo in parallelo
+            risultati_rna = calc.calcola_batch(societa_da_calcolare, force_refresh=force_refresh)
+            for cf, risultato_rna in zip(societa_da_calcolare, risultati_rna):
                 
                 if not risultato_rna.get("errore"):
                     totale = risultato_rna["totale_de_minimis"]
-                    totale_gruppo += totale
+                    ledger_gruppo.aggiungi_societa(cf, risultato_rna.get("aiuti_trovati", []))
                     
                     risultati_dettaglio.append({
                         "codice_fiscale": cf,
@@ -199,6 +205,7 @@ def calcola_deminimis():
                     })
             
             # 4. Calcola stato globale
+            totale_gruppo = ledger_gruppo.totale()
             soglia = 300000.0
             percentuale_gruppo = (totale_gruppo / soglia) * 100
             margine_gruppo = max(0, soglia - totale_gruppo)
@@ -213,6 +220,8 @@ def calcola_deminimis():
                 stato_gruppo = "ok"
             
             # 5. Prepara risposta aggregata
+            duplicati_rimossi = ledger_gruppo.duplicati_rimossi + sum(
+                r.get("duplicati_rimossi", 0) for r in risultati_rna if not r.get("errore"))
             risultati.append({
                 "partita_iva": partita_iva,
                 "totale_de_minimis": totale_gruppo,
@@ -222,6 +231,7 @@ def calcola_deminimis():
                 "data_ricerca": datetime.now().strftime("%d/%m/%Y %H:%M"),
                 "fonte": "RNA.gov.it + Cribis Archivio",
                 "numero_societa": len(societa_da_calcolare),
+                "duplicati_rimossi": duplicati_rimossi,
                 "dettaglio_societa": risultati_dettaglio
             })
         
@@ -283,6 +293,7 @@ def cribis_nuova_ricerca():
     try:
         data = request.get_json()
         partita_iva = data.get('partita_iva', '').strip()
+        force_refresh = bool(data.get('force_refresh', False))
         
         # Validazione P.IVA
         if not re.match(r'^\d{11}$', partita_iva):
@@ -299,13 +310,8 @@ def cribis_nuova_ricerca():
             # Headless su Render/produzione
             is_production = ('RENDER' in os.environ) or (os.environ.get('FLASK_ENV') == 'production')
             calc = CalcolatoreDimensionePMI(headless=is_production)
-            # Assicura login/sessione Cribis prima di chiamare il metodo interno
-            if not getattr(calc, 'browser_attivo', False) or calc.cribis is None:
-                from cribis_nuova_ricerca import CribisNuovaRicerca
-                calc.cribis = CribisNuovaRicerca(headless=is_production)
-                calc.cribis.__enter__()
-                calc.cribis.login()
-                calc.browser_attivo = True
+            # Cache dei gruppi consultata prima del login: browser Cribis avviato solo se serve
+            calc.force_refresh = force_refresh
             gruppo = calc._estrai_gruppo_completo(partita_iva)
             if gruppo.get('errore'):
                 return jsonify({"errore": gruppo['errore'], "partita_iva": partita_iva}), 500
@@ -391,32 +397,27 @@ def cribis_nuova_ricerca():
         except Exception as e:
             print(f"⚠️ Errore inizializzazione RNA Calculator: {e}")
             return jsonify({"errore": f"❌ Servizio RNA temporaneamente non disponibile: {str(e)}"}), 503
+        from deminimis_ledger import LedgerAiutiGruppo
         risultati_dettaglio = []
-        totale_gruppo = 0
-        numero_aiuti_totale = 0
-        tutti_aiuti = []
+        # Aiuti del gruppo in forma colonnare: totali, subtotali e ordinamento senza dict per riga
+        ledger_gruppo = LedgerAiutiGruppo()
         
-        for cf in societa_da_calcolare:
-            print(f"  🔍 Calcolo de minimis per C.F.: {cf}")
-            risultato_rna = calc.calcola_deminimis(cf)
+        # Tutte le società del gruppo in parallelo
+        risultati_rna = calc.calcola_batch(societa_da_calcolare, force_refresh=force_refresh)
+        for cf, risultato_rna in zip(societa_da_calcolare, risultati_rna):
             
             if not risultato_rna.get("errore"):
                 totale = risultato_rna["totale_de_minimis"]
                 numero_aiuti = risultato_rna["numero_aiuti"]
-                totale_gruppo += totale
-                numero_aiuti_totale += numero_aiuti
-                
-                # Aggiungi aiuti con info società
                 aiuti_societa = risultato_rna.get("aiuti_trovati", [])
-                for aiuto in aiuti_societa:
-                    aiuto["societa_cf"] = cf
-                    tutti_aiuti.append(aiuto)
+                ledger_gruppo.aggiungi_societa(cf, aiuti_societa)
                 
                 risultati_dettaglio.append({
                     "codice_fiscale": cf,
                     "totale_de_minimis": totale,
                     "numero_aiuti": numero_aiuti,
                     "aiuti_trovati": aiuti_societa,
+                    "copertura_completa": risultato_rna.get("copertura_completa", True),
                     "stato": "ok" if totale < 160000 else "attenzione"
                 })
             else:
@@ -427,6 +428,8 @@ def cribis_nuova_ricerca():
                 })
         
         # Calcola stato globale
+        totale_gruppo = ledger_gruppo.totale()
+        numero_aiuti_totale = len(ledger_gruppo)
         soglia = 300000.0
         percentuale_gruppo = (totale_gruppo / soglia) * 100
         margine_gruppo = max(0, soglia - totale_gruppo)
@@ -440,8 +443,11 @@ def cribis_nuova_ricerca():
         else:
             stato_gruppo = "ok"
         
-        # Ordina aiuti per data (più recenti prima)
-        tutti_aiuti.sort(key=lambda x: x.get("data_concessione", x.get("data", "")), reverse=True)
+        # Aiuti di tutte le società per data reale (più recenti prima), convertiti in JSON solo qui
+        tutti_aiuti = ledger_gruppo.a_json()
+        # Righe scartate dalla deduplica: durante l'estrazione RNA e nel ledger di gruppo
+        duplicati_rimossi = ledger_gruppo.duplicati_rimossi + sum(
+            r.get("duplicati_rimossi", 0) for r in risultati_rna if not r.get("errore"))
         
         return jsonify({
             "partita_iva": partita_iva,
@@ -457,6 +463,7 @@ def cribis_nuova_ricerca():
             "stato": stato_gruppo,
             "fonte": "RNA.gov.it + Cribis Nuova Ricerca",
             "numero_societa": len(societa_da_calcolare),
+            "duplicati_rimossi": duplicati_rimossi,
             "dettaglio_societa": risultati_dettaglio,
             "tutti_aiuti": tutti_aiuti
         })
@@ -470,6 +477,93 @@ def cribis_nuova_ricerca():
         }), 500
 
 
+@app.route('/margine', methods=['POST'])
+def margine_deminimis():
+    """
+    Margine de minimis a una data di concessione (oggi o futura) e calendario di
+    liberazione del margine, dal ledger degli aiuti RNA della P.IVA.
+    Body: {partita_iva, data (dd/mm/yyyy, opzionale), importo (opzionale), force_refresh}
+    """
+    data = request.get_json(silent=True) or {}
+    partita_iva = (data.get('partita_iva') or '').strip()
+    if not re.match(r'^\d{11}$', partita_iva):
+        return jsonify({"errore": "C.F. deve essere di 11 cifre", "partita_iva": partita_iva}), 400
+
+    oggi = datetime.now().date()
+    try:
+        data_rif = datetime.strptime(data['data'], '%d/%m/%Y').date() if data.get('data') else oggi
+    except ValueError:
+        return jsonify({"errore": "Data non valida (formato dd/mm/yyyy)"}), 400
+    if data_rif < oggi:
+        # Gli aiuti RNA coprono il triennio che termina oggi: date passate darebbero totali incompleti
+        return jsonify({"errore": "La data deve essere odierna o futura"}), 400
+
+    try:
+        from rna_deminimis_playwright import RNACalculator
+        from deminimis_ledger import LedgerDeMinimis
+        risultato_rna = RNACalculator(headless=True).calcola_deminimis(
+            partita_iva, force_refresh=bool(data.get('force_refresh', False)))
+    except Exception as e:
+        return jsonify({"errore": f"❌ Servizio RNA temporaneamente non disponibile: {str(e)}"}), 503
+    if risultato_rna.get("errore"):
+        return jsonify({"errore": risultato_rna["errore"], "partita_iva": partita_iva}), 500
+
+    ledger = LedgerDeMinimis.da_risultato(risultato_rna)
+    risposta = {
+        "partita_iva": partita_iva,
+        "data_riferimento": data_rif.strftime('%d/%m/%Y'),
+        "totale_nel_triennio": ledger.totale_al(data_rif),
+        "margine_disponibile": ledger.margine_al(data_rif),
+        "soglia_limite": ledger.soglia,
+        "calendario_liberazione": ledger.calendario_liberazione(data_rif),
+        "data_ricerca": risultato_rna.get("data_ricerca"),
+    }
+    if data.get('importo') is not None:
+        try:
+            importo = float(data['importo'])
+        except (TypeError, ValueError):
+            return jsonify({"errore": "Importo non valido"}), 400
+        prima_data = ledger.prima_data_disponibile(importo, data_rif)
+        risposta["importo_richiesto"] = importo
+        risposta["prima_data_disponibile"] = prima_data.strftime('%d/%m/%Y') if prima_data else None
+    return jsonify(risposta)
+
+
+@app.route('/rna_cache/invalida', methods=['POST'])
+def invalida_cache_rna():
+    """Invalida la cache dei risultati RNA per una P.IVA (o tutta, se non indicata)"""
+    data = request.get_json(silent=True) or {}
+    partita_iva = (data.get('partita_iva') or '').strip()
+    try:
+        from rna_cache import get_cache
+        cache = get_cache()
+        if cache is None:
+            return jsonify({"messaggio": "Cache RNA disattivata", "rimossi": 0})
+        rimossi = cache.invalida(partita_iva or None)
+        return jsonify({"partita_iva": partita_iva or None, "rimossi": rimossi})
+    except Exception as e:
+        return jsonify({"errore": f"Errore invalidazione cache: {str(e)}"}), 500
+
+
+@app.route('/cribis_mydocs/indicizza', methods=['POST'])
+def indicizza_mydocs_cribis():
+    """Avvia in background una passata del crawler MyDocs (completa se richiesto)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        from cribis_mydocs_index import get_indice, indicizza_se_libero
+        if get_indice() is None:
+            return jsonify({"messaggio": "Indice MyDocs disattivato"})
+        if lock_calcolo_pmi.locked():
+            return jsonify({"errore": "Calcolo PMI in corso, riprovare più tardi"}), 409
+        # La passata prende lock_calcolo_pmi (non bloccante): mai in parallelo a un calcolo
+        threading.Thread(target=indicizza_se_libero,
+                         kwargs={"lock": lock_calcolo_pmi, "completa": bool(data.get('completa'))},
+                         name="cribis-mydocs-manuale", daemon=True).start()
+        return jsonify({"messaggio": "Indicizzazione MyDocs avviata"}), 202
+    except Exception as e:
+        return jsonify({"errore": f"Errore avvio indicizzazione: {str(e)}"}), 500
+
+
 @app.route('/calcola_dimensione_pmi', methods=['POST'])
 def calcola_dimensione_pmi():
     """
@@ -477,7 +571,8 @@ def calcola_dimensione_pmi():
     
     Input JSON:
         {
-            "partita_iva": "12345678901"
+            "partita_iva": "12345678901",
+            "force_refresh": false          (opzionale: ignora le cache di gruppo e dati finanziari)
         }
     
     Output JSON:
@@ -506,6 +601,7 @@ def calcola_dimensione_pmi():
     try:
         data = request.get_json()
         partita_iva = data.get('partita_iva', '').strip()
+        force_refresh = bool(data.get('force_refresh', False))
         
         # Validazione P.IVA
         if not re.match(r'^\d{11}$', partita_iva):
@@ -559,8 +655,8 @@ def calcola_dimensione_pmi():
             
             calc = calcolatore_pmi_globale
             
-            # Esegui calcolo
-            risultato = calc.calcola_dimensione(partita_iva)
+            # Esegui calcolo (force_refresh: rigenera gruppo e Company Card invece della cache)
+            risultato = calc.calcola_dimensione(partita_iva, force_refresh=force_refresh)
             
             # Verifica se c'è un errore
             if risultato.get("risultato") == "errore":
@@ -671,7 +767,7 @@ def calcola_dimensione_pmi():
 
 
 # ===================== MODALITÀ ASINCRONA (Render-safe) =====================
-def _worker_esegui_calcolo_dimensione(task_id: str, partita_iva: str):
+def _worker_esegui_calcolo_dimensione(task_id: str, partita_iva: str, force_refresh: bool = False):
     """
     Worker in thread separato: esegue il calcolo bloccando il lock Playwright,
     aggiorna lo stato nel jobs_store e rilascia correttamente il lock.
@@ -715,7 +811,7 @@ def _worker_esegui_calcolo_dimensione(task_id: str, partita_iva: str):
 
         _update(progress="Estrazione gruppo societario (Cribis)...")
         # Il metodo interno farà tutto: gruppo + dati + aggregati
-        risultato = calc.calcola_dimensione(partita_iva)
+        risultato = calc.calcola_dimensione(partita_iva, force_refresh=force_refresh)
 
         if risultato.get("risultato") == "errore":
             _update(status="error", error=risultato.get("errore", "Errore durante il calcolo"))
@@ -798,6 +894,7 @@ def pmi_job_start():
     """
     data = request.get_json(silent=True) or {}
     partita_iva = (data.get('partita_iva') or '').strip()
+    force_refresh = bool(data.get('force_refresh', False))
 
     if not re.match(r'^\d{11}$', partita_iva):
         return jsonify({"errore": "P.IVA deve essere di 11 cifre"}), 400
@@ -815,7 +912,7 @@ def pmi_job_start():
     }
 
     # Avvia worker in background
-    t = threading.Thread(target=_worker_esegui_calcolo_dimensione, args=(task_id, partita_iva), daemon=True)
+    t = threading.Thread(target=_worker_esegui_calcolo_dimensione, args=(task_id, partita_iva, force_refresh), daemon=True)
     t.start()
 
     return jsonify({"task_id": task_id, "status": "queued"}), 202
@@ -851,6 +948,21 @@ def download_file(filename):
     downloads_dir = os.path.join(os.getcwd(), 'downloads')
     return send_from_directory(downloads_dir, filename, as_attachment=True)
 
+def avvia_crawler_mydocs():
+    """
+    Crawler MyDocs periodico, solo con CRIBIS_MYDOCS_CRAWLER=1. Ogni passata
+    prende lock_calcolo_pmi senza attendere e si salta se un calcolo è in corso.
+    """
+    try:
+        from cribis_mydocs_index import avvia_indicizzazione_periodica
+        if avvia_indicizzazione_periodica(lock=lock_calcolo_pmi):
+            print("📁 Crawler MyDocs avviato")
+    except Exception as e:
+        print(f"⚠️ Indicizzazione MyDocs non avviata: {e}")
+
+
+avvia_crawler_mydocs()
+
 if __name__ == '__main__':
     import os
     